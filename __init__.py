@@ -1,11 +1,24 @@
 # app/__init__.py
 
-from flask import Flask, render_template
+import click
+from flask import Flask
+from flask.cli import with_appcontext
 from flask_login import LoginManager
 from app.models.models import db, User
 from app.routes.auth import auth_bp
 from app.routes.transport import transport_bp
 from app.routes.voice import voice_bp
+from app.routes.main import main_bp
+from app.stats import rebuild_rollups_command
+from app.instrumentation import init_query_counter
+from app.metrics import init_metrics
+from app.database import configure_database, init_engine_events
+from app.migrations import upgrade_schema, upgrade_db_command
+from app.timetable import generate_timetable_command
+from app.identity import get_identity_cache
+from app.booking import prune_idempotency_keys_command
+from app.holds import expire_holds_command, get_hold_sweeper
+from app.importer import import_data_command
 import os
 
 def create_sample_data():
@@ -66,13 +79,37 @@ def create_sample_data():
     db.session.commit()
     print("Sample data created successfully!")
 
-def create_app():
+def init_db(sample_data=False):
+    created = upgrade_schema()
+    if sample_data:
+        create_sample_data()
+    return created
+
+@click.command('init-db')
+@click.option('--sample-data/--no-sample-data', default=False, help='Also load the demo routes and vehicles')
+@with_appcontext
+def init_db_command(sample_data):
+    """Create or upgrade the schema, optionally with sample data."""
+    created = init_db(sample_data)
+    click.echo('Created: ' + ', '.join(created) if created else 'Schema is up to date')
+
+def create_app(config_object='config.Config'):
     app = Flask(__name__)
 
     # Load configuration (may point to your own config module as needed)
-    app.config.from_object('config.Config')
+    app.config.from_object(config_object)
 
+    configure_database(app)
     db.init_app(app)
+    init_engine_events(app, db)
+    init_query_counter(app, db)
+    init_metrics(app)
+
+    # Started with the worker, not its first hold, so holds left by a
+    # restart or taken on other workers are swept here too
+    if app.config.get('HOLD_SWEEPER', True) and app.config.get('BOOKING_HOLD_SECONDS', 900):
+        with app.app_context():
+            get_hold_sweeper()
 
     login_manager = LoginManager()
     login_manager.init_app(app)
@@ -82,25 +119,25 @@ def create_app():
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return get_identity_cache().load(int(user_id))
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(transport_bp)
     app.register_blueprint(voice_bp)
+    app.register_blueprint(main_bp)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(upgrade_db_command)
+    app.cli.add_command(generate_timetable_command)
+    app.cli.add_command(prune_idempotency_keys_command)
+    app.cli.add_command(expire_holds_command)
+    app.cli.add_command(import_data_command)
 
     # Audio folder setup
     audio_folder = app.config.get('AUDIO_FOLDER', 'static/audio')
     if not os.path.exists(audio_folder):
         os.makedirs(audio_folder)
 
-    # Database (and sample data) creation
-    with app.app_context():
-        db.create_all()
-        create_sample_data()
-
-    # Modern animated index route
-    @app.route('/')
-    def index():
-        return render_template('index.html')
+    # Schema and sample data are bootstrapped with `flask init-db`, not on every worker start
+    app.cli.add_command(init_db_command)
 
     return app
@@ -46,5 +46,5 @@ def login():
 def logout():
     logout_user()
     flash('You have been logged out')
-    # CORRECTED: redirect to home page (index function in __init__.py)
-    return redirect(url_for('index'))
+    # Redirect to the home page (main.index)
+    return redirect(url_for('main.index'))
@@ -0,0 +1,1533 @@
+# benchmarks.py
+#
+# Local performance benchmarks against a throwaway SQLite database.
+# Usage: python benchmarks.py <name> [options]
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from config import Config
+from app import create_app, init_db
+from app.models.models import db, User, Route, Vehicle, Schedule, Booking
+
+
+def make_app(**overrides):
+    db_dir = tempfile.mkdtemp(prefix='transport-bench-')
+
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(db_dir, 'bench.db')
+        TESTING = True
+
+    for key, value in overrides.items():
+        setattr(BenchConfig, key, value)
+    app = create_app(BenchConfig)
+    with app.app_context():
+        init_db(sample_data=True)
+    return app
+
+
+def bench_booking(args):
+    """Hammer one schedule from many threads and check nothing is oversold."""
+    from app.booking import SoldOutError, next_booking_reference, reserve_seats
+
+    app = make_app()
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com', phone='0000000000')
+        user.set_password('bench')
+        route = Route(route_name='Bench A to B', source='A', destination='B',
+                      distance=100, duration=60, fare=100)
+        vehicle = Vehicle(vehicle_number='BENCH0001', vehicle_type='Bus',
+                          capacity=args.capacity, status='Available')
+        db.session.add_all([user, route, vehicle])
+        db.session.commit()
+        schedule = Schedule(vehicle_id=vehicle.id, route_id=route.id,
+                            departure_time=datetime.now(), arrival_time=datetime.now(),
+                            available_seats=args.capacity, status='Scheduled')
+        db.session.add(schedule)
+        db.session.commit()
+        user_id, schedule_id = user.id, schedule.id
+
+    counts = {'booked': 0, 'sold_out': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(args.attempts):
+            with app.app_context():
+                try:
+                    schedule = db.session.get(Schedule, schedule_id)
+                    reserve_seats(schedule, user_id, args.seats, next_booking_reference())
+                    outcome = 'booked'
+                except SoldOutError:
+                    outcome = 'sold_out'
+                except Exception:
+                    db.session.rollback()
+                    outcome = 'errors'
+            with lock:
+                counts[outcome] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        remaining = db.session.get(Schedule, schedule_id).available_seats
+        sold = db.session.query(db.func.coalesce(db.func.sum(Booking.seats_booked), 0)).scalar()
+    oversold = max(0, sold - args.capacity) + max(0, -remaining)
+    attempts = args.threads * args.attempts
+    print(f'threads={args.threads} attempts={attempts} capacity={args.capacity}')
+    print(f'booked={counts["booked"]} sold_out={counts["sold_out"]} errors={counts["errors"]}')
+    print(f'seats_sold={sold} remaining={remaining} oversold={oversold}')
+    print(f'{attempts / elapsed:.0f} attempts/sec, {counts["booked"] / elapsed:.0f} bookings/sec')
+    return 1 if oversold or sold + remaining != args.capacity else 0
+
+
+def bench_route_search(args):
+    """Compare indexed station lookup with the old ILIKE table scan."""
+    import random
+    from sqlalchemy import insert
+    from app.route_index import get_route_index
+
+    rng = random.Random(42)
+    stations = [f'{rng.choice(CITY_PREFIXES)}{rng.choice(CITY_SUFFIXES)} {n}' for n in range(args.stations)]
+    app = make_app()
+    with app.app_context():
+        rows = []
+        for n in range(args.routes):
+            source, destination = rng.sample(stations, 2)
+            rows.append(dict(route_name=f'{source} to {destination}', source=source,
+                             destination=destination, distance=100, duration=60, fare=100))
+        db.session.execute(insert(Route), rows)
+        db.session.commit()
+
+        start = time.perf_counter()
+        index = get_route_index()
+        print(f'routes={args.routes} stations={args.stations} build={time.perf_counter() - start:.2f}s')
+
+        queries = []
+        for _ in range(args.queries):
+            source, destination = rng.sample(stations, 2)
+            queries.append((source[:rng.randint(4, len(source))], destination))
+
+        start = time.perf_counter()
+        for source, destination in queries:
+            index.search(source, destination)
+        indexed = (time.perf_counter() - start) / len(queries)
+
+        scan_queries = queries[:max(1, len(queries) // 100)]
+        start = time.perf_counter()
+        for source, destination in scan_queries:
+            Route.query.filter(
+                Route.source.ilike(f'%{source}%'),
+                Route.destination.ilike(f'%{destination}%')
+            ).all()
+        scanned = (time.perf_counter() - start) / len(scan_queries)
+
+        start = time.perf_counter()
+        typo = stations[0][:3] + stations[0][4:]
+        index.resolve(typo)
+        fuzzy = time.perf_counter() - start
+
+    print(f'index search: {indexed * 1e6:.1f} us/query')
+    print(f'ILIKE scan:   {scanned * 1e6:.1f} us/query')
+    print(f'typo lookup:  {fuzzy * 1e6:.1f} us')
+    return 0
+
+
+def bench_journey(args):
+    """Time earliest-arrival and cheapest queries on a synthetic network."""
+    import random
+    from datetime import timedelta
+    from sqlalchemy import insert
+    from app.journey import get_journey_planner
+    from app.route_index import normalize_station
+
+    rng = random.Random(7)
+    stations = [f'Station {n}' for n in range(args.stations)]
+    app = make_app()
+    with app.app_context():
+        vehicle = Vehicle(vehicle_number='BENCH0001', vehicle_type='Bus', capacity=40, status='Available')
+        db.session.add(vehicle)
+        db.session.commit()
+        route_rows = []
+        for n in range(args.routes):
+            source, destination = rng.sample(stations, 2)
+            route_rows.append(dict(route_name=f'{source} to {destination}', source=source, destination=destination,
+                                   distance=100, duration=rng.randint(60, 480), fare=rng.randint(50, 800)))
+        db.session.execute(insert(Route), route_rows)
+        routes = db.session.query(Route.id, Route.duration).all()
+        base = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        schedule_rows = []
+        for _ in range(args.schedules):
+            route_id, duration = rng.choice(routes)
+            departure = base + timedelta(minutes=rng.randrange(0, 72 * 60, 15))
+            schedule_rows.append(dict(vehicle_id=vehicle.id, route_id=route_id, departure_time=departure,
+                                      arrival_time=departure + timedelta(minutes=duration),
+                                      available_seats=40, status='Scheduled'))
+        db.session.execute(insert(Schedule), schedule_rows)
+        db.session.commit()
+
+        start = time.perf_counter()
+        planner = get_journey_planner()
+        print(f'stations={args.stations} routes={args.routes} connections={len(planner.connections)} '
+              f'build={(time.perf_counter() - start) * 1000:.1f}ms')
+
+        pairs = [[normalize_station(s) for s in rng.sample(stations, 2)] for _ in range(args.queries)]
+        for name, query in (('earliest', planner.earliest_arrival), ('cheapest', planner.cheapest)):
+            found = 0
+            start = time.perf_counter()
+            for source, destination in pairs:
+                found += query({source}, {destination}, base) is not None
+            elapsed = (time.perf_counter() - start) / len(pairs)
+            print(f'{name}: {elapsed * 1000:.2f} ms/query, {found}/{len(pairs)} answered')
+    return 0
+
+
+def bench_stats(args):
+    """Time /api/stats aggregation over a long booking history, with and without rollups."""
+    import random
+    from datetime import timedelta
+    from sqlalchemy import insert
+    from app.models.models import VoiceCommand
+    from app.stats import activity_stats, rebuild_daily_activity
+
+    rng = random.Random(3)
+    app = make_app()
+    with app.app_context():
+        users = [User(username=f'user{n}', email=f'user{n}@example.com', phone='0000000000')
+                 for n in range(args.users)]
+        db.session.add_all(users)
+        db.session.commit()
+        user_ids = [u.id for u in users]
+        now = datetime.now()
+        db.session.execute(insert(Booking), [
+            dict(user_id=rng.choice(user_ids), schedule_id=1, seats_booked=1, total_fare=100,
+                 status='Confirmed', booking_reference=f'B{n:09d}',
+                 booking_time=now - timedelta(minutes=rng.randrange(365 * 24 * 60)))
+            for n in range(args.bookings)
+        ])
+        db.session.execute(insert(VoiceCommand), [
+            dict(user_id=rng.choice(user_ids), command_text='show schedule', response_text='ok',
+                 timestamp=now - timedelta(minutes=rng.randrange(365 * 24 * 60)))
+            for _ in range(args.bookings)
+        ])
+        db.session.commit()
+        start = time.perf_counter()
+        rows = rebuild_daily_activity()
+        print(f'users={args.users} bookings={args.bookings} rollup rows={rows} '
+              f'rebuild={time.perf_counter() - start:.2f}s')
+
+        for rollup in (False, True):
+            app.config['STATS_ROLLUP'] = rollup
+            for days in (7, 30, 90, 365):
+                start = time.perf_counter()
+                for user_id in user_ids[:args.queries]:
+                    activity_stats(user_id, days)
+                elapsed = (time.perf_counter() - start) / min(args.queries, len(user_ids))
+                print(f'rollup={rollup!s:5} days={days:3}: {elapsed * 1000:.2f} ms/request')
+    return 0
+
+
+def recognize_busy(audio_data, language):
+    # Stand-in for a CPU-bound offline recognizer: spin for the requested milliseconds
+    deadline = time.process_time() + int(audio_data) / 1000
+    while time.process_time() < deadline:
+        pass
+    return 'show schedule'
+
+
+def bench_recognition(args):
+    """Measure recognition job throughput as the worker pool grows."""
+    from app.recognition import RECOGNIZERS, RecognitionQueue
+
+    RECOGNIZERS['busy'] = recognize_busy
+    audio = str(args.work_ms).encode()
+    for workers in args.workers:
+        queue = RecognitionQueue(backend='busy', workers=workers, max_pending=args.jobs)
+        # Warm the pool so process start-up is not counted
+        for job in [queue.submit(0, b'0') for _ in range(workers)]:
+            job.future.result()
+        start = time.perf_counter()
+        jobs = [queue.submit(0, audio) for _ in range(args.jobs)]
+        submitted = time.perf_counter() - start
+        for job in jobs:
+            job.future.result()
+        elapsed = time.perf_counter() - start
+        queue.shutdown()
+        print(f'workers={workers:2} jobs={args.jobs} work={args.work_ms}ms: '
+              f'{args.jobs / elapsed:.0f} jobs/sec, submit {submitted / args.jobs * 1e6:.0f} us/job')
+    return 0
+
+
+INTENT_SAMPLES = [
+    ('route', 'route from {s} to {d}'),
+    ('route', 'show me buses from {s} to {d} tomorrow'),
+    ('route', 'is there a train to {d} from {s}'),
+    ('route', 'bus {s} to {d}'),
+    ('schedule', 'show schedule'),
+    ('schedule', 'what is the timetable from {s} to {d} on monday'),
+    ('schedule', 'departure time from {s} to {d} at 6:30'),
+    ('book', 'book {n} tickets from {s} to {d} at 10 am'),
+    ('book', 'reserve a seat from {s} to {d} day after tomorrow'),
+    ('book', 'book ticket'),
+    ('help', 'help'),
+    ('help', 'can you help me please'),
+    ('unknown', 'what is the weather like in {s}'),
+    ('unknown', 'toronto tomorrow'),
+]
+
+
+def bench_intents(args):
+    """Parse labelled synthetic commands (or a database's logged commands) in batch."""
+    import random
+    from collections import Counter, defaultdict
+    from app.intents import get_intent_parser
+    from app.models.models import VoiceCommand
+
+    overrides = {'SQLALCHEMY_DATABASE_URI': args.database} if args.database else {}
+    app = make_app(**overrides)
+    with app.app_context():
+        parser = get_intent_parser()
+        if args.database:
+            texts = [row[0] for row in db.session.query(VoiceCommand.command_text).limit(args.commands)]
+            start = time.perf_counter()
+            parsed = parser.parse_batch(texts)
+            elapsed = time.perf_counter() - start
+            print(f'replayed {len(texts)} logged commands: {len(texts) / elapsed:.0f} commands/sec')
+            for intent, count in Counter(p.intent for p in parsed).most_common():
+                print(f'  {intent:8} {count}')
+            return 0
+
+        rng = random.Random(11)
+        stations = [route.source for route in Route.query.all()] + [route.destination for route in Route.query.all()]
+        samples = []
+        for _ in range(args.commands):
+            intent, template = rng.choice(INTENT_SAMPLES)
+            source, destination = rng.sample(sorted(set(stations)), 2)
+            text = template.format(s=source, d=destination, n=rng.randint(1, 6))
+            expected_stations = (source, destination) if '{s}' in template and '{d}' in template else (None, None)
+            samples.append((intent, expected_stations, text))
+
+        start = time.perf_counter()
+        parsed = parser.parse_batch([text for _, _, text in samples])
+        elapsed = time.perf_counter() - start
+
+    totals, correct = Counter(), defaultdict(int)
+    for (intent, (source, destination), _), result in zip(samples, parsed):
+        totals[intent] += 1
+        if result.intent == intent and (source is None or (result.source, result.destination) == (source, destination)):
+            correct[intent] += 1
+    print(f'{len(samples)} commands: {len(samples) / elapsed:.0f} commands/sec, '
+          f'{elapsed / len(samples) * 1e6:.1f} us/command')
+    for intent in sorted(totals):
+        print(f'  {intent:8} accuracy {correct[intent] / totals[intent]:.1%} ({totals[intent]} samples)')
+    return 0
+
+
+# Upper bounds on SQL statements per page for a user with many bookings;
+# an N+1 lazy load pushes these up with the number of rows shown
+QUERY_BUDGETS = {
+    '/transport/': 8,
+    '/transport/routes': 3,
+    '/transport/my-bookings': 3,
+    '/transport/schedule/1': 4,
+    '/transport/booking/1': 3,
+    '/voice/history': 3,
+    '/api/stats': 4,
+}
+
+
+def bench_query_budget(args):
+    """Fail if any page issues more SQL statements than its budget."""
+    from sqlalchemy import insert
+    from app.models.models import VoiceCommand
+
+    app = make_app(SQL_QUERY_HEADERS=True)
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com', phone='0000000000')
+        user.set_password('bench')
+        db.session.add(user)
+        db.session.commit()
+        schedule_ids = [s.id for s in Schedule.query.all()]
+        db.session.execute(insert(Booking), [
+            dict(user_id=user.id, schedule_id=schedule_ids[n % len(schedule_ids)], seats_booked=1,
+                 total_fare=100, status='Confirmed', booking_reference=f'B{n:09d}')
+            for n in range(args.rows)
+        ])
+        db.session.execute(insert(VoiceCommand), [
+            dict(user_id=user.id, command_text='show schedule', response_text='ok', processing_time=0.1)
+            for _ in range(args.rows)
+        ])
+        db.session.commit()
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'bench', 'password': 'bench'})
+    failures = 0
+    for url, budget in QUERY_BUDGETS.items():
+        response = client.get(url)
+        count = int(response.headers.get('X-Query-Count', 0))
+        status = 'ok' if count <= budget and response.status_code == 200 else 'FAIL'
+        failures += status != 'ok'
+        print(f'{status:4} {url:28} {response.status_code} queries={count:3} budget={budget:3} '
+              f'time={response.headers.get("X-Query-Time")}')
+    return 1 if failures else 0
+
+
+def bench_page_cache(args):
+    """Route list and timetable cost with cold fragments, warm fragments and revalidation."""
+    from datetime import timedelta
+    from app.pagecache import get_fragment_cache
+
+    app = make_app(SQL_QUERY_HEADERS=True)
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com', phone='0000000000')
+        user.set_password('bench')
+        route = Route.query.first()
+        vehicle = Vehicle.query.first()
+        db.session.add(user)
+        db.session.add_all([
+            Schedule(vehicle_id=vehicle.id, route_id=route.id,
+                     departure_time=datetime(2030, 1, 1) + timedelta(hours=n),
+                     arrival_time=datetime(2030, 1, 1) + timedelta(hours=n + 1), available_seats=40, status='Scheduled')
+            for n in range(args.schedules)
+        ])
+        db.session.commit()
+        paths = ['/transport/routes', f'/transport/schedule/{route.id}']
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'bench', 'password': 'bench'})
+    client.get('/')  # consume the login flash, which disables revalidation
+    print(f'{"page":28} {"mode":12} {"status":>6} {"queries":>8} {"ms/request":>11}')
+    for path in paths:
+        etag = client.get(path).headers['ETag']
+        for mode in ('cold', 'fragment', 'revalidate'):
+            headers = {'If-None-Match': etag} if mode == 'revalidate' else {}
+            queries = 0
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                if mode == 'cold':
+                    with app.app_context():
+                        get_fragment_cache().clear()
+                response = client.get(path, headers=headers)
+                queries += int(response.headers.get('X-Query-Count', 0))
+            elapsed = time.perf_counter() - start
+            print(f'{path:28} {mode:12} {response.status_code:6} {queries / args.requests:8.1f} '
+                  f'{elapsed / args.requests * 1000:11.2f}')
+    return 0
+
+
+def full_scans(statement, tables):
+    """Return plan lines showing a full scan of any of `tables`."""
+    engine = db.engine
+    compiled = statement.compile(dialect=engine.dialect, compile_kwargs={'render_postcompile': True})
+    params = compiled.params
+    if compiled.positiontup is not None:
+        params = tuple(params[name] for name in compiled.positiontup)
+    sql = str(compiled)
+    with engine.connect() as conn:
+        if engine.dialect.name == 'sqlite':
+            plan = [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql, params)]
+            return [line for line in plan
+                    if line.startswith('SCAN ') and line.split()[1] in tables]
+        rows = conn.exec_driver_sql('EXPLAIN ' + sql, params).mappings().all()
+        return [f"{row['table']}: type={row['type']}" for row in rows
+                if row['table'] in tables and row['type'] == 'ALL']
+
+
+def bench_explain(args):
+    """Check hot queries use indexes on a large seeded dataset."""
+    import random
+    from datetime import timedelta
+    from sqlalchemy import func, insert, select
+    from app.holds import due_holds
+    from app.models.models import SeatHold, VoiceCommand
+    from app.queries import user_bookings, schedules_with_details
+
+    rng = random.Random(5)
+    overrides = {'SQLALCHEMY_DATABASE_URI': args.database} if args.database else {}
+    app = make_app(**overrides)
+    with app.app_context():
+        users = [User(username=f'explain{n}', email=f'explain{n}@example.com', phone='0')
+                 for n in range(args.users)]
+        db.session.add_all(users)
+        db.session.commit()
+        user_ids = [u.id for u in users]
+        route_ids = [r.id for r in Route.query.all()]
+        vehicle_id = Vehicle.query.first().id
+        now = datetime.now()
+        db.session.execute(insert(Schedule), [
+            dict(vehicle_id=vehicle_id, route_id=rng.choice(route_ids),
+                 departure_time=now + timedelta(minutes=15 * n), arrival_time=now + timedelta(minutes=15 * n + 60),
+                 available_seats=40, status=rng.choice(['Scheduled', 'Scheduled', 'Cancelled']))
+            for n in range(args.rows)
+        ])
+        db.session.execute(insert(Booking), [
+            dict(user_id=rng.choice(user_ids), schedule_id=1, seats_booked=1, total_fare=100,
+                 status='Confirmed', booking_reference=f'E{n:09d}',
+                 booking_time=now - timedelta(minutes=rng.randrange(525600)))
+            for n in range(args.rows)
+        ])
+        db.session.execute(insert(VoiceCommand), [
+            dict(user_id=rng.choice(user_ids), command_text='help', response_text='ok',
+                 timestamp=now - timedelta(minutes=rng.randrange(525600)))
+            for _ in range(args.rows)
+        ])
+        db.session.execute(insert(SeatHold), [
+            dict(booking_id=booking_id, expires_at=now + timedelta(minutes=rng.randrange(-60, 60)))
+            for booking_id in range(1, args.rows + 1, 10)
+        ])
+        db.session.commit()
+        db.session.execute(db.text('ANALYZE'))
+
+        user_id = user_ids[0]
+        hot_queries = {
+            'recent bookings': (user_bookings(user_id).limit(5).statement, {'booking'}),
+            'route timetable': (schedules_with_details().filter_by(route_id=route_ids[0], status='Scheduled')
+                                .order_by(Schedule.departure_time).statement, {'schedule'}),
+            'voice history': (VoiceCommand.query.filter_by(user_id=user_id)
+                              .order_by(VoiceCommand.timestamp.desc()).limit(50).statement, {'voice_command'}),
+            'daily bookings': (select(func.date(Booking.booking_time), func.count())
+                               .where(Booking.user_id == user_id, Booking.booking_time >= now - timedelta(days=30))
+                               .group_by(func.date(Booking.booking_time)), {'booking'}),
+            'voice totals': (select(func.count()).select_from(VoiceCommand)
+                             .where(VoiceCommand.user_id == user_id), {'voice_command'}),
+            'expired holds': (due_holds(now, 500), {'seat_hold', 'booking'}),
+        }
+        failures = 0
+        for name, (statement, tables) in hot_queries.items():
+            scans = full_scans(statement, tables)
+            failures += bool(scans)
+            print(f'{"FAIL" if scans else "ok":4} {name:16} {"; ".join(scans)}')
+    return 1 if failures else 0
+
+
+def bench_timetable(args):
+    """Generate a long recurring timetable for many vehicles."""
+    from datetime import time as clock
+    from sqlalchemy import func
+    from app.timetable import RecurrenceRule, generate_timetable
+
+    app = make_app()
+    with app.app_context():
+        routes = [Route(route_name=f'Route {n}', source=f'Station {n}', destination=f'Station {n + 1}',
+                        distance=100, duration=180, fare=100) for n in range(args.vehicles)]
+        vehicles = [Vehicle(vehicle_number=f'TT{n:06d}', vehicle_type='Bus', capacity=40, status='Available')
+                    for n in range(args.vehicles)]
+        db.session.add_all(routes + vehicles)
+        db.session.commit()
+        daily = RecurrenceRule([clock(6), clock(10), clock(14), clock(18)], 'daily')
+        # Every tenth vehicle is also given an overlapping weekday service to exercise conflict checks
+        clash = RecurrenceRule([clock(11)], 'weekdays')
+        assignments = [(route, vehicle, daily) for route, vehicle in zip(routes, vehicles)]
+        assignments += [(routes[n], vehicles[n], clash) for n in range(0, args.vehicles, 10)]
+        start = datetime.now().date()
+        begin = time.perf_counter()
+        created, conflicts = generate_timetable(assignments, start, args.days)
+        elapsed = time.perf_counter() - begin
+        total = db.session.scalar(db.select(func.count()).select_from(Schedule))
+    print(f'vehicles={args.vehicles} days={args.days}: created={created} conflicts={len(conflicts)} '
+          f'rows={total} in {elapsed:.2f}s ({created / elapsed:.0f} schedules/sec)')
+    return 0
+
+
+STARTUP_PROBE = '''
+import sys, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+app.test_client().get('/')
+served = time.perf_counter()
+print(imported - start, created - imported, served - created,
+      'speech_recognition' in sys.modules or 'pyttsx3' in sys.modules)
+'''
+
+
+def bench_voice_log(args):
+    """Compare per-command commits with the write-behind voice command logger."""
+    from sqlalchemy import func
+    from app.models.models import VoiceCommand, DailyActivity
+    from app.voicelog import VoiceCommandLogger
+
+    app = make_app(STATS_ROLLUP=True)
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com', phone='0000000000')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+        start = time.perf_counter()
+        for n in range(args.commands):
+            db.session.add(VoiceCommand(user_id=user_id, command_text=f'show schedule {n}',
+                                        response_text='ok', processing_time=0.1))
+            db.session.commit()
+        sync = time.perf_counter() - start
+
+    logger = VoiceCommandLogger(app, batch_size=args.batch_size, max_pending=args.commands)
+    start = time.perf_counter()
+    for n in range(args.commands):
+        logger.log(user_id, f'show schedule {n}', 'ok', 0.1)
+    enqueue = time.perf_counter() - start
+    logger.close()
+    drained = time.perf_counter() - start
+
+    with app.app_context():
+        rows = db.session.scalar(db.select(func.count()).select_from(VoiceCommand))
+        rolled_up = db.session.scalar(db.select(func.sum(DailyActivity.voice_commands)))
+    print(f'sync commit   : {sync / args.commands * 1e6:8.1f} us/command')
+    print(f'write-behind  : {enqueue / args.commands * 1e6:8.1f} us/command in request, '
+          f'{drained:.2f}s to drain, {logger.flushes} flushes')
+    print(f'rows={rows} rollup={rolled_up} expected={2 * args.commands}')
+    return 0 if rows == rolled_up == 2 * args.commands else 1
+
+
+def bench_seats(args):
+    """Seat map throughput at large capacities, then concurrent segment bookings through the DB."""
+    import random
+    from datetime import timedelta
+    from app.booking import SoldOutError, next_booking_reference, reserve_seats
+    from app.models.models import RouteStop, SeatAllocation, SeatInventory
+    from app.seatmap import SeatMap
+
+    rng = random.Random(11)
+    for capacity in args.capacities:
+        seat_map = SeatMap(capacity, args.segments)
+        held = []
+        ops = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < 1.0:
+            first = rng.randrange(args.segments)
+            last = rng.randrange(first, args.segments)
+            seats = seat_map.find_free(rng.randint(1, 4), first, last)
+            if seats:
+                seat_map.allocate(seats, first, last)
+                held.append((seats, first, last))
+            if len(held) > capacity // 2 or (not seats and held):
+                seat_map.release(*held.pop(rng.randrange(len(held))))
+            ops += 1
+        elapsed = time.perf_counter() - start
+        print(f'capacity={capacity:5} segments={args.segments}: {ops / elapsed:9.0f} find+allocate/s, '
+              f'{len(seat_map.to_bytes())} bytes persisted')
+
+    app = make_app()
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com', phone='0000000000')
+        stations = [f'Stop {n}' for n in range(args.segments + 1)]
+        route = Route(route_name='Bench line', source=stations[0], destination=stations[-1],
+                      distance=100, duration=600, fare=100)
+        route.stops = [RouteStop(position=n, station=name) for n, name in enumerate(stations[1:-1])]
+        vehicle = Vehicle(vehicle_number='BENCH0001', vehicle_type='Train', capacity=args.capacity,
+                          status='Available')
+        db.session.add_all([user, route, vehicle])
+        db.session.commit()
+        schedule = Schedule(vehicle_id=vehicle.id, route_id=route.id, departure_time=datetime.now(),
+                            arrival_time=datetime.now() + timedelta(hours=10),
+                            available_seats=args.capacity, status='Scheduled')
+        db.session.add(schedule)
+        db.session.commit()
+        user_id, schedule_id = user.id, schedule.id
+
+    counts = {'booked': 0, 'sold_out': 0, 'errors': 0}
+    lock = threading.Lock()
+
+    def worker(seed):
+        thread_rng = random.Random(seed)
+        for _ in range(args.attempts):
+            from_stop = thread_rng.randrange(args.segments)
+            to_stop = thread_rng.randint(from_stop + 1, args.segments)
+            with app.app_context():
+                try:
+                    reserve_seats(db.session.get(Schedule, schedule_id), user_id, thread_rng.randint(1, 4),
+                                  next_booking_reference(), from_stop=from_stop, to_stop=to_stop)
+                    outcome = 'booked'
+                except SoldOutError:
+                    outcome = 'sold_out'
+                except Exception:
+                    db.session.rollback()
+                    outcome = 'errors'
+            with lock:
+                counts[outcome] += 1
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    with app.app_context():
+        taken = [set() for _ in range(args.segments)]
+        clashes = 0
+        for allocation in SeatAllocation.query.all():
+            for segment in range(allocation.first_segment, allocation.last_segment + 1):
+                for seat in allocation.seat_numbers:
+                    clashes += seat in taken[segment]
+                    taken[segment].add(seat)
+        inventory = db.session.get(SeatInventory, schedule_id)
+        stored = SeatMap.from_bytes(inventory.capacity, inventory.segments, inventory.occupancy)
+        mismatched = sum(stored.masks[n] != sum(1 << (seat - 1) for seat in taken[n])
+                         for n in range(args.segments))
+    total = sum(counts.values())
+    print(f'db: capacity={args.capacity} segments={args.segments} threads={args.threads} '
+          f'booked={counts["booked"]} sold_out={counts["sold_out"]} errors={counts["errors"]}')
+    print(f'db: {total / elapsed:.0f} attempts/sec, double-allocated seat-segments={clashes}, '
+          f'seat map rows out of sync={mismatched}')
+    return 0 if clashes == mismatched == counts['errors'] == 0 else 1
+
+
+def bench_holds(args):
+    """Hold, confirm and expire throughput, then how soon the sweeper releases due holds."""
+    import random
+    from datetime import timedelta
+    from app.booking import confirm_booking, next_booking_reference, release_booking, reserve_seats
+    from app.holds import expire_holds
+    from sqlalchemy import func, select
+    from app.models.models import SeatHold
+
+    rng = random.Random(3)
+    app = make_app(BOOKING_HOLD_SECONDS=900, HOLD_SWEEPER=False)
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com', phone='0000000000')
+        route = Route(route_name='Bench A to B', source='A', destination='B',
+                      distance=100, duration=60, fare=100)
+        vehicle = Vehicle(vehicle_number='BENCH0001', vehicle_type='Bus',
+                          capacity=args.capacity, status='Available')
+        db.session.add_all([user, route, vehicle])
+        db.session.commit()
+        schedules = [Schedule(vehicle_id=vehicle.id, route_id=route.id,
+                              departure_time=datetime.now(), arrival_time=datetime.now(),
+                              available_seats=args.capacity, status='Scheduled')
+                     for _ in range(args.schedules)]
+        db.session.add_all(schedules)
+        db.session.commit()
+        user_id, schedule_ids = user.id, [s.id for s in schedules]
+
+        def hold(count):
+            booking_ids = []
+            start = time.perf_counter()
+            for _ in range(count):
+                schedule = db.session.get(Schedule, rng.choice(schedule_ids))
+                booking_ids.append(reserve_seats(schedule, user_id, 1, next_booking_reference()).id)
+            return booking_ids, time.perf_counter() - start
+
+        booking_ids, elapsed = hold(args.holds)
+        print(f'hold:    {args.holds / elapsed:8.0f} bookings/s')
+        paid = booking_ids[::2]
+        start = time.perf_counter()
+        for booking_id in paid:
+            confirm_booking(db.session.get(Booking, booking_id))
+        print(f'confirm: {len(paid) / (time.perf_counter() - start):8.0f} bookings/s')
+
+        start = time.perf_counter()
+        expired = expire_holds(now=datetime.utcnow() + timedelta(days=1))
+        print(f'expire:  {expired / (time.perf_counter() - start):8.0f} bookings/s swept in batches')
+
+        # The same releases one booking at a time, as cancellations do
+        booking_ids, _ = hold(args.holds // 2)
+        start = time.perf_counter()
+        for booking_id in booking_ids:
+            release_booking(db.session.get(Booking, booking_id))
+        print(f'cancel:  {len(booking_ids) / (time.perf_counter() - start):8.0f} bookings/s one at a time')
+
+        held = sum(db.session.get(Schedule, sid).available_seats for sid in schedule_ids)
+        leaked = args.schedules * args.capacity - len(paid) - held
+        print(f'seats leaked or double-freed: {leaked}, holds left: {SeatHold.query.count()}')
+
+    app = make_app(BOOKING_HOLD_SECONDS=1, HOLD_SWEEP_INTERVAL=60)
+    with app.app_context():
+        route_id = Route.query.first().id
+        user = User(username='bench', email='bench@example.com', phone='0000000000')
+        vehicle = Vehicle(vehicle_number='BENCH0001', vehicle_type='Bus',
+                          capacity=args.capacity, status='Available')
+        db.session.add_all([user, vehicle])
+        db.session.commit()
+        schedule = Schedule(vehicle_id=vehicle.id, route_id=route_id, departure_time=datetime.now(),
+                            arrival_time=datetime.now(), available_seats=args.capacity, status='Scheduled')
+        db.session.add(schedule)
+        db.session.commit()
+        for _ in range(min(args.capacity, 100)):
+            reserve_seats(schedule, user.id, 1, next_booking_reference())
+        last_due = db.session.scalar(select(func.max(SeatHold.expires_at)))
+        deadline = time.monotonic() + 10
+        while db.session.scalar(select(func.count()).select_from(SeatHold)) and time.monotonic() < deadline:
+            db.session.rollback()
+            time.sleep(0.01)
+        lag = (datetime.utcnow() - last_due).total_seconds()
+        left = db.session.scalar(select(func.count()).select_from(SeatHold))
+        print(f'sweeper: last hold released {lag * 1000:.0f} ms after it fell due, holds left: {left}')
+    return 0 if leaked == 0 and left == 0 else 1
+
+
+def _write_import_files(directory, fmt, args, rng):
+    """Synthetic vehicles, routes and schedules files; bad_rate of the rows are invalid."""
+    import csv
+    import json
+    from datetime import timedelta
+
+    def rows_for(kind):
+        if kind == 'vehicles':
+            for n in range(args.vehicles):
+                yield {'vehicle_number': f'IMP{n:07d}', 'vehicle_type': 'Bus',
+                       'capacity': 0 if rng.random() < args.bad_rate else rng.choice([25, 40, 50])}
+        elif kind == 'routes':
+            for n in range(args.routes):
+                yield {'route_name': f'Import route {n}', 'source': f'City {n % 97}',
+                       'destination': f'City {(n * 7 + 1) % 97}', 'distance': rng.randint(50, 800),
+                       'duration': rng.randint(60, 600), 'fare': rng.randint(100, 900),
+                       'stops': [f'Stop {n}-{k}' for k in range(2)]}
+        else:
+            base = datetime(2030, 1, 1, 6)
+            for n in range(args.schedules):
+                slot, vehicle = divmod(n, args.vehicles)
+                departure = base + timedelta(hours=12 * slot)
+                yield {'route_name': f'Import route {rng.randrange(args.routes)}',
+                       'vehicle_number': f'IMP{vehicle:07d}',
+                       'departure_time': 'soon' if rng.random() < args.bad_rate else departure.isoformat()}
+
+    paths = {}
+    for kind in ('vehicles', 'routes', 'schedules'):
+        path = paths[kind] = os.path.join(directory, f'{kind}.{fmt}')
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            if fmt == 'jsonl':
+                for row in rows_for(kind):
+                    f.write(json.dumps(row) + '\n')
+            else:
+                writer = None
+                for row in rows_for(kind):
+                    if 'stops' in row:
+                        row['stops'] = ';'.join(row['stops'])
+                    if writer is None:
+                        writer = csv.DictWriter(f, fieldnames=list(row))
+                        writer.writeheader()
+                    writer.writerow(row)
+    return paths
+
+
+def bench_import(args):
+    """Rows/sec for the bulk importer on generated CSV and JSONL files."""
+    import random
+    import resource
+    from app.importer import import_file
+
+    for fmt in args.formats:
+        directory = tempfile.mkdtemp(prefix='transport-import-')
+        paths = _write_import_files(directory, fmt, args, random.Random(9))
+        app = make_app()
+        with app.app_context():
+            for kind in ('vehicles', 'routes', 'schedules'):
+                result = import_file(kind, paths[kind], batch_size=args.batch_size)
+                peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+                print(f'{fmt:5} {kind:9} {result.rows:8} rows  imported={result.imported:8} '
+                      f'rejected={result.rejected:6}  {result.rows / result.seconds:8.0f} rows/s  '
+                      f'max RSS {peak:6.0f} MiB')
+    return 0
+
+
+class _TimedFeed:
+    """Wraps LiveFeed.append to note when each event id was published."""
+
+    def __init__(self, feed):
+        self.feed = feed
+        self.append = feed.append
+        self.sent = {}
+
+    def __call__(self, deltas):
+        self.append(deltas)
+        self.sent[self.feed.last_id] = time.perf_counter()
+
+
+class _QueueBroker:
+    """Stand-in for the redis broker: deltas cross a queue to a relay thread before reaching the feed."""
+
+    def __init__(self):
+        import queue
+
+        self.queue = queue.Queue()
+
+    def publish(self, deltas):
+        self.queue.put(deltas)
+
+    def listen(self, feed, append):
+        def run():
+            while True:
+                append(self.queue.get())
+
+        threading.Thread(target=run, name='bench-broker', daemon=True).start()
+
+
+def _live_subscribers(feed, count, keepalive):
+    """Start `count` threads reading feed.stream(); returns their (event id, received at) lists."""
+    import re
+
+    event_id = re.compile(r'^id: \w+:(\d+)$', re.M)
+    received = [[] for _ in range(count)]
+    ready = threading.Barrier(count + 1)
+
+    def subscribe(log):
+        stream = feed.stream(keepalive=keepalive)
+        next(stream)
+        ready.wait()
+        for chunk in stream:
+            now = time.perf_counter()
+            log.extend((int(n), now) for n in event_id.findall(chunk))
+
+    for log in received:
+        threading.Thread(target=subscribe, args=(log,), daemon=True).start()
+    ready.wait()
+    return received
+
+
+def _drain_fanout(sent, received, timeout=10):
+    """Wait until every stream has seen the last event published."""
+    deadline = time.monotonic() + timeout
+    last = max(sent, default=0)
+    while time.monotonic() < deadline and not all(log and log[-1][0] >= last for log in received):
+        time.sleep(0.05)
+
+
+def _report_fanout(label, sent, received):
+    _drain_fanout(sent, received)
+    deliveries = sorted((at - sent[n]) * 1000 for log in received for n, at in log if n in sent)
+    last = {}
+    for log in received:
+        for n, at in log:
+            if n in sent:
+                last[n] = max(last.get(n, 0), at)
+    fanout = sorted((at - sent[n]) * 1000 for n, at in last.items())
+    expected = len(sent) * len(received)
+    print(f'{label:22} delivered {len(deliveries):8}/{expected:<8} '
+          f'per stream p50 {percentile(deliveries, 50):7.2f} p99 {percentile(deliveries, 99):7.2f} ms  '
+          f'all streams p50 {percentile(fanout, 50):7.2f} p99 {percentile(fanout, 99):7.2f} ms')
+    return len(deliveries) == expected
+
+
+def _rss_mib():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+
+def bench_live(args):
+    """Fan-out latency of live seat deltas to many idle SSE streams, and what idle streams cost."""
+    from app.booking import next_booking_reference, release_booking, reserve_seats
+    from app.live import LiveFeed
+
+    ok = True
+    for broker in args.brokers:
+        feed = LiveFeed(history=args.events + 1, coalesce=args.coalesce)
+        timed = _TimedFeed(feed)
+        if broker == 'queue':
+            feed.broker = _QueueBroker()
+            feed.broker.listen(feed, timed)
+            publish = feed.publish
+        else:
+            publish = timed
+        rss = _rss_mib()
+        received = _live_subscribers(feed, args.subscribers, args.keepalive)
+        grown = _rss_mib() - rss
+
+        # Idle: nothing published, streams only wake for keepalives
+        cpu, wall = time.process_time(), time.perf_counter()
+        time.sleep(args.idle)
+        cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+        print(f'{broker:6} {args.subscribers} idle streams: {cpu / wall * 100:5.1f}% CPU, '
+              f'RSS +{grown:.0f} MiB')
+
+        for n in range(args.events):
+            publish([('seats', {'schedule_id': n, 'route_id': 1, 'available_seats': n, 'status': 'Scheduled'})])
+            time.sleep(args.interval)
+        ok &= _report_fanout(f'{broker} publish', timed.sent, received)
+        feed.close()
+
+    # Real commits: booking and cancelling seats, timed from the commit to each stream
+    app = make_app(BOOKING_HOLD_SECONDS=0, LIVE_COALESCE=args.coalesce)
+    with app.app_context():
+        from app.live import get_live_feed
+
+        feed = get_live_feed()
+        timed = _TimedFeed(feed)
+        feed.append = timed
+        user = User(username='bench', email='bench@example.com', phone='0000000000')
+        db.session.add(user)
+        db.session.commit()
+        schedule = Schedule.query.first()
+        timed.sent.clear()
+        received = _live_subscribers(feed, args.subscribers, args.keepalive)
+        start = time.perf_counter()
+        for _ in range(args.bookings):
+            release_booking(reserve_seats(schedule, user.id, 1, next_booking_reference()))
+        elapsed = time.perf_counter() - start
+        print(f'book + cancel: {args.bookings * 2 / elapsed:6.0f} commits/s with {args.subscribers} streams open')
+        ok &= _report_fanout('commit', timed.sent, received)
+        feed.close()
+    return 0 if ok else 1
+
+
+def _engine_fixture(app, capacity):
+    with app.app_context():
+        user = User(username='bench', email='bench@example.com', phone='0000000000')
+        user.set_password('load')
+        route = Route(route_name='Bench A to B', source='Bench A', destination='Bench B',
+                      distance=100, duration=60, fare=100)
+        vehicle = Vehicle(vehicle_number='BENCH0001', vehicle_type='Bus', capacity=capacity,
+                          status='Available')
+        db.session.add_all([user, route, vehicle])
+        db.session.commit()
+        schedule = Schedule(vehicle_id=vehicle.id, route_id=route.id, departure_time=datetime.now(),
+                            arrival_time=datetime.now(), available_seats=capacity, status='Scheduled')
+        db.session.add(schedule)
+        db.session.commit()
+        return route.id, schedule.id
+
+
+def bench_engines(args):
+    """Concurrent bookings and timetable reads under each engine profile, then replica routing."""
+    import sqlite3
+    from sqlalchemy import event, text
+
+    worst = 0
+    for profile in args.profiles:
+        app = make_app(DB_ENGINE_PROFILE=profile)
+        route_id, schedule_id = _engine_fixture(app, args.capacity)
+        with app.app_context():
+            journal_mode = db.session.execute(text('PRAGMA journal_mode')).scalar()
+        latencies = {'write': [], 'read': []}
+        errors = {'write': 0, 'read': 0}
+        lock = threading.Lock()
+
+        def worker(kind):
+            session = TestClientSession(app, 'bench')
+            for _ in range(args.attempts):
+                start = time.perf_counter()
+                if kind == 'write':
+                    ok = session.request('POST', f'/transport/api/book/{schedule_id}', json={'seats': 1}) == 201
+                else:
+                    ok = session.request('GET', f'/transport/api/schedule/{route_id}') == 200
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies[kind].append(elapsed)
+                    errors[kind] += not ok
+
+        threads = [threading.Thread(target=worker, args=('write',)) for _ in range(args.writers)]
+        threads += [threading.Thread(target=worker, args=('read',)) for _ in range(args.readers)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        total = sum(len(values) for values in latencies.values())
+        p95 = {kind: percentile(sorted(values), 95) * 1000 for kind, values in latencies.items()}
+        print(f'{profile:8} journal={journal_mode:6} {total / elapsed:7.0f} req/s  '
+              f'write p95 {p95["write"]:7.1f} ms  read p95 {p95["read"]:7.1f} ms  '
+              f'errors write={errors["write"]} read={errors["read"]}')
+        worst = max(worst, errors['write'] + errors['read'])
+
+    # Replica routing: copy the primary into a second file and count statements per engine
+    replica_path = os.path.join(tempfile.mkdtemp(prefix='transport-bench-'), 'replica.db')
+    app = make_app(SQLALCHEMY_REPLICA_URI='sqlite:///' + replica_path)
+    route_id, schedule_id = _engine_fixture(app, args.capacity)
+    statements = {}
+    with app.app_context():
+        db.engines['replica'].dispose()
+        source = sqlite3.connect(db.engines[None].url.database)
+        target = sqlite3.connect(replica_path)
+        source.backup(target)
+        source.close()
+        target.close()
+        for bind_key, engine in db.engines.items():
+            counts = statements[bind_key or 'primary'] = {'read': 0, 'write': 0}
+
+            def count(conn, cursor, statement, parameters, context, executemany, counts=counts):
+                counts['read' if statement.lstrip().upper().startswith('SELECT') else 'write'] += 1
+
+            event.listen(engine, 'before_cursor_execute', count)
+    session = TestClientSession(app, 'bench')
+    for _ in range(args.attempts):
+        session.request('GET', f'/transport/api/schedule/{route_id}')
+        session.request('GET', '/voice/api/history')
+        session.request('GET', '/api/stats')
+        session.request('POST', '/transport/search', data={'source': 'Bench A', 'destination': 'Bench B'})
+        session.request('POST', f'/transport/api/book/{schedule_id}', json={'seats': 1})
+    for name, counts in statements.items():
+        print(f'{name:8} selects={counts["read"]:6} writes={counts["write"]:6}')
+    misrouted = statements['replica']['write'] != 0 or statements['replica']['read'] == 0
+    if misrouted:
+        print('FAIL: replica bind saw writes or served no reads')
+    return 1 if worst or misrouted else 0
+
+
+def bench_startup(args):
+    """Measure a cold worker start: imports, create_app and the first request."""
+    import statistics
+    import subprocess
+    import sys
+
+    app = make_app()
+    env = dict(os.environ, DATABASE_URL=app.config['SQLALCHEMY_DATABASE_URI'],
+               PYTHONPATH=os.pathsep.join(filter(None, [
+                   os.path.dirname(os.path.abspath(__file__)), os.environ.get('PYTHONPATH')
+               ])))
+    samples = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, '-c', STARTUP_PROBE],
+                                env=env, capture_output=True, text=True, check=True).stdout.split()
+        samples.append([float(value) for value in output[:3]])
+        voice_loaded = output[3]
+    for i, label in enumerate(('import', 'create_app', 'first request')):
+        print(f'{label:14} median {statistics.median(s[i] for s in samples) * 1000:7.1f} ms')
+    total = statistics.median(sum(s) for s in samples)
+    print(f'{"total":14} median {total * 1000:7.1f} ms over {args.runs} runs, '
+          f'voice engines loaded at startup: {voice_loaded}')
+    return 0
+
+
+CITY_PREFIXES = ['Anan', 'Bhim', 'Chitt', 'Eluru', 'Guntu', 'Kaki', 'Kurno', 'Nello', 'Ongo', 'Raja', 'Sri', 'Tiru']
+CITY_SUFFIXES = ['pur', 'nada', 'avaram', 'patnam', 'gudem', 'palle', 'kota', 'pet', 'halli', 'abad']
+
+
+# Load replay: seed a large dataset, replay a request mix, report latency percentiles
+
+DEFAULT_MIX = [
+    {'name': 'dashboard', 'method': 'GET', 'path': '/transport/', 'weight': 10},
+    {'name': 'routes', 'method': 'GET', 'path': '/transport/routes', 'weight': 5},
+    {'name': 'schedule', 'method': 'GET', 'path': '/transport/schedule/{route_id}', 'weight': 15},
+    {'name': 'schedule api', 'method': 'GET', 'path': '/transport/api/schedule/{route_id}', 'weight': 10},
+    {'name': 'search', 'method': 'POST', 'path': '/transport/search',
+     'data': {'source': '{source}', 'destination': '{destination}'}, 'weight': 15},
+    {'name': 'my bookings', 'method': 'GET', 'path': '/transport/my-bookings', 'weight': 10},
+    {'name': 'bookings api', 'method': 'GET', 'path': '/transport/api/bookings', 'weight': 5},
+    {'name': 'book', 'method': 'POST', 'path': '/transport/api/book/{schedule_id}',
+     'json': {'seats': 1}, 'headers': {'Idempotency-Key': '{uuid}'}, 'weight': 5},
+    {'name': 'stats api', 'method': 'GET', 'path': '/api/stats', 'weight': 10},
+    {'name': 'voice history', 'method': 'GET', 'path': '/voice/history', 'weight': 5},
+    {'name': 'voice history api', 'method': 'GET', 'path': '/voice/api/history', 'weight': 5},
+]
+
+
+def seed_dataset(app, args, rng):
+    """Bulk-load users, routes, vehicles, schedules, bookings and voice commands."""
+    from datetime import timedelta
+    from sqlalchemy import insert
+    from app.models.models import VoiceCommand
+
+    with app.app_context():
+        template = User()
+        template.set_password('load')
+        now = datetime.now().replace(second=0, microsecond=0)
+        db.session.execute(insert(User), [
+            dict(username=f'load{n}', email=f'load{n}@example.com', phone='0000000000',
+                 password_hash=template.password_hash, registration_date=now)
+            for n in range(args.users)
+        ])
+        stations = [f'{rng.choice(CITY_PREFIXES)}{rng.choice(CITY_SUFFIXES)} {n}' for n in range(args.routes)]
+        route_rows = []
+        for n in range(args.routes):
+            source, destination = rng.sample(stations, 2)
+            route_rows.append(dict(route_name=f'{source} to {destination}', source=source, destination=destination,
+                                   distance=rng.randint(50, 900), duration=rng.randint(60, 720),
+                                   fare=rng.randint(50, 1500)))
+        db.session.execute(insert(Route), route_rows)
+        db.session.execute(insert(Vehicle), [
+            dict(vehicle_number=f'LOAD{n:05d}', vehicle_type='Bus', capacity=40, status='Available')
+            for n in range(max(1, args.routes // 2))
+        ])
+        user_ids = [row.id for row in db.session.query(User.id).filter(User.username.like('load%'))]
+        routes = db.session.query(Route.id, Route.source, Route.destination, Route.duration).all()
+        vehicle_ids = [row.id for row in db.session.query(Vehicle.id)]
+        schedule_rows = []
+        for _ in range(args.schedules):
+            route = rng.choice(routes)
+            departure = now + timedelta(minutes=rng.randrange(-7 * 24 * 60, 14 * 24 * 60, 15))
+            schedule_rows.append(dict(vehicle_id=rng.choice(vehicle_ids), route_id=route.id,
+                                      departure_time=departure,
+                                      arrival_time=departure + timedelta(minutes=route.duration),
+                                      available_seats=40, status='Scheduled'))
+        db.session.execute(insert(Schedule), schedule_rows)
+        schedule_ids = [row.id for row in db.session.query(Schedule.id)]
+        db.session.execute(insert(Booking), [
+            dict(user_id=rng.choice(user_ids), schedule_id=rng.choice(schedule_ids), seats_booked=1,
+                 total_fare=100, status='Confirmed', booking_reference=f'L{n:012d}',
+                 booking_time=now - timedelta(minutes=rng.randrange(90 * 24 * 60)))
+            for n in range(args.bookings)
+        ])
+        db.session.execute(insert(VoiceCommand), [
+            dict(user_id=rng.choice(user_ids), command_text='show schedule', response_text='ok',
+                 processing_time=0.1, timestamp=now - timedelta(minutes=rng.randrange(90 * 24 * 60)))
+            for _ in range(args.voice_commands)
+        ])
+        db.session.commit()
+    return {
+        'usernames': [f'load{n}' for n in range(args.users)],
+        'routes': [(route.id, route.source, route.destination) for route in routes],
+        'schedule_ids': schedule_ids,
+    }
+
+
+def load_mix(path):
+    """Read the request mix, writing the default one first if the file is missing."""
+    import json
+
+    if not os.path.exists(path):
+        with open(path, 'w') as f:
+            for entry in DEFAULT_MIX:
+                f.write(json.dumps(entry) + '\n')
+        print(f'wrote default request mix to {path}')
+    mix = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entry = json.loads(line)
+                if 'path' in entry:
+                    entry.setdefault('method', 'GET')
+                    entry.setdefault('name', f"{entry['method']} {entry['path']}")
+                    mix.append(entry)
+    if not mix:
+        raise SystemExit(f'{path} has no entries with a "path"')
+    return mix
+
+
+def _fill(value, context):
+    if isinstance(value, str):
+        return value.format_map(context)
+    if isinstance(value, dict):
+        return {k: _fill(v, context) for k, v in value.items()}
+    return value
+
+
+class TestClientSession:
+    def __init__(self, app, username):
+        self.client = app.test_client()
+        self.client.post('/auth/login', data={'username': username, 'password': 'load'})
+
+    def request(self, method, path, data=None, json=None, headers=None):
+        try:
+            return self.client.open(path, method=method, data=data, json=json, headers=headers).status_code
+        except Exception:
+            # TESTING propagates view exceptions; count them like a 500 from a real server
+            return 500
+
+
+class HTTPSession:
+    def __init__(self, base_url, username):
+        import http.cookiejar
+        import urllib.request
+
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+        self.request('POST', '/auth/login', data={'username': username, 'password': 'load'})
+
+    def request(self, method, path, data=None, json=None, headers=None):
+        import json as jsonlib
+        import urllib.error
+        import urllib.parse
+        import urllib.request
+
+        headers = dict(headers or {})
+        body = None
+        if json is not None:
+            body = jsonlib.dumps(json).encode()
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+        except OSError:
+            return 0
+
+
+def percentile(sorted_values, pct):
+    import math
+
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(samples, elapsed):
+    """Per-endpoint latency percentiles (ms) and throughput from (name, seconds, status) samples."""
+    by_name = {}
+    for name, seconds, status in samples:
+        by_name.setdefault(name, []).append((seconds, status))
+    by_name['TOTAL'] = [(seconds, status) for _, seconds, status in samples]
+    report = {}
+    for name, entries in by_name.items():
+        latencies = sorted(seconds * 1000 for seconds, _ in entries)
+        report[name] = {
+            'count': len(entries),
+            'errors': sum(1 for _, status in entries if status == 0 or status >= 500),
+            'p50': round(percentile(latencies, 50), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'rps': round(len(entries) / elapsed, 2) if elapsed else 0.0,
+        }
+    return report
+
+
+def compare_baseline(report, baseline, tolerance, min_samples):
+    """Print p95/throughput changes against `baseline`; return the endpoints that regressed.
+
+    Only endpoints with at least `min_samples` requests can fail the run;
+    tail latency over a few dozen requests is mostly scheduling noise.
+    """
+    regressed = []
+    print(f'\n{"vs baseline":24} {"p95 ms":>17} {"change":>8} {"req/s":>17} {"change":>8}')
+    for name, current in sorted(report.items(), key=lambda item: (item[0] == 'TOTAL', item[0])):
+        before = baseline.get(name)
+        if before is None:
+            print(f'{name:24} (not in baseline)')
+            continue
+        p95_change = (current['p95'] - before['p95']) / before['p95'] if before['p95'] else 0.0
+        rps_change = (current['rps'] - before['rps']) / before['rps'] if before['rps'] else 0.0
+        flag = ''
+        if p95_change > tolerance:
+            if current['count'] >= min_samples:
+                regressed.append(name)
+                flag = '  REGRESSED'
+            else:
+                flag = '  slower (too few samples to fail)'
+        print(f'{name:24} {before["p95"]:7.1f} -> {current["p95"]:7.1f} {p95_change:+8.0%} '
+              f'{before["rps"]:7.1f} -> {current["rps"]:7.1f} {rps_change:+8.0%}{flag}')
+    return regressed
+
+
+def bench_replay(args):
+    """Seed a large dataset and replay a request mix with concurrent clients."""
+    import json
+    import random
+    import uuid
+
+    rng = random.Random(args.seed)
+    if args.url:
+        if not args.database:
+            raise SystemExit('--url needs --database pointing at the server\'s database so it can be seeded')
+        app = make_app(SQLALCHEMY_DATABASE_URI=args.database)
+    else:
+        app = make_app(SQLALCHEMY_DATABASE_URI=args.database) if args.database else make_app()
+    start = time.perf_counter()
+    dataset = seed_dataset(app, args, rng)
+    print(f'seeded users={args.users} routes={args.routes} schedules={args.schedules} '
+          f'bookings={args.bookings} voice_commands={args.voice_commands} '
+          f'in {time.perf_counter() - start:.1f}s')
+
+    mix = load_mix(args.mix)
+    weights = [entry.get('weight', 1) for entry in mix]
+    per_thread = max(1, args.requests // args.threads)
+    samples = []
+    lock = threading.Lock()
+    ready = threading.Barrier(args.threads + 1)
+
+    def worker(index):
+        thread_rng = random.Random(args.seed * 1000 + index)
+        username = dataset['usernames'][index % len(dataset['usernames'])]
+        session = HTTPSession(args.url, username) if args.url else TestClientSession(app, username)
+        if args.sequential:
+            plan = [mix[(index * per_thread + n) % len(mix)] for n in range(args.warmup + per_thread)]
+        else:
+            plan = thread_rng.choices(mix, weights=weights, k=args.warmup + per_thread)
+        local = []
+        ready.wait()
+        for n, entry in enumerate(plan):
+            route_id, source, destination = thread_rng.choice(dataset['routes'])
+            context = {'route_id': route_id, 'source': source, 'destination': destination,
+                       'schedule_id': thread_rng.choice(dataset['schedule_ids']), 'uuid': uuid.uuid4().hex}
+            path = _fill(entry['path'], context)
+            request_start = time.perf_counter()
+            status = session.request(entry['method'], path, data=_fill(entry.get('data'), context),
+                                     json=_fill(entry.get('json'), context),
+                                     headers=_fill(entry.get('headers'), context))
+            if n >= args.warmup:
+                local.append((entry['name'], time.perf_counter() - request_start, status))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for t in threads:
+        t.start()
+    ready.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    report = summarize(samples, elapsed)
+    target = args.url or 'test client'
+    print(f'\n{len(samples)} requests over {args.threads} threads against {target} in {elapsed:.1f}s '
+          f'(after {args.warmup} warm-up requests per thread)')
+    print(f'{"endpoint":24} {"count":>6} {"errors":>6} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"req/s":>8}')
+    for name, row in sorted(report.items(), key=lambda item: (item[0] == 'TOTAL', item[0])):
+        print(f'{name:24} {row["count"]:6} {row["errors"]:6} {row["p50"]:8.1f} {row["p95"]:8.1f} '
+              f'{row["p99"]:8.1f} {row["rps"]:8.1f}')
+
+    params = {key: getattr(args, key) for key in
+              ('users', 'routes', 'schedules', 'bookings', 'voice_commands', 'requests', 'threads', 'seed')}
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'params': params, 'endpoints': report}, f, indent=2, sort_keys=True)
+        print(f'\nsaved baseline to {args.baseline}')
+        return 0
+    errors = report['TOTAL']['errors']
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('params') != params:
+            print(f'\nnote: baseline was recorded with {baseline.get("params")}')
+        if compare_baseline(report, baseline['endpoints'], args.tolerance, args.min_samples):
+            return 1
+    return 1 if errors else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Transport app benchmarks')
+    sub = parser.add_subparsers(dest='name', required=True)
+
+    p = sub.add_parser('booking', help='concurrent seat booking stress test')
+    p.add_argument('--threads', type=int, default=16)
+    p.add_argument('--attempts', type=int, default=50)
+    p.add_argument('--capacity', type=int, default=500)
+    p.add_argument('--seats', type=int, default=1)
+    p.set_defaults(func=bench_booking)
+
+    p = sub.add_parser('route-search', help='indexed station lookup vs ILIKE scan')
+    p.add_argument('--routes', type=int, default=100000)
+    p.add_argument('--stations', type=int, default=2000)
+    p.add_argument('--queries', type=int, default=2000)
+    p.set_defaults(func=bench_route_search)
+
+    p = sub.add_parser('journey', help='connection-scan journey planner')
+    p.add_argument('--stations', type=int, default=200)
+    p.add_argument('--routes', type=int, default=1000)
+    p.add_argument('--schedules', type=int, default=5000)
+    p.add_argument('--queries', type=int, default=500)
+    p.set_defaults(func=bench_journey)
+
+    p = sub.add_parser('stats', help='/api/stats aggregation with and without rollups')
+    p.add_argument('--users', type=int, default=50)
+    p.add_argument('--bookings', type=int, default=200000)
+    p.add_argument('--queries', type=int, default=50)
+    p.set_defaults(func=bench_stats)
+
+    p = sub.add_parser('recognition', help='voice recognition worker pool throughput')
+    p.add_argument('--jobs', type=int, default=200)
+    p.add_argument('--work-ms', type=int, default=20)
+    p.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    p.set_defaults(func=bench_recognition)
+
+    p = sub.add_parser('intents', help='voice intent parser throughput and accuracy')
+    p.add_argument('--commands', type=int, default=20000)
+    p.add_argument('--database', help='replay VoiceCommand rows from this database URI instead')
+    p.set_defaults(func=bench_intents)
+
+    p = sub.add_parser('query-budget', help='check SQL statements per page against budgets')
+    p.add_argument('--rows', type=int, default=200)
+    p.set_defaults(func=bench_query_budget)
+
+    p = sub.add_parser('page-cache', help='route list and timetable with cold/warm fragments and 304 revalidation')
+    p.add_argument('--schedules', type=int, default=20)
+    p.add_argument('--requests', type=int, default=200)
+    p.set_defaults(func=bench_page_cache)
+
+    p = sub.add_parser('explain', help='fail if hot queries fall back to full table scans')
+    p.add_argument('--users', type=int, default=200)
+    p.add_argument('--rows', type=int, default=100000)
+    p.add_argument('--database', help='run against this database URI instead of scratch SQLite')
+    p.set_defaults(func=bench_explain)
+
+    p = sub.add_parser('timetable', help='bulk recurring timetable generation')
+    p.add_argument('--vehicles', type=int, default=300)
+    p.add_argument('--days', type=int, default=90)
+    p.set_defaults(func=bench_timetable)
+
+    p = sub.add_parser('voice-log', help='per-command commits vs write-behind voice logging')
+    p.add_argument('--commands', type=int, default=5000)
+    p.add_argument('--batch-size', type=int, default=100)
+    p.set_defaults(func=bench_voice_log)
+
+    p = sub.add_parser('seats', help='seat map allocation speed and concurrent segment bookings')
+    p.add_argument('--capacities', type=int, nargs='+', default=[50, 500, 5000])
+    p.add_argument('--segments', type=int, default=8)
+    p.add_argument('--capacity', type=int, default=500, help='seats on the schedule booked through the DB')
+    p.add_argument('--threads', type=int, default=8)
+    p.add_argument('--attempts', type=int, default=100)
+    p.set_defaults(func=bench_seats)
+
+    p = sub.add_parser('holds', help='seat hold, confirm and expiry throughput and sweeper lag')
+    p.add_argument('--schedules', type=int, default=20)
+    p.add_argument('--capacity', type=int, default=200)
+    p.add_argument('--holds', type=int, default=2000)
+    p.set_defaults(func=bench_holds)
+
+    p = sub.add_parser('import', help='bulk CSV/JSONL import rate in rows/sec')
+    p.add_argument('--formats', nargs='+', choices=['csv', 'jsonl'], default=['csv', 'jsonl'])
+    p.add_argument('--vehicles', type=int, default=2000)
+    p.add_argument('--routes', type=int, default=5000)
+    p.add_argument('--schedules', type=int, default=50000)
+    p.add_argument('--batch-size', type=int, default=1000)
+    p.add_argument('--bad-rate', type=float, default=0.01, help='fraction of generated rows that are invalid')
+    p.set_defaults(func=bench_import)
+
+    p = sub.add_parser('live', help='live seat feed fan-out latency and idle stream cost')
+    p.add_argument('--subscribers', type=int, default=1000)
+    p.add_argument('--events', type=int, default=100)
+    p.add_argument('--interval', type=float, default=0.05, help='seconds between published deltas')
+    p.add_argument('--keepalive', type=float, default=15)
+    p.add_argument('--coalesce', type=float, default=0.1, help='seconds between stream wakeups')
+    p.add_argument('--idle', type=float, default=3, help='seconds to measure idle CPU for')
+    p.add_argument('--bookings', type=int, default=100)
+    p.add_argument('--brokers', nargs='+', choices=['none', 'queue'], default=['none', 'queue'])
+    p.set_defaults(func=bench_live)
+
+    p = sub.add_parser('engines', help='engine profiles under concurrent bookings and reads, plus replica routing')
+    p.add_argument('--profiles', nargs='+', default=['default', 'sqlite'])
+    p.add_argument('--capacity', type=int, default=100000)
+    p.add_argument('--writers', type=int, default=4)
+    p.add_argument('--readers', type=int, default=8)
+    p.add_argument('--attempts', type=int, default=100, help='requests per thread')
+    p.set_defaults(func=bench_engines)
+
+    p = sub.add_parser('startup', help='cold worker start-up time')
+    p.add_argument('--runs', type=int, default=10)
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser('replay', help='seed a large dataset and replay a request mix with latency percentiles')
+    p.add_argument('--mix', default='load_mix.jsonl', help='request mix, one JSON object per line')
+    p.add_argument('--baseline', default='load_baseline.json')
+    p.add_argument('--save-baseline', action='store_true', help='write this run as the new baseline')
+    p.add_argument('--tolerance', type=float, default=0.25, help='allowed p95 slowdown before failing')
+    p.add_argument('--min-samples', type=int, default=200, help='fewest requests an endpoint needs to fail the run')
+    p.add_argument('--url', help='replay against a running server instead of the test client')
+    p.add_argument('--database', help='database URI to seed (required with --url)')
+    p.add_argument('--requests', type=int, default=2000)
+    p.add_argument('--threads', type=int, default=8)
+    p.add_argument('--warmup', type=int, default=20, help='unrecorded requests per thread')
+    p.add_argument('--sequential', action='store_true', help='replay the mix in file order instead of by weight')
+    p.add_argument('--users', type=int, default=200)
+    p.add_argument('--routes', type=int, default=300)
+    p.add_argument('--schedules', type=int, default=10000)
+    p.add_argument('--bookings', type=int, default=50000)
+    p.add_argument('--voice-commands', type=int, default=20000)
+    p.add_argument('--seed', type=int, default=1)
+    p.set_defaults(func=bench_replay)
+
+    args = parser.parse_args()
+    raise SystemExit(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
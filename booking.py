@@ -0,0 +1,489 @@
+# app/booking.py
+
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from app.models.models import db, Schedule, Vehicle, Booking, BookingNode, IdempotencyKey, SeatInventory, \
+    SeatAllocation, SeatHold
+from app.seatmap import SeatMap
+from app.pagecache import touch_schedule
+
+
+class BookingError(Exception):
+    pass
+
+
+class SoldOutError(BookingError):
+    def __init__(self, available):
+        self.available = available
+        if available:
+            super().__init__(f'Only {available} seats available')
+        else:
+            super().__init__('Sold out')
+
+
+class IdempotencyKeyReused(BookingError):
+    def __init__(self):
+        super().__init__('Idempotency key was already used for a different booking request')
+
+
+class HoldExpiredError(BookingError):
+    def __init__(self):
+        super().__init__('The seat hold for this booking has expired, please book again')
+
+
+BASE36 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+class BookingReferenceGenerator:
+    """Time/sequence booking references that never collide.
+
+    Each reference packs milliseconds since EPOCH (41 bits), the node id
+    (10 bits) and a per-millisecond sequence (12 bits) into 13 base-36
+    characters. References from one node are strictly increasing, so
+    uniqueness across workers only needs each worker to have its own
+    node id: a fixed one, or a NodeLease that can change while the
+    generator runs.
+    """
+
+    EPOCH = 1704067200000  # 2024-01-01T00:00:00Z
+    NODE_BITS = 10
+    SEQUENCE_BITS = 12
+    WIDTH = 13
+
+    def __init__(self, node_id=None, lease=None):
+        self.node_id = None if node_id is None else node_id % (1 << self.NODE_BITS)
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._sequence = 0
+
+    def _next_value(self):
+        with self._lock:
+            node_id = self.node_id if self.lease is None else self.lease.current()
+            now = int(time.time() * 1000) - self.EPOCH
+            # Never step backwards if the wall clock does
+            now = max(now, self._last_ms)
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) % (1 << self.SEQUENCE_BITS)
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond: borrow the next one
+                    now += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return (now << (self.NODE_BITS + self.SEQUENCE_BITS)) \
+                | (node_id << self.SEQUENCE_BITS) | self._sequence
+
+    def next(self):
+        value = self._next_value()
+        chars = []
+        for _ in range(self.WIDTH):
+            value, digit = divmod(value, 36)
+            chars.append(BASE36[digit])
+        return ''.join(reversed(chars))
+
+
+class NodeLease:
+    """A node id leased for this process from the booking_node table.
+
+    The lease is renewed before a reference is issued once half of it has
+    passed, and another process only takes an id over after it has gone
+    `ttl` seconds without renewal, so no two live processes ever hold the
+    same id. Leasing and renewal use their own connection, outside the
+    booking's transaction.
+    """
+
+    def __init__(self, engine, ttl=600, nodes=1 << BookingReferenceGenerator.NODE_BITS):
+        self.engine = engine
+        self.ttl = ttl
+        self.nodes = nodes
+        self.owner = uuid.uuid4().hex
+        self.node_id = None
+        self._renewed = 0.0
+
+    def current(self):
+        started = time.monotonic()
+        if self.node_id is None or started - self._renewed > self.ttl / 2:
+            if self.node_id is None or not self._renew():
+                self.node_id = self._lease()
+            self._renewed = started
+        return self.node_id
+
+    def _renew(self):
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(BookingNode)
+                .where(BookingNode.node_id == self.node_id, BookingNode.owner == self.owner)
+                .values(renewed_at=datetime.utcnow())
+            )
+        return result.rowcount == 1
+
+    def _lease(self):
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=self.ttl)
+        with self.engine.connect() as conn:
+            rows = dict(conn.execute(select(BookingNode.node_id, BookingNode.renewed_at)).all())
+        free = [node for node in range(self.nodes) if node not in rows]
+        expired = [node for node, renewed_at in rows.items() if renewed_at < stale]
+        # Random order so processes starting together rarely race for the same id
+        random.shuffle(free)
+        random.shuffle(expired)
+        for node_id in free + expired:
+            try:
+                with self.engine.begin() as conn:
+                    if node_id in rows:
+                        claimed = conn.execute(
+                            update(BookingNode)
+                            .where(BookingNode.node_id == node_id, BookingNode.renewed_at < stale)
+                            .values(owner=self.owner, renewed_at=now)
+                        ).rowcount == 1
+                    else:
+                        conn.execute(insert(BookingNode).values(node_id=node_id, owner=self.owner, renewed_at=now))
+                        claimed = True
+            except IntegrityError:
+                claimed = False
+            if claimed:
+                return node_id
+        raise BookingError('No booking node id is free; too many worker processes')
+
+
+_generator_lock = threading.Lock()
+
+
+def next_booking_reference():
+    generator = current_app.extensions.get('booking_references')
+    if generator is None:
+        with _generator_lock:
+            generator = current_app.extensions.get('booking_references')
+            if generator is None:
+                config = current_app.config
+                if config.get('BOOKING_NODE_ID') is not None:
+                    generator = BookingReferenceGenerator(config['BOOKING_NODE_ID'])
+                else:
+                    generator = BookingReferenceGenerator(
+                        lease=NodeLease(db.engine, ttl=config.get('BOOKING_NODE_LEASE', 600))
+                    )
+                current_app.extensions['booking_references'] = generator
+    return generator.next()
+
+
+REFERENCE_ATTEMPTS = 3
+
+
+def _reference_clash(error):
+    return 'booking_reference' in str(error.orig)
+
+
+def segment_range(route, from_stop=None, to_stop=None):
+    """Map stop indexes on `route` (0 = source) to (first, last, total) segments."""
+    segments = len(route.stations) - 1
+    first = 0 if from_stop is None else from_stop
+    last = segments - 1 if to_stop is None else to_stop - 1
+    if not 0 <= first <= last < segments:
+        raise BookingError('Invalid boarding or alighting stop')
+    return first, last, segments
+
+
+def _ensure_inventory(schedule, segments):
+    """Create the schedule's seat map on first use, in the caller's transaction.
+
+    The schedule row is locked before its seats are read, so a release
+    can't change available_seats between that read and the insert.
+    """
+    exists = select(SeatInventory.schedule_id).where(SeatInventory.schedule_id == schedule.id)
+    if db.session.scalar(exists) is not None:
+        return
+    db.session.execute(
+        update(Schedule)
+        .where(Schedule.id == schedule.id)
+        .values(available_seats=Schedule.available_seats)
+        .execution_options(synchronize_session=False)
+    )
+    # Another request may have created it while we waited for the lock
+    if db.session.scalar(exists) is not None:
+        return
+    capacity, available = db.session.execute(
+        select(Vehicle.capacity, Schedule.available_seats)
+        .join(Schedule, Schedule.vehicle_id == Vehicle.id)
+        .where(Schedule.id == schedule.id)
+    ).one()
+    legacy = min(max(capacity - available, 0), capacity)
+    seat_map = SeatMap(capacity, segments)
+    if legacy:
+        seat_map.allocate(range(1, legacy + 1), 0, segments - 1)
+    _insert_inventory({'schedule_id': schedule.id, 'capacity': capacity, 'segments': segments,
+                       'occupancy': seat_map.to_bytes(), 'legacy_seats': legacy, 'version': 0})
+
+
+def _insert_inventory(values):
+    # Not a savepoint: SQLAlchemy runs the before_commit/after_commit hooks
+    # (version bumps, live deltas) when one is released. Snapshot reads
+    # (MySQL's REPEATABLE READ) can miss a row committed while we waited,
+    # so a duplicate is skipped rather than raised.
+    table = SeatInventory.__table__
+    dialect = db.session.connection().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite if dialect == 'sqlite' else postgresql).insert(table).on_conflict_do_nothing(
+            index_elements=['schedule_id']
+        )
+    elif dialect in ('mysql', 'mariadb'):
+        stmt = mysql.insert(table).prefix_with('IGNORE')
+    else:
+        stmt = insert(table)
+    db.session.execute(stmt, values)
+
+
+def _lock_inventory(schedule_id):
+    """Lock the schedule's seat map for this transaction; None if it has none.
+
+    Bumping the version first takes the row (or SQLite database) write
+    lock, so the read that follows sees the latest committed seats.
+    """
+    result = db.session.execute(
+        update(SeatInventory)
+        .where(SeatInventory.schedule_id == schedule_id)
+        .values(version=SeatInventory.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return None
+    capacity, segments, occupancy, legacy = db.session.execute(
+        select(SeatInventory.capacity, SeatInventory.segments, SeatInventory.occupancy, SeatInventory.legacy_seats)
+        .where(SeatInventory.schedule_id == schedule_id)
+    ).one()
+    return SeatMap.from_bytes(capacity, segments, occupancy), legacy
+
+
+def _lock_or_create_inventory(schedule):
+    """Lock the schedule's seat map, creating it first if the schedule has none."""
+    locked = _lock_inventory(schedule.id)
+    if locked is None:
+        _ensure_inventory(schedule, len(schedule.route.stations) - 1)
+        locked = _lock_inventory(schedule.id)
+    return locked
+
+
+def _save_inventory(schedule_id, seat_map, legacy):
+    db.session.execute(
+        update(SeatInventory)
+        .where(SeatInventory.schedule_id == schedule_id)
+        .values(occupancy=seat_map.to_bytes(), legacy_seats=legacy)
+        .execution_options(synchronize_session=False)
+    )
+    # available_seats stays the count bookable for the whole route
+    db.session.execute(
+        update(Schedule)
+        .where(Schedule.id == schedule_id)
+        .values(available_seats=seat_map.free_count())
+        .execution_options(synchronize_session=False)
+    )
+    touch_schedule(db.session, schedule_id)
+
+
+def reserve_seats(schedule, user_id, seats, booking_reference, commit=True, from_stop=None, to_stop=None):
+    """Allocate seat numbers on a schedule and record the booking in one transaction.
+
+    Seats come from the schedule's seat map, locked for the transaction,
+    so two concurrent requests can never both get the last seats. Adjacent
+    seats are preferred. from_stop/to_stop index route.stations and default
+    to the whole route; the fare is charged per segment travelled. With
+    commit=False the booking is only flushed, for callers that write more
+    rows in the same transaction.
+
+    While BOOKING_HOLD_SECONDS is set the booking starts out Held: its
+    seats go back to the schedule unless confirm_booking() pays for it
+    before the hold expires (see app.holds).
+
+    If the reference is already taken (a node id shared by mistake), the
+    whole booking is retried with a fresh one.
+    """
+    for attempt in range(REFERENCE_ATTEMPTS):
+        try:
+            return _reserve_seats(schedule, user_id, seats, booking_reference, commit, from_stop, to_stop)
+        except IntegrityError as e:
+            db.session.rollback()
+            if not _reference_clash(e) or attempt == REFERENCE_ATTEMPTS - 1:
+                raise
+            current_app.logger.warning('Booking reference %s already taken, retrying', booking_reference)
+            booking_reference = next_booking_reference()
+
+
+def _reserve_seats(schedule, user_id, seats, booking_reference, commit, from_stop, to_stop):
+    if seats <= 0:
+        raise BookingError('Invalid number of seats')
+    first, last, segments = segment_range(schedule.route, from_stop, to_stop)
+    _ensure_inventory(schedule, segments)
+    seat_map, legacy = _lock_inventory(schedule.id)
+    if seat_map.segments != segments:
+        db.session.rollback()
+        raise BookingError('Seat map does not match the route stops')
+    numbers = seat_map.find_free(seats, first, last) or seat_map.find_free(seats, first, last, adjacent=False)
+    if numbers is None:
+        available = seat_map.free_count(first, last)
+        db.session.rollback()
+        raise SoldOutError(available)
+    seat_map.allocate(numbers, first, last)
+    _save_inventory(schedule.id, seat_map, legacy)
+    hold_seconds = current_app.config.get('BOOKING_HOLD_SECONDS', 900)
+    booking = Booking(
+        user_id=user_id,
+        schedule_id=schedule.id,
+        seats_booked=seats,
+        total_fare=round(schedule.route.fare * seats * (last - first + 1) / segments, 2),
+        status='Held' if hold_seconds else 'Confirmed',
+        booking_reference=booking_reference
+    )
+    booking.allocation = SeatAllocation(first_segment=first, last_segment=last,
+                                        seats=','.join(str(n) for n in numbers))
+    if hold_seconds:
+        booking.hold = SeatHold(expires_at=datetime.utcnow() + timedelta(seconds=hold_seconds))
+    db.session.add(booking)
+    if commit:
+        db.session.commit()
+    else:
+        db.session.flush()
+    return booking
+
+
+def booking_result(booking):
+    return {
+        'success': True,
+        'booking_id': booking.id,
+        'booking_reference': booking.booking_reference,
+        'schedule_id': booking.schedule_id,
+        'seats_booked': booking.seats_booked,
+        'seat_numbers': booking.allocation.seat_numbers if booking.allocation else [],
+        'total_fare': booking.total_fare,
+        'status': booking.status,
+        'hold_expires_at': booking.hold.expires_at.isoformat() + 'Z' if booking.hold else None
+    }
+
+
+def book_once(schedule, user_id, seats, key, from_stop=None, to_stop=None):
+    """Book seats at most once per (user, idempotency key).
+
+    Returns (status_code, result, replayed). A key seen before replays its
+    stored result instead of booking again; reusing a key for a different
+    schedule or seat count raises IdempotencyKeyReused. Only successful
+    bookings are stored, so a request that failed can be retried with the
+    same key. If two requests with one key race, the loser's seats are
+    rolled back with its transaction and it replays the winner's result.
+    """
+    fingerprint = f'{schedule.id}:{seats}'
+    if from_stop is not None or to_stop is not None:
+        fingerprint += f':{from_stop}-{to_stop}'
+    stored = _stored_result(user_id, key, fingerprint)
+    if stored is not None:
+        return stored
+    booking = reserve_seats(schedule, user_id, seats, next_booking_reference(), commit=False,
+                            from_stop=from_stop, to_stop=to_stop)
+    result = booking_result(booking)
+    db.session.add(IdempotencyKey(user_id=user_id, key=key, request_fingerprint=fingerprint,
+                                  booking_id=booking.id, status_code=201, response=json.dumps(result)))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        stored = _stored_result(user_id, key, fingerprint)
+        if stored is None:
+            raise
+        return stored
+    return 201, result, False
+
+
+def _stored_result(user_id, key, fingerprint):
+    record = IdempotencyKey.query.filter_by(user_id=user_id, key=key).first()
+    if record is None:
+        return None
+    if record.request_fingerprint != fingerprint:
+        raise IdempotencyKeyReused()
+    return record.status_code, json.loads(record.response), True
+
+
+def prune_idempotency_keys(max_age):
+    """Delete stored booking results older than `max_age`; return how many went."""
+    result = db.session.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.created_at < datetime.utcnow() - max_age)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def confirm_booking(booking):
+    """Mark a booking Paid, keeping its seats for good.
+
+    A Held booking can only be paid before its hold expires; after that
+    HoldExpiredError is raised even if the sweeper hasn't released the
+    seats yet. Returns False if the booking was already paid.
+    """
+    live_hold = select(SeatHold.booking_id).where(SeatHold.expires_at > datetime.utcnow())
+    result = db.session.execute(
+        update(Booking)
+        .where(Booking.id == booking.id,
+               or_(Booking.status == 'Confirmed',
+                   and_(Booking.status == 'Held', Booking.id.in_(live_hold))))
+        .values(status='Paid')
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        db.session.rollback()
+        if booking.status == 'Paid':
+            return False
+        if booking.status == 'Cancelled':
+            raise BookingError('Booking is cancelled')
+        raise HoldExpiredError()
+    db.session.execute(delete(SeatHold).where(SeatHold.booking_id == booking.id))
+    db.session.commit()
+    return True
+
+
+def release_booking(booking):
+    """Cancel a booking and give its seats back exactly once.
+
+    Returns False if the booking was already cancelled or its hold has
+    expired, including by a concurrent request that won the race.
+    """
+    result = db.session.execute(
+        update(Booking)
+        .where(Booking.id == booking.id, Booking.status.notin_(('Cancelled', 'Expired')))
+        .values(status='Cancelled')
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        db.session.rollback()
+        return False
+    db.session.execute(delete(SeatHold).where(SeatHold.booking_id == booking.id))
+    # Through the seat map even if the schedule has none yet, so a seat map
+    # created concurrently can't count these seats as still sold
+    seat_map, legacy = _lock_or_create_inventory(booking.schedule)
+    allocation = booking.allocation
+    if allocation is not None:
+        seat_map.release(allocation.seat_numbers, allocation.first_segment, allocation.last_segment)
+    else:
+        # Booked before the seat map existed: hand back the top of the legacy block
+        freed = min(booking.seats_booked, legacy)
+        seat_map.release(range(legacy - freed + 1, legacy + 1), 0, seat_map.segments - 1)
+        legacy -= freed
+    _save_inventory(booking.schedule_id, seat_map, legacy)
+    db.session.commit()
+    return True
+
+
+@click.command('prune-idempotency-keys')
+@click.option('--hours', default=24, show_default=True, help='Keep results newer than this.')
+@with_appcontext
+def prune_idempotency_keys_command(hours):
+    """Delete stored JSON booking results past their retry window."""
+    click.echo(f'Deleted {prune_idempotency_keys(timedelta(hours=hours))} idempotency keys')
+
@@ -7,6 +7,71 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///transport_management.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Engine profile: auto, default, sqlite (WAL + pragmas) or pooled; DB_POOL_* override the pooled sizes
+    DB_ENGINE_PROFILE = os.environ.get('DB_ENGINE_PROFILE', 'auto')
+    DB_POOL_SIZE = int(os.environ['DB_POOL_SIZE']) if os.environ.get('DB_POOL_SIZE') else None
+    DB_MAX_OVERFLOW = int(os.environ['DB_MAX_OVERFLOW']) if os.environ.get('DB_MAX_OVERFLOW') else None
+    DB_POOL_RECYCLE = int(os.environ['DB_POOL_RECYCLE']) if os.environ.get('DB_POOL_RECYCLE') else None
+    DB_POOL_TIMEOUT = int(os.environ['DB_POOL_TIMEOUT']) if os.environ.get('DB_POOL_TIMEOUT') else None
+    # Read-only views (search, timetables, history, stats) read from this replica when set
+    SQLALCHEMY_REPLICA_URI = os.environ.get('DATABASE_REPLICA_URL')
+
+    # Keep per-user daily rollups for /api/stats (run `flask rebuild-rollups` after enabling)
+    STATS_ROLLUP = os.environ.get('STATS_ROLLUP', 'false').lower() == 'true'
+
+    # Speech recognition backend: google (online), sphinx (offline) or stub (tests)
+    RECOGNITION_BACKEND = os.environ.get('RECOGNITION_BACKEND', 'google')
+    RECOGNITION_WORKERS = int(os.environ.get('RECOGNITION_WORKERS', 0)) or None
+
+    # Rendered speech is cached here and evicted least-recently-used past the size limit
+    AUDIO_FOLDER = os.environ.get('AUDIO_FOLDER', 'static/audio')
+    TTS_CACHE_MAX_BYTES = int(os.environ.get('TTS_CACHE_MAX_BYTES', 100 * 1024 * 1024))
+
+    # Logged-in users are served from a per-process cache; set USER_CACHE_URL to share it, and its evictions, via redis
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 300))
+    USER_CACHE_URL = os.environ.get('USER_CACHE_URL')
+
+    # Voice command audit rows are queued and written in batches by a background thread
+    VOICE_LOG_BATCH_SIZE = int(os.environ.get('VOICE_LOG_BATCH_SIZE', 100))
+    VOICE_LOG_FLUSH_SECONDS = float(os.environ.get('VOICE_LOG_FLUSH_SECONDS', 1.0))
+    VOICE_LOG_MAX_PENDING = int(os.environ.get('VOICE_LOG_MAX_PENDING', 10000))
+
+    # Booking references embed a node id (0-1023) unique to each worker process. Workers lease one
+    # from the booking_node table for BOOKING_NODE_LEASE seconds, renewed while they issue references
+    # (host clocks must agree to well within half of it). Set BOOKING_NODE_ID only when every process
+    # gets its own value, e.g. a single-process deployment.
+    BOOKING_NODE_ID = int(os.environ['BOOKING_NODE_ID']) if os.environ.get('BOOKING_NODE_ID') else None
+    BOOKING_NODE_LEASE = int(os.environ.get('BOOKING_NODE_LEASE', 600))
+
+    # New bookings hold their seats this long until paid (0 books straight to Confirmed)
+    BOOKING_HOLD_SECONDS = int(os.environ.get('BOOKING_HOLD_SECONDS', 900))
+    # Expire holds from a background thread; it also sweeps every HOLD_SWEEP_INTERVAL seconds
+    HOLD_SWEEPER = os.environ.get('HOLD_SWEEPER', 'true').lower() == 'true'
+    HOLD_SWEEP_INTERVAL = int(os.environ.get('HOLD_SWEEP_INTERVAL', 60))
+    HOLD_SWEEP_BATCH = int(os.environ.get('HOLD_SWEEP_BATCH', 500))
+
+    # Seat and schedule deltas streamed at /transport/live; LIVE_BROKER_URL (redis) shares them across workers
+    LIVE_FEED = os.environ.get('LIVE_FEED', 'true').lower() == 'true'
+    LIVE_HISTORY = int(os.environ.get('LIVE_HISTORY', 1024))
+    LIVE_KEEPALIVE = int(os.environ.get('LIVE_KEEPALIVE', 15))
+    # Streams are woken at most once per LIVE_COALESCE seconds, with every delta committed since
+    LIVE_COALESCE = float(os.environ.get('LIVE_COALESCE', 0.1))
+    LIVE_BROKER_URL = os.environ.get('LIVE_BROKER_URL')
+
+    # Prometheus-text /metrics; set METRICS_TOKEN to require "Authorization: Bearer <token>"
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # Sample stacks of this fraction of requests; keep those slower than PROFILE_THRESHOLD seconds
+    PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_THRESHOLD = float(os.environ.get('PROFILE_THRESHOLD', 0.5))
+
+    # Rendered route list and timetable fragments, kept until their data changes or the TTL passes
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 1024))
+    FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', 60))
+    # How often each worker checks the shared routes/schedules versions to rebuild its route index and planner
+    SHARED_VERSION_CHECK_SECONDS = float(os.environ.get('SHARED_VERSION_CHECK_SECONDS', 2))
+
     # PayPal Payment Integration
     PAYPAL_CLIENT_ID = os.environ.get('PAYPAL_CLIENT_ID')
     PAYPAL_CLIENT_SECRET = os.environ.get('PAYPAL_CLIENT_SECRET')
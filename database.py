@@ -0,0 +1,143 @@
+# app/database.py
+#
+# Engine profiles (pool sizing, SQLite pragmas) and read-replica routing
+# for db.session. Profiles are picked with DB_ENGINE_PROFILE; "auto" uses
+# "sqlite" for file databases and "pooled" for server databases.
+
+import copy
+from functools import wraps
+
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql import Select
+
+ENGINE_PROFILES = {
+    # SQLAlchemy and driver defaults
+    'default': {'engine_options': {}, 'pragmas': {}},
+    # File SQLite: WAL lets readers run alongside the single writer, and
+    # writers queue on the busy timeout instead of failing with "locked"
+    'sqlite': {
+        'engine_options': {'connect_args': {'timeout': 30}},
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 30000,
+            'cache_size': -16000,
+            'temp_store': 'MEMORY',
+        },
+    },
+    # MySQL/PostgreSQL: bounded pool, connections checked before use and
+    # recycled well inside MySQL's default 8 hour wait_timeout
+    'pooled': {
+        'engine_options': {
+            'pool_size': 10,
+            'max_overflow': 20,
+            'pool_timeout': 30,
+            'pool_recycle': 1800,
+            'pool_pre_ping': True,
+        },
+        'pragmas': {},
+    },
+}
+
+POOL_SETTINGS = {
+    'DB_POOL_SIZE': 'pool_size',
+    'DB_MAX_OVERFLOW': 'max_overflow',
+    'DB_POOL_TIMEOUT': 'pool_timeout',
+    'DB_POOL_RECYCLE': 'pool_recycle',
+}
+
+REPLICA_BIND = 'replica'
+
+
+def _is_file_sqlite(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def resolve_profile(name, uri):
+    if name == 'auto':
+        if make_url(uri).get_backend_name() != 'sqlite':
+            return 'pooled'
+        return 'sqlite' if _is_file_sqlite(uri) else 'default'
+    if name not in ENGINE_PROFILES:
+        raise ValueError(f'Unknown DB_ENGINE_PROFILE: {name}')
+    return name
+
+
+def engine_options(config, uri):
+    """Engine options for `uri` from the profile, DB_POOL_* settings and SQLALCHEMY_ENGINE_OPTIONS."""
+    profile = ENGINE_PROFILES[resolve_profile(config.get('DB_ENGINE_PROFILE', 'auto'), uri)]
+    options = copy.deepcopy(profile['engine_options'])
+    if profile is ENGINE_PROFILES['pooled']:
+        for key, option in POOL_SETTINGS.items():
+            if config.get(key) is not None:
+                options[option] = config[key]
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+def configure_database(app):
+    """Fill in engine options and the replica bind; call before db.init_app."""
+    config = app.config
+    uri = config['SQLALCHEMY_DATABASE_URI']
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(config, uri)
+    replica = config.get('SQLALCHEMY_REPLICA_URI')
+    if replica:
+        binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault(REPLICA_BIND, dict(engine_options(config, replica), url=replica))
+        config['SQLALCHEMY_BINDS'] = binds
+
+
+def _apply_pragmas(pragmas):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+    return on_connect
+
+
+def init_engine_events(app, db):
+    """Run the profile's PRAGMAs on every new connection to a file SQLite engine."""
+    with app.app_context():
+        for engine in db.engines.values():
+            uri = engine.url.render_as_string(hide_password=False)
+            if not _is_file_sqlite(uri):
+                continue
+            pragmas = ENGINE_PROFILES[resolve_profile(app.config.get('DB_ENGINE_PROFILE', 'auto'), uri)]['pragmas']
+            if pragmas:
+                event.listen(engine, 'connect', _apply_pragmas(pragmas))
+
+
+class RoutingSession(Session):
+    """Sends plain SELECTs from @read_replica views to the replica bind.
+
+    Everything else goes to the primary: flushes, INSERT/UPDATE/DELETE,
+    SELECT ... FOR UPDATE, and any read after the session has written, so
+    a request always sees its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._wants_replica(clause):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _wants_replica(self, clause):
+        if not (has_request_context() and g.get('read_replica')):
+            return False
+        if self._flushing or not isinstance(clause, Select) or clause._for_update_arg is not None:
+            self.info['wrote'] = True
+            return False
+        return not self.info.get('wrote') and REPLICA_BIND in self._db.engines
+
+
+def read_replica(view):
+    """Let a read-only view's SELECTs use the replica bind when one is configured."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        g.read_replica = True
+        return view(*args, **kwargs)
+    return wrapped
@@ -0,0 +1,188 @@
+# app/holds.py
+#
+# Expiry of unpaid seat holds. Each Held booking has a SeatHold row with
+# its deadline; expired holds are found through the index on expires_at,
+# never by scanning bookings, and their seats go back in one seat map
+# write per schedule.
+
+import atexit
+import heapq
+import threading
+import time
+from datetime import datetime
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+from sqlalchemy import delete, event, select, update
+from sqlalchemy.orm import Session, object_session
+from app.models.models import db, Booking, Schedule, SeatAllocation, SeatHold
+from app.booking import _lock_or_create_inventory, _save_inventory
+
+
+def _expire_schedule_holds(schedule_id, booking_ids):
+    expired = []
+    for booking_id in booking_ids:
+        # Same order as release_booking (booking row, then seat map) so the two can't deadlock
+        result = db.session.execute(
+            update(Booking)
+            .where(Booking.id == booking_id, Booking.status == 'Held')
+            .values(status='Expired')
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            expired.append(booking_id)
+    if expired:
+        seat_map, legacy = _lock_or_create_inventory(db.session.get(Schedule, schedule_id))
+        for allocation in SeatAllocation.query.filter(SeatAllocation.booking_id.in_(expired)):
+            seat_map.release(allocation.seat_numbers, allocation.first_segment, allocation.last_segment)
+        _save_inventory(schedule_id, seat_map, legacy)
+    # Holds of bookings paid or cancelled in the meantime are dropped too
+    db.session.execute(delete(SeatHold).where(SeatHold.booking_id.in_(booking_ids)))
+    db.session.commit()
+    return len(expired)
+
+
+def due_holds(now, limit):
+    """(booking_id, schedule_id) of the oldest holds due by `now`, read off the expires_at index."""
+    return (select(SeatHold.booking_id, Booking.schedule_id)
+            .join(Booking, Booking.id == SeatHold.booking_id)
+            .where(SeatHold.expires_at <= now)
+            .order_by(SeatHold.expires_at)
+            .limit(limit))
+
+
+def expire_holds(now=None, batch_size=500):
+    """Expire every hold due by `now`; return how many bookings were expired.
+
+    Holds are taken oldest first in batches of batch_size, and each
+    schedule's seats are released under one seat map lock per batch.
+    """
+    now = now or datetime.utcnow()
+    expired = 0
+    while True:
+        due = db.session.execute(due_holds(now, batch_size)).all()
+        by_schedule = {}
+        for booking_id, schedule_id in due:
+            by_schedule.setdefault(schedule_id, []).append(booking_id)
+        for schedule_id, booking_ids in by_schedule.items():
+            expired += _expire_schedule_holds(schedule_id, booking_ids)
+        if len(due) < batch_size:
+            return expired
+
+
+class HoldSweeper:
+    """Background thread that expires seat holds as they fall due.
+
+    Deadlines of holds created by this process go on a heap and the
+    thread sleeps until the earliest one. It also sweeps every `interval`
+    seconds to pick up holds created by other workers or before a restart.
+    """
+
+    def __init__(self, app, interval=60, batch_size=500):
+        self.app = app
+        self.interval = interval
+        self.batch_size = batch_size
+        self.sweeps = 0
+        self.expired = 0
+        self.errors = 0
+        self._heap = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='seat-hold-sweeper', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def schedule(self, expires_at):
+        with self._cond:
+            heapq.heappush(self._heap, expires_at)
+            if self._heap[0] == expires_at:
+                self._cond.notify()
+
+    def _wait(self, last_sweep):
+        with self._cond:
+            while not self._closed:
+                now = datetime.utcnow()
+                timeout = self.interval - (time.monotonic() - last_sweep)
+                if self._heap:
+                    timeout = min(timeout, (self._heap[0] - now).total_seconds())
+                if timeout <= 0:
+                    while self._heap and self._heap[0] <= now:
+                        heapq.heappop(self._heap)
+                    return True
+                self._cond.wait(timeout)
+            return False
+
+    def _run(self):
+        last_sweep = time.monotonic()
+        while self._wait(last_sweep):
+            last_sweep = time.monotonic()
+            self.sweep()
+
+    def sweep(self):
+        with self.app.app_context():
+            try:
+                self.expired += expire_holds(batch_size=self.batch_size)
+            except Exception as e:
+                db.session.rollback()
+                self.errors += 1
+                self.app.logger.error('Seat hold sweep failed: %s', e)
+        self.sweeps += 1
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def stats(self):
+        return {
+            'scheduled': len(self._heap),
+            'sweeps': self.sweeps,
+            'expired': self.expired,
+            'errors': self.errors,
+        }
+
+
+_sweeper_lock = threading.Lock()
+
+
+def get_hold_sweeper():
+    sweeper = current_app.extensions.get('hold_sweeper')
+    if sweeper is None:
+        with _sweeper_lock:
+            sweeper = current_app.extensions.get('hold_sweeper')
+            if sweeper is None:
+                config = current_app.config
+                sweeper = current_app.extensions['hold_sweeper'] = HoldSweeper(
+                    current_app._get_current_object(),
+                    interval=config.get('HOLD_SWEEP_INTERVAL', 60),
+                    batch_size=config.get('HOLD_SWEEP_BATCH', 500),
+                )
+    return sweeper
+
+
+@event.listens_for(SeatHold, 'after_insert')
+def _mark_new_hold(mapper, connection, target):
+    object_session(target).info.setdefault('new_holds', []).append(target.expires_at)
+
+
+@event.listens_for(Session, 'after_commit')
+def _schedule_new_holds(session):
+    deadlines = session.info.pop('new_holds', None)
+    if deadlines and has_app_context() and current_app.config.get('HOLD_SWEEPER', True):
+        sweeper = get_hold_sweeper()
+        for expires_at in deadlines:
+            sweeper.schedule(expires_at)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_new_holds(session):
+    session.info.pop('new_holds', None)
+
+
+@click.command('expire-holds')
+@with_appcontext
+def expire_holds_command():
+    """Release the seats of bookings whose hold has expired."""
+    click.echo(f'Expired {expire_holds()} held bookings')
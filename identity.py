@@ -0,0 +1,186 @@
+# app/identity.py
+
+import json
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app, has_app_context
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from app.cache import LRUCache
+from app.models.models import db, User
+
+USER_FIELDS = ('id', 'username', 'email', 'phone', 'registration_date')
+
+
+class CachedUser(UserMixin):
+    """Read-only snapshot of a User row, enough for current_user in views.
+
+    It is not attached to a session, so relationships like `bookings`
+    are not available; query them by user id instead.
+    """
+
+    def __init__(self, id, username, email, phone, registration_date=None):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.phone = phone
+        self.registration_date = registration_date
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(*(getattr(user, field) for field in USER_FIELDS))
+
+    def to_dict(self):
+        data = {field: getattr(self, field) for field in USER_FIELDS}
+        if data['registration_date'] is not None:
+            data['registration_date'] = data['registration_date'].isoformat()
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        if data.get('registration_date'):
+            data['registration_date'] = datetime.fromisoformat(data['registration_date'])
+        return cls(**data)
+
+
+class RedisUserBackend:
+    """Shared user cache across worker processes (needs the redis package).
+
+    Evictions are also published on `channel`, so every worker drops its
+    local copy at once instead of serving it until the local TTL runs out.
+    """
+
+    def __init__(self, url, ttl, prefix='user:', channel='user:invalidate'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.channel = channel
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        raw = self.client.get(f'{self.prefix}{user_id}')
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return CachedUser.from_dict(json.loads(raw))
+
+    def set(self, user):
+        self.client.set(f'{self.prefix}{user.id}', json.dumps(user.to_dict()), ex=self.ttl)
+
+    def delete(self, user_id):
+        self.client.delete(f'{self.prefix}{user_id}')
+        self.client.publish(self.channel, str(user_id))
+
+    def listen(self, local, logger):
+        """Evict users changed on any worker from the `local` cache, from a daemon thread."""
+        def run():
+            while True:
+                try:
+                    pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(self.channel)
+                    # Evictions published while we weren't subscribed are lost
+                    local.clear()
+                    for message in pubsub.listen():
+                        local.delete(int(message['data']))
+                except Exception as e:
+                    logger.error('User cache invalidation channel lost: %s', e)
+                    time.sleep(1)
+
+        threading.Thread(target=run, name='user-cache-invalidations', daemon=True).start()
+
+
+class UserIdentityCache:
+    """Bounded TTL cache in front of the Flask-Login user loader.
+
+    Lookups try this process's LRU first, then the optional shared
+    backend, and only then the database. Commits that update or delete a
+    user evict it here and in the shared backend, which tells the other
+    processes to evict their local copies too; without a shared backend
+    those expire within the TTL.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300, shared=None):
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.shared = shared
+        self.db_loads = 0
+
+    def load(self, user_id):
+        user = self.local.get(user_id)
+        if user is not None:
+            return user
+        if self.shared is not None:
+            user = self.shared.get(user_id)
+        if user is None:
+            row = db.session.get(User, user_id)
+            self.db_loads += 1
+            if row is None:
+                return None
+            user = CachedUser.from_user(row)
+            if self.shared is not None:
+                self.shared.set(user)
+        self.local.set(user_id, user)
+        return user
+
+    def invalidate(self, user_id):
+        self.local.delete(user_id)
+        if self.shared is not None:
+            self.shared.delete(user_id)
+
+    def stats(self):
+        stats = self.local.stats()
+        stats['db_loads'] = self.db_loads
+        if self.shared is not None:
+            stats['shared_hits'] = self.shared.hits
+            stats['shared_misses'] = self.shared.misses
+        return stats
+
+
+_cache_lock = threading.Lock()
+
+
+def get_identity_cache():
+    cache = current_app.extensions.get('user_cache')
+    if cache is None:
+        with _cache_lock:
+            cache = current_app.extensions.get('user_cache')
+            if cache is None:
+                config = current_app.config
+                ttl = config.get('USER_CACHE_TTL', 300)
+                shared = None
+                if config.get('USER_CACHE_URL'):
+                    shared = RedisUserBackend(config['USER_CACHE_URL'], ttl)
+                cache = current_app.extensions['user_cache'] = UserIdentityCache(
+                    maxsize=config.get('USER_CACHE_SIZE', 10000), ttl=ttl, shared=shared
+                )
+                if shared is not None:
+                    shared.listen(cache.local, current_app.logger)
+    return cache
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _mark_user_changed(mapper, connection, target):
+    object_session(target).info.setdefault('changed_users', set()).add(target.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _evict_changed_users(session):
+    changed = session.info.pop('changed_users', None)
+    if changed and has_app_context():
+        cache = current_app.extensions.get('user_cache')
+        if cache is not None:
+            for user_id in changed:
+                cache.invalidate(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changed_users(session):
+    session.info.pop('changed_users', None)
@@ -0,0 +1,333 @@
+# app/importer.py
+#
+# Bulk import of routes, vehicles and schedules from CSV or JSONL files.
+# Files are read a row at a time and written in batched bulk inserts, so
+# memory stays flat however long the file is. Rows that fail validation
+# are skipped and written to an error report instead of aborting the run.
+
+import csv
+import json
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from app.models.models import db, Route, RouteStop, Vehicle, Schedule
+from app.journey import invalidate_journey_planner
+from app.pagecache import touch
+from app.timetable import VehicleIntervals
+
+KINDS = ('routes', 'vehicles', 'schedules')
+
+ImportResult = namedtuple('ImportResult', 'rows imported rejected seconds')
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(path, fmt=None):
+    """Yield (line number, row dict or None, error or None) from a CSV or JSONL file.
+
+    CSV files need a header row. The format defaults to JSONL for .jsonl
+    and .ndjson files and CSV otherwise.
+    """
+    if fmt is None:
+        fmt = 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                if None in row:
+                    yield reader.line_num, row, 'More fields than the header row'
+                else:
+                    yield reader.line_num, row, None
+        else:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield line_number, None, f'Invalid JSON: {e}'
+                    continue
+                if isinstance(row, dict):
+                    yield line_number, row, None
+                else:
+                    yield line_number, None, 'Expected a JSON object'
+
+
+def _field(row, model, name, optional=False):
+    """`row[name]` converted to the type of model's column; None if blank and nullable or optional."""
+    column = model.__table__.c[name]
+    raw = row.get(name)
+    if isinstance(raw, str):
+        raw = raw.strip()
+    if raw is None or raw == '':
+        if not (optional or column.nullable or column.primary_key):
+            raise RowError(f'{name} is required')
+        return None
+    python_type = column.type.python_type
+    try:
+        if python_type is datetime:
+            value = datetime.fromisoformat(str(raw))
+        elif python_type is int:
+            if isinstance(raw, float) and not raw.is_integer():
+                raise ValueError
+            value = int(raw)
+        elif python_type is float:
+            value = float(raw)
+        else:
+            value = str(raw)
+    except (TypeError, ValueError):
+        raise RowError(f'{name}: {raw!r} is not a valid {python_type.__name__}')
+    length = getattr(column.type, 'length', None)
+    if length and len(value) > length:
+        raise RowError(f'{name} is longer than {length} characters')
+    return value
+
+
+def _positive(name, value):
+    if value is not None and value <= 0:
+        raise RowError(f'{name} must be positive')
+    return value
+
+
+class BulkImporter:
+    """Validate rows of one kind and insert them batch_size at a time.
+
+    Vehicle numbers and route names are the references between files:
+    they are loaded once into in-memory lookups, which grow as rows are
+    imported, so duplicates and unknown references are caught without a
+    query per row. Route names must be unique for that reason. A row the
+    database refuses is taken out of the lookups again.
+    """
+
+    def __init__(self, kind, batch_size=1000, dry_run=False, errors=None):
+        if kind not in KINDS:
+            raise ValueError(f'Unknown import kind: {kind}')
+        self.kind = kind
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.errors = errors
+        self.imported = 0
+        self.rejected = 0
+        self._batch = []
+        if kind == 'routes':
+            self.routes = {name: None for name, in db.session.execute(select(Route.route_name))}
+        elif kind == 'vehicles':
+            self.vehicles = {number: None for number, in db.session.execute(select(Vehicle.vehicle_number))}
+        else:
+            self.routes = {name: (route_id, duration) for name, route_id, duration in db.session.execute(
+                select(Route.route_name, Route.id, Route.duration))}
+            self.vehicles = {number: (vehicle_id, capacity) for number, vehicle_id, capacity in db.session.execute(
+                select(Vehicle.vehicle_number, Vehicle.id, Vehicle.capacity))}
+            self.turnaround = timedelta(minutes=current_app.config.get('MIN_TURNAROUND_MINUTES', 30))
+            self.intervals = VehicleIntervals()
+            self._loaded_vehicles = set()
+
+    def validate(self, row):
+        return getattr(self, f'_{self.kind}_row')(row)
+
+    def _vehicles_row(self, row):
+        values = {name: _field(row, Vehicle, name)
+                  for name in ('vehicle_number', 'vehicle_type', 'capacity', 'status')}
+        _positive('capacity', values['capacity'])
+        values['status'] = values['status'] or 'Available'
+        if values['vehicle_number'] in self.vehicles:
+            raise RowError(f'vehicle_number {values["vehicle_number"]} already exists')
+        self.vehicles[values['vehicle_number']] = None
+        return values
+
+    def _routes_row(self, row):
+        values = {name: _field(row, Route, name)
+                  for name in ('route_name', 'source', 'destination', 'distance', 'duration', 'fare')}
+        for name in ('distance', 'duration'):
+            _positive(name, values[name])
+        if values['fare'] < 0:
+            raise RowError('fare must not be negative')
+        stops = row.get('stops') or []
+        if isinstance(stops, str):
+            stops = stops.split(';')
+        elif not isinstance(stops, list) or not all(isinstance(stop, str) for stop in stops):
+            raise RowError('stops must be a ;-separated string or a list of strings')
+        stops = [stop.strip() for stop in stops if stop.strip()]
+        for stop in stops:
+            _field({'station': stop}, RouteStop, 'station')
+        if values['route_name'] in self.routes:
+            raise RowError(f'route_name {values["route_name"]} already exists')
+        self.routes[values['route_name']] = None
+        values['stops'] = stops
+        return values
+
+    def _schedules_row(self, row):
+        route = self.routes.get(_field(row, Route, 'route_name'))
+        if route is None:
+            raise RowError(f'Unknown route_name {row.get("route_name")!r}')
+        vehicle = self.vehicles.get(_field(row, Vehicle, 'vehicle_number'))
+        if vehicle is None:
+            raise RowError(f'Unknown vehicle_number {row.get("vehicle_number")!r}')
+        (route_id, duration), (vehicle_id, capacity) = route, vehicle
+        departure = _field(row, Schedule, 'departure_time')
+        if row.get('arrival_time'):
+            arrival = _field(row, Schedule, 'arrival_time')
+        else:
+            arrival = departure + timedelta(minutes=duration)
+        if arrival <= departure:
+            raise RowError('arrival_time must be after departure_time')
+        seats = _field(row, Schedule, 'available_seats', optional=True)
+        seats = capacity if seats is None else seats
+        if not 0 <= seats <= capacity:
+            raise RowError(f'available_seats must be between 0 and the vehicle capacity ({capacity})')
+        status = _field(row, Schedule, 'status') or 'Scheduled'
+        if status == 'Scheduled':
+            if vehicle_id not in self._loaded_vehicles:
+                self._load_trips(vehicle_id)
+            if self.intervals.overlaps(vehicle_id, departure, arrival + self.turnaround):
+                raise RowError(f'Vehicle {row.get("vehicle_number")} already has a trip at this time')
+            self.intervals.add(vehicle_id, departure, arrival + self.turnaround)
+        return {'route_id': route_id, 'vehicle_id': vehicle_id, 'departure_time': departure,
+                'arrival_time': arrival, 'available_seats': seats, 'status': status}
+
+    def _forget(self, values):
+        """Undo what validating `values` added to the lookups."""
+        if self.kind == 'vehicles':
+            self.vehicles.pop(values['vehicle_number'], None)
+        elif self.kind == 'routes':
+            self.routes.pop(values['route_name'], None)
+        elif values['status'] == 'Scheduled':
+            self.intervals.remove(values['vehicle_id'], values['departure_time'],
+                                  values['arrival_time'] + self.turnaround)
+
+    def _load_trips(self, vehicle_id):
+        rows = db.session.execute(
+            select(Schedule.departure_time, Schedule.arrival_time)
+            .where(Schedule.vehicle_id == vehicle_id, Schedule.status == 'Scheduled')
+        )
+        for departure, arrival in rows:
+            self.intervals.add(vehicle_id, departure, arrival + self.turnaround)
+        self._loaded_vehicles.add(vehicle_id)
+
+    def add(self, line_number, row):
+        try:
+            values = self.validate(row)
+        except RowError as e:
+            self.reject(line_number, str(e), row)
+            return
+        self._batch.append((line_number, row, values))
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def reject(self, line_number, message, row):
+        self.rejected += 1
+        if self.errors is not None:
+            self.errors.writerow([line_number, message, json.dumps(row, default=str) if row is not None else ''])
+
+    def flush(self):
+        """Write and commit the pending batch.
+
+        A batch the database refuses (e.g. a vehicle number added by
+        someone else meanwhile) is retried row by row to find the culprits.
+        """
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+        if self.dry_run:
+            self.imported += len(batch)
+            return
+        write = getattr(self, f'_write_{self.kind}')
+        try:
+            write([values for _, _, values in batch])
+            db.session.commit()
+            self.imported += len(batch)
+            return
+        except IntegrityError:
+            db.session.rollback()
+        for line_number, row, values in batch:
+            try:
+                write([values])
+                db.session.commit()
+                self.imported += 1
+            except IntegrityError as e:
+                db.session.rollback()
+                self._forget(values)
+                self.reject(line_number, f'Rejected by the database: {e.orig}', row)
+
+    def _write_vehicles(self, batch):
+        db.session.execute(insert(Vehicle), batch)
+
+    def _write_routes(self, batch):
+        db.session.execute(insert(Route), [{k: v for k, v in values.items() if k != 'stops'} for values in batch])
+        ids = dict(db.session.execute(
+            select(Route.route_name, Route.id).where(Route.route_name.in_([values['route_name'] for values in batch]))
+        ).all())
+        stops = [{'route_id': ids[values['route_name']], 'position': position, 'station': station}
+                 for values in batch for position, station in enumerate(values['stops'])]
+        if stops:
+            db.session.execute(insert(RouteStop), stops)
+        touch(db.session, 'routes', *(f'route:{route_id}' for route_id in ids.values()))
+
+    def _write_schedules(self, batch):
+        db.session.execute(insert(Schedule), batch)
+        touch(db.session, 'schedules', *{f'route:{values["route_id"]}' for values in batch})
+
+
+def import_file(kind, path, fmt=None, batch_size=1000, errors=None, dry_run=False):
+    """Import one file; rejected rows go to `errors`, a csv.writer, as (line, error, row).
+
+    Each batch is committed on its own, so an interrupted import keeps
+    the batches written so far.
+    """
+    importer = BulkImporter(kind, batch_size, dry_run, errors)
+    rows = 0
+    start = time.perf_counter()
+    for line_number, row, error in read_rows(path, fmt):
+        rows += 1
+        if error is None:
+            importer.add(line_number, row)
+        else:
+            importer.reject(line_number, error, row)
+    importer.flush()
+    if not dry_run:
+        # This process's copies go now; other workers see the content versions bumped above
+        if kind == 'schedules':
+            invalidate_journey_planner()
+        elif kind == 'routes':
+            current_app.extensions.pop('route_index', None)
+    return ImportResult(rows, importer.imported, importer.rejected, time.perf_counter() - start)
+
+
+@click.command('import-data')
+@click.argument('kind', type=click.Choice(KINDS))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Default: jsonl for .jsonl/.ndjson files, csv otherwise')
+@click.option('--batch-size', default=1000, show_default=True)
+@click.option('--errors', 'errors_path', default=None, help='Error report path (default: PATH.errors.csv)')
+@click.option('--dry-run', is_flag=True, help='Validate the file without writing anything.')
+@with_appcontext
+def import_data_command(kind, path, fmt, batch_size, errors_path, dry_run):
+    """Bulk import routes, vehicles or schedules from a CSV or JSONL file.
+
+    \b
+    routes:    route_name, source, destination, distance, duration, fare[, stops]
+    vehicles:  vehicle_number, vehicle_type, capacity[, status]
+    schedules: route_name, vehicle_number, departure_time[, arrival_time,
+               available_seats, status]
+
+    Stops are ';'-separated in CSV or a list in JSONL; times are ISO 8601.
+    """
+    errors_path = errors_path or path + '.errors.csv'
+    with open(errors_path, 'w', newline='', encoding='utf-8') as report:
+        errors = csv.writer(report)
+        errors.writerow(['line', 'error', 'row'])
+        result = import_file(kind, path, fmt, batch_size, errors, dry_run)
+    rate = result.rows / result.seconds if result.seconds else 0
+    click.echo(f'{"Validated" if dry_run else "Imported"} {result.imported} of {result.rows} {kind} rows '
+               f'in {result.seconds:.1f}s ({rate:.0f} rows/s)')
+    if result.rejected:
+        click.echo(f'Rejected {result.rejected} rows, see {errors_path}')
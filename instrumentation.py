@@ -0,0 +1,45 @@
+# app/instrumentation.py
+
+import time
+
+from flask import g, has_app_context
+from sqlalchemy import event
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # On the statement's own context, so a statement that raises leaves nothing behind
+    context._query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_start
+    if has_app_context():
+        g.sql_queries = g.get('sql_queries', 0) + 1
+        g.sql_time = g.get('sql_time', 0.0) + elapsed
+
+
+def query_stats():
+    """Return (query count, seconds in SQL) for the current app context."""
+    return g.get('sql_queries', 0), g.get('sql_time', 0.0)
+
+
+def init_query_counter(app, db):
+    """Count SQL statements and time per request via engine events.
+
+    With SQL_QUERY_HEADERS (on by default in debug and testing) every
+    response carries X-Query-Count and X-Query-Time headers.
+    """
+    with app.app_context():
+        # The replica bind too, so @read_replica views report their queries
+        for engine in db.engines.values():
+            if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+                event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    if app.config.get('SQL_QUERY_HEADERS', app.debug or app.testing):
+        @app.after_request
+        def add_query_headers(response):
+            count, seconds = query_stats()
+            response.headers['X-Query-Count'] = str(count)
+            response.headers['X-Query-Time'] = f'{seconds * 1000:.2f}ms'
+            return response
@@ -0,0 +1,197 @@
+# app/intents.py
+
+import re
+import threading
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+
+from flask import current_app
+from app.route_index import STATION_ALIASES, get_route_index, normalize_station
+
+ParsedCommand = namedtuple('ParsedCommand', 'intent source destination travel_date travel_time seats text')
+
+# Checked in order, so "book a bus ticket" is still a route query as before
+INTENT_KEYWORDS = [
+    ('route', ('route', 'routes', 'bus', 'buses', 'train', 'trains')),
+    ('schedule', ('schedule', 'schedules', 'timetable', 'time', 'timings', 'departures')),
+    ('book', ('book', 'booking', 'ticket', 'tickets', 'reserve')),
+    ('help', ('help',)),
+]
+
+NUMBER_WORDS = {
+    'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
+    'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10,
+    'a': 1, 'an': 1, 'single': 1,
+}
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+# Words that end a free-text station name when it isn't a known station
+SLOT_BOUNDARIES = {'from', 'to', 'on', 'at', 'for', 'today', 'tomorrow', 'day', 'next',
+                   'this', 'by', 'via', 'in', 'around', 'with'} | set(WEEKDAYS)
+
+_token_re = re.compile(r"[a-z0-9]+(?::[0-9]{2})?")
+_intent_res = [(intent, re.compile(r'\b(?:%s)\b' % '|'.join(words))) for intent, words in INTENT_KEYWORDS]
+_seats_re = re.compile(r'\b(\d+|%s)\s+(?:seats?|tickets?|passengers?|people|persons?|adults?)\b'
+                       % '|'.join(NUMBER_WORDS))
+_time_re = re.compile(r'\b(\d{1,2})(?::(\d{2}))?\s*(am|pm|a\.m\.|p\.m\.)(?![a-z])|\b(\d{1,2}):(\d{2})\b')
+_date_re = re.compile(r'\b(day after tomorrow|tomorrow|today|tonight|(?:next\s+)?(?:%s))\b|\b(\d{1,2})[/-](\d{1,2})(?:[/-](\d{2,4}))?\b'
+                      % '|'.join(WEEKDAYS))
+
+
+class IntentParser:
+    """Classifies voice commands and extracts stations, date, time and seats.
+
+    Stations are matched against a token trie of known station names and
+    aliases, so names are found by whole words ("to" never matches inside
+    "toronto" or "tomorrow") in a single pass over the command.
+    """
+
+    def __init__(self, stations, aliases=STATION_ALIASES):
+        self._trie = {}
+        for station in stations:
+            self._insert(station, station)
+        for alias, station in aliases.items():
+            self._insert(alias, station)
+
+    def _insert(self, name, station):
+        tokens = normalize_station(name).split()
+        if not tokens:
+            return
+        node = self._trie
+        for token in tokens:
+            node = node.setdefault(token, {})
+        node['$'] = station
+
+    def _match_station(self, tokens, start):
+        node, match = self._trie, None
+        for i in range(start, len(tokens)):
+            node = node.get(tokens[i])
+            if node is None:
+                break
+            if '$' in node:
+                match = (node['$'], i + 1)
+        return match
+
+    def _free_text(self, tokens, start):
+        end = start
+        while end < len(tokens) and tokens[end] not in SLOT_BOUNDARIES:
+            end += 1
+        if end == start:
+            return None
+        return ' '.join(tokens[start:end]), end
+
+    def parse(self, text, today=None):
+        text = (text or '').lower().strip()
+        tokens = _token_re.findall(text)
+        intent = 'unknown'
+        for name, pattern in _intent_res:
+            if pattern.search(text):
+                intent = name
+                break
+
+        source = destination = None
+        unmarked = []
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token in ('from', 'to') and i + 1 < len(tokens):
+                match = self._match_station(tokens, i + 1) or self._free_text(tokens, i + 1)
+                if match:
+                    if token == 'from':
+                        source = match[0]
+                    else:
+                        destination = match[0]
+                    i = match[1]
+                    continue
+            match = self._match_station(tokens, i)
+            if match:
+                unmarked.append(match[0])
+                i = match[1]
+                continue
+            i += 1
+        for station in unmarked:
+            if source is None and station != destination:
+                source = station
+            elif destination is None and station != source:
+                destination = station
+
+        return ParsedCommand(
+            intent,
+            source.title() if source else None,
+            destination.title() if destination else None,
+            _parse_date(text, today or datetime.now().date()),
+            _parse_time(text),
+            _parse_seats(text),
+            text
+        )
+
+    def parse_batch(self, texts, today=None):
+        today = today or datetime.now().date()
+        return [self.parse(text, today) for text in texts]
+
+
+def _parse_seats(text):
+    match = _seats_re.search(text)
+    if not match:
+        return None
+    value = match.group(1)
+    return int(value) if value.isdigit() else NUMBER_WORDS[value]
+
+
+def _parse_time(text):
+    match = _time_re.search(text)
+    if not match:
+        if 'tonight' in text or 'evening' in text:
+            return time(18, 0)
+        if 'morning' in text:
+            return time(6, 0)
+        return None
+    if match.group(3):
+        hour, minute = int(match.group(1)), int(match.group(2) or 0)
+        if hour > 12 or minute > 59:
+            return None
+        hour = hour % 12 + (12 if match.group(3).startswith('p') else 0)
+    else:
+        hour, minute = int(match.group(4)), int(match.group(5))
+        if hour > 23 or minute > 59:
+            return None
+    return time(hour, minute)
+
+
+def _parse_date(text, today):
+    match = _date_re.search(text)
+    if not match:
+        return None
+    word = match.group(1)
+    if word:
+        if word in ('today', 'tonight'):
+            return today
+        if word == 'tomorrow':
+            return today + timedelta(days=1)
+        if word == 'day after tomorrow':
+            return today + timedelta(days=2)
+        weekday = WEEKDAYS.index(word.split()[-1])
+        return today + timedelta(days=(weekday - today.weekday() - 1) % 7 + 1)
+    day, month, year = int(match.group(2)), int(match.group(3)), match.group(4)
+    year = int(year) if year else today.year
+    if year < 100:
+        year += 2000
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+_parser_lock = threading.Lock()
+
+
+def get_intent_parser():
+    """Return a parser over the current station names, rebuilt when routes change."""
+    index = get_route_index()
+    cached = current_app.extensions.get('intent_parser')
+    if cached is None or cached[0] != index.version:
+        with _parser_lock:
+            cached = current_app.extensions.get('intent_parser')
+            if cached is None or cached[0] != index.version:
+                cached = current_app.extensions['intent_parser'] = (index.version, IntentParser(index.stations))
+    return cached[1]
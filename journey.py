@@ -0,0 +1,174 @@
+# app/journey.py
+
+import bisect
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from app.models.models import db, Route, Schedule
+from app.route_index import normalize_station
+from app.pagecache import VersionCheck
+
+Connection = namedtuple('Connection', 'departure arrival source destination fare schedule_id route_name')
+Itinerary = namedtuple('Itinerary', 'legs departure arrival fare')
+
+
+class JourneyPlanner:
+    """Connection-scan journey planner over scheduled trips.
+
+    Every scheduled trip is one connection between its route's stations.
+    Connections are kept sorted by departure time so a query only scans
+    the slice between its start time and the search horizon.
+    """
+
+    def __init__(self, connections, min_transfer=timedelta(minutes=15),
+                 horizon=timedelta(hours=48), max_legs=4):
+        self.connections = sorted(connections, key=lambda c: (c.departure, c.arrival))
+        self.departures = [c.departure for c in self.connections]
+        self.min_transfer = min_transfer
+        self.horizon = horizon
+        self.max_legs = max_legs
+        self.built_at = time.monotonic()
+
+    def _window(self, depart_after):
+        start = bisect.bisect_left(self.departures, depart_after)
+        end = bisect.bisect_right(self.departures, depart_after + self.horizon, lo=start)
+        return start, end
+
+    def earliest_arrival(self, origins, destinations, depart_after):
+        """Return the itinerary reaching any destination soonest, or None."""
+        origins, destinations = set(origins), set(destinations)
+        if not origins or not destinations or origins & destinations:
+            return None
+        arrival = dict.fromkeys(origins, depart_after)
+        legs = {station: 0 for station in origins}
+        reached_by = {}
+        best = None
+        start, end = self._window(depart_after)
+        for i in range(start, end):
+            c = self.connections[i]
+            if best is not None and c.departure >= best:
+                break
+            ready = arrival.get(c.source)
+            if ready is None or legs[c.source] >= self.max_legs:
+                continue
+            if c.source not in origins:
+                ready = ready + self.min_transfer
+            if c.departure < ready:
+                continue
+            if c.arrival < arrival.get(c.destination, datetime.max):
+                arrival[c.destination] = c.arrival
+                legs[c.destination] = legs[c.source] + 1
+                reached_by[c.destination] = c
+                if c.destination in destinations and (best is None or c.arrival < best):
+                    best = c.arrival
+        if best is None:
+            return None
+        target = min((s for s in destinations if s in reached_by), key=lambda s: arrival[s])
+        path = []
+        station = target
+        while station not in origins:
+            c = reached_by[station]
+            path.append(c)
+            station = c.source
+        return _itinerary(reversed(path))
+
+    def cheapest(self, origins, destinations, depart_after):
+        """Return the lowest-fare itinerary within the horizon, or None.
+
+        Each station keeps a Pareto set of (arrival, fare, legs) labels, so
+        a cheaper but later arrival, or a dearer one with legs to spare, is
+        still available for onward trips.
+        """
+        origins, destinations = set(origins), set(destinations)
+        if not origins or not destinations or origins & destinations:
+            return None
+        labels = {station: [(depart_after, 0.0, 0, None)] for station in origins}
+        start, end = self._window(depart_after)
+        for i in range(start, end):
+            c = self.connections[i]
+            station_labels = labels.get(c.source)
+            if not station_labels:
+                continue
+            boarding = [label for label in station_labels
+                        if label[2] < self.max_legs
+                        and (label[0] if label[3] is None else label[0] + self.min_transfer) <= c.departure]
+            if not boarding:
+                continue
+            existing = labels.setdefault(c.destination, [])
+            for label in boarding:
+                new = (c.arrival, label[1] + c.fare, label[2] + 1, (c, label))
+                if any(l[0] <= new[0] and l[1] <= new[1] and l[2] <= new[2] for l in existing):
+                    continue
+                existing[:] = [l for l in existing if not (new[0] <= l[0] and new[1] <= l[1] and new[2] <= l[2])]
+                existing.append(new)
+        candidates = [l for s in destinations for l in labels.get(s, ()) if l[3] is not None]
+        if not candidates:
+            return None
+        label = min(candidates, key=lambda l: (l[1], l[0]))
+        path = []
+        while label[3] is not None:
+            c, label = label[3]
+            path.append(c)
+        return _itinerary(reversed(path))
+
+    def plan(self, origins, destinations, depart_after=None):
+        """Return the distinct earliest-arrival and cheapest itineraries."""
+        depart_after = depart_after or datetime.now()
+        results = []
+        for itinerary in (self.earliest_arrival(origins, destinations, depart_after),
+                          self.cheapest(origins, destinations, depart_after)):
+            if itinerary is not None and itinerary not in results:
+                results.append(itinerary)
+        return results
+
+
+def _itinerary(path):
+    legs = list(path)
+    return Itinerary(legs, legs[0].departure, legs[-1].arrival, sum(c.fare for c in legs))
+
+
+def load_connections():
+    rows = db.session.query(
+        Schedule.departure_time, Schedule.arrival_time, Route.source, Route.destination,
+        Route.fare, Schedule.id, Route.route_name
+    ).join(Route, Schedule.route_id == Route.id).filter(
+        Schedule.status == 'Scheduled',
+        Schedule.departure_time >= datetime.now()
+    )
+    return [
+        Connection(dep, arr, normalize_station(src), normalize_station(dst), fare, schedule_id, name)
+        for dep, arr, src, dst, fare, schedule_id, name in rows
+    ]
+
+
+_build_lock = threading.Lock()
+
+
+def _planner_stale(planner, ttl):
+    return planner is None or time.monotonic() - planner.built_at > ttl or planner.versions.stale()
+
+
+def get_journey_planner():
+    """Return this app's planner, rebuilt once older than the TTL or when routes or schedules change."""
+    planner = current_app.extensions.get('journey_planner')
+    ttl = current_app.config.get('JOURNEY_PLANNER_TTL', 300)
+    if _planner_stale(planner, ttl):
+        with _build_lock:
+            planner = current_app.extensions.get('journey_planner')
+            if _planner_stale(planner, ttl):
+                versions = VersionCheck(['routes', 'schedules'],
+                                        current_app.config.get('SHARED_VERSION_CHECK_SECONDS', 2))
+                planner = JourneyPlanner(
+                    load_connections(),
+                    min_transfer=timedelta(minutes=current_app.config.get('MIN_TRANSFER_MINUTES', 15))
+                )
+                planner.versions = versions
+                current_app.extensions['journey_planner'] = planner
+    return planner
+
+
+def invalidate_journey_planner():
+    current_app.extensions.pop('journey_planner', None)
@@ -0,0 +1,315 @@
+# app/live.py
+#
+# Server-sent events feed of seat availability and schedule changes at
+# /transport/live. Commits that change a schedule's seats (bookings,
+# cancellations, expired holds) or the schedule itself queue a delta in
+# the session; once the commit succeeds the deltas are appended to this
+# process's LiveFeed and every open stream picks them up:
+#
+#   event: seats     {"schedule_id", "route_id", "available_seats", "status", "version"}
+#   event: schedule  the same plus "departure_time" and "arrival_time";
+#                    status "Removed" (and no version) when the schedule was deleted
+#   event: reset     deltas were missed; reload instead of patching
+#
+# "version" is the schedule's schedule:<id> content version as of the
+# commit. Deltas are read before the commit but published after it, so
+# two commits on one schedule can publish out of order; clients drop a
+# delta older than one they have already applied.
+#
+# Set LIVE_BROKER_URL to relay deltas through redis pub/sub, so streams on
+# every worker see commits made on any of them.
+
+import atexit
+import itertools
+import json
+import threading
+import time
+import uuid
+from collections import deque, namedtuple
+
+from flask import abort, current_app, has_app_context
+from sqlalchemy import String, cast, event, literal, select
+from sqlalchemy.orm import Session, object_session
+from app.models.models import ContentVersion, Schedule
+from app.pagecache import touched_schedules
+
+LiveEvent = namedtuple('LiveEvent', 'id route_id text')
+
+RESET = 'event: reset\ndata: {}\n\n'
+
+
+class LiveFeed:
+    """Bounded log of recent deltas that SSE streams wait on.
+
+    A stream is only a cursor into the log: appending wakes the waiting
+    streams once however many there are, and an idle stream holds no
+    queue of its own and no database connection. Each event is encoded
+    once, not once per stream. A stream that falls more than `history`
+    events behind gets a reset.
+
+    Every wakeup is a thread switch per stream, which competes with
+    requests for the GIL, so streams are woken at most once per
+    `coalesce` seconds: a burst of commits goes out in one write per
+    stream instead of one per commit.
+    """
+
+    def __init__(self, history=1024, broker=None, coalesce=0.0):
+        self._cond = threading.Condition(threading.Lock())
+        self._events = deque(maxlen=history)
+        self.coalesce = coalesce
+        self.closed = False
+        self._woken = 0.0
+        self._wake_pending = False
+        # Event ids are per process; a Last-Event-ID from another worker or an earlier run resets
+        self.stream_id = uuid.uuid4().hex[:8]
+        self.last_id = 0
+        self.broker = broker
+        self.subscribers = 0
+        self.published = 0
+        self.resets = 0
+        self.broker_errors = 0
+        atexit.register(self.close)
+
+    def publish(self, deltas):
+        """Send (name, payload) deltas to every stream, via the broker if there is one."""
+        if self.broker is not None:
+            try:
+                self.broker.publish(deltas)
+                return
+            except Exception as e:
+                # Streams on this worker still hear about it; the others reset when the broker is back
+                self.broker_errors += 1
+                current_app.logger.error('Live feed broker publish failed: %s', e)
+        self.append(deltas)
+
+    def append(self, deltas):
+        with self._cond:
+            for name, payload in deltas:
+                self.last_id += 1
+                self._events.append(LiveEvent(
+                    self.last_id, payload['route_id'],
+                    f'id: {self.stream_id}:{self.last_id}\nevent: {name}\ndata: {json.dumps(payload)}\n\n'
+                ))
+            self.published += len(deltas)
+            if self._wake_pending:
+                return
+            delay = self._woken + self.coalesce - time.monotonic()
+            if delay <= 0:
+                self._wake()
+                return
+            self._wake_pending = True
+        timer = threading.Timer(delay, self._wake_later)
+        timer.daemon = True
+        timer.start()
+
+    def _wake(self):
+        self._woken = time.monotonic()
+        self._cond.notify_all()
+
+    def _wake_later(self):
+        with self._cond:
+            self._wake_pending = False
+            self._wake()
+
+    def invalidate(self):
+        """Forget the log so every stream resets, e.g. after deltas may have been lost."""
+        with self._cond:
+            self._events.clear()
+            self.last_id += 1
+            self._cond.notify_all()
+
+    def close(self):
+        """End every stream, e.g. before the worker exits."""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def cursor(self, last_event_id):
+        """Resume position for a Last-Event-ID header, or None if it can't be resumed."""
+        stream_id, _, event_id = (last_event_id or '').partition(':')
+        if stream_id != self.stream_id or not event_id.isdigit() or int(event_id) > self.last_id:
+            return None
+        return int(event_id)
+
+    def wait(self, after, timeout):
+        """Events after id `after`, waiting up to `timeout` seconds; None if some were dropped."""
+        with self._cond:
+            if self.last_id <= after and not self.closed:
+                self._cond.wait(timeout)
+            if self.last_id <= after or self.closed:
+                return []
+            first = self._events[0].id if self._events else self.last_id + 1
+            if after + 1 < first:
+                return None
+            return list(itertools.islice(self._events, after + 1 - first, None))
+
+    def stream(self, route_ids=(), last_event_id=None, keepalive=15, retry=3000):
+        """SSE text for one client, filtered to `route_ids` if given; runs until the client goes."""
+        route_ids = frozenset(route_ids)
+        # Taken before the first write, so nothing committed after the client connected is missed
+        cursor = self.cursor(last_event_id)
+        reset = cursor is None and bool(last_event_id)
+        with self._cond:
+            self.subscribers += 1
+            if cursor is None:
+                cursor = self.last_id
+        try:
+            yield f'retry: {retry}\n\n'
+            if reset:
+                self.resets += 1
+                yield RESET
+            while not self.closed:
+                events = self.wait(cursor, keepalive)
+                if events is None:
+                    cursor = self.last_id
+                    self.resets += 1
+                    yield RESET
+                elif not events:
+                    # Comment line: keeps proxies from timing out and finds closed connections
+                    yield ': keepalive\n\n'
+                else:
+                    cursor = events[-1].id
+                    text = ''.join(e.text for e in events if not route_ids or e.route_id in route_ids)
+                    if text:
+                        yield text
+        finally:
+            with self._cond:
+                self.subscribers -= 1
+
+    def stats(self):
+        return {
+            'subscribers': self.subscribers,
+            'published': self.published,
+            'resets': self.resets,
+            'broker_errors': self.broker_errors,
+        }
+
+
+class RedisLiveBroker:
+    """Relays deltas between worker processes over redis pub/sub (needs the redis package)."""
+
+    def __init__(self, url, channel='live:schedules'):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.channel = channel
+
+    def publish(self, deltas):
+        self.client.publish(self.channel, json.dumps(deltas))
+
+    def listen(self, feed, logger):
+        """Append deltas published by any worker to `feed`, from a daemon thread."""
+        def run():
+            while True:
+                try:
+                    pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(self.channel)
+                    for message in pubsub.listen():
+                        feed.append([tuple(delta) for delta in json.loads(message['data'])])
+                except Exception as e:
+                    logger.error('Live feed broker connection lost: %s', e)
+                    feed.invalidate()
+                    time.sleep(1)
+
+        threading.Thread(target=run, name='live-feed-broker', daemon=True).start()
+
+
+_feed_lock = threading.Lock()
+
+
+def get_live_feed():
+    feed = current_app.extensions.get('live_feed')
+    if feed is None:
+        with _feed_lock:
+            feed = current_app.extensions.get('live_feed')
+            if feed is None:
+                config = current_app.config
+                broker = None
+                if config.get('LIVE_BROKER_URL'):
+                    broker = RedisLiveBroker(config['LIVE_BROKER_URL'])
+                feed = current_app.extensions['live_feed'] = LiveFeed(
+                    history=config.get('LIVE_HISTORY', 1024), broker=broker,
+                    coalesce=config.get('LIVE_COALESCE', 0.1)
+                )
+                if broker is not None:
+                    broker.listen(feed, current_app.logger)
+    return feed
+
+
+def live_response(route_ids=(), last_event_id=None):
+    config = current_app.config
+    if not config.get('LIVE_FEED', True):
+        abort(404)
+    feed = get_live_feed()
+    response = current_app.response_class(
+        # Not stream_with_context: the request is torn down, and its connection returned, before streaming
+        feed.stream(route_ids, last_event_id, keepalive=config.get('LIVE_KEEPALIVE', 15)),
+        mimetype='text/event-stream'
+    )
+    response.cache_control.no_cache = True
+    # Stop nginx from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _enabled():
+    return has_app_context() and current_app.config.get('LIVE_FEED', True)
+
+
+@event.listens_for(Schedule, 'after_insert')
+@event.listens_for(Schedule, 'after_update')
+def _mark_schedule_changed(mapper, connection, target):
+    object_session(target).info.setdefault('live_schedules', set()).add(target.id)
+
+
+@event.listens_for(Schedule, 'after_delete')
+def _mark_schedule_removed(mapper, connection, target):
+    object_session(target).info.setdefault('live_deltas', []).append(
+        ('schedule', {'schedule_id': target.id, 'route_id': target.route_id, 'status': 'Removed'})
+    )
+
+
+@event.listens_for(Session, 'before_commit')
+def _collect_deltas(db_session):
+    if not _enabled():
+        _discard_deltas(db_session)
+        return
+    # Flush first so mapper events for pending objects have run
+    if db_session.new or db_session.dirty or db_session.deleted:
+        db_session.flush()
+    changed = db_session.info.pop('live_schedules', set())
+    # Bulk seat updates don't load the rows; they are recorded by touch_schedule()
+    ids = changed | touched_schedules(db_session)
+    if not ids:
+        return
+    deltas = db_session.info.setdefault('live_deltas', [])
+    # pagecache's before_commit hook, registered first, has already bumped
+    # schedule:<id>; the row stays locked until commit, so versions follow commit order
+    rows = db_session.execute(
+        select(Schedule.id, Schedule.route_id, Schedule.available_seats, Schedule.status,
+               Schedule.departure_time, Schedule.arrival_time, ContentVersion.version)
+        .outerjoin(ContentVersion, ContentVersion.key == literal('schedule:') + cast(Schedule.id, String))
+        .where(Schedule.id.in_(ids))
+    )
+    for schedule_id, route_id, available_seats, status, departure_time, arrival_time, version in rows:
+        payload = {'schedule_id': schedule_id, 'route_id': route_id,
+                   'available_seats': available_seats, 'status': status, 'version': version or 0}
+        if schedule_id in changed:
+            payload['departure_time'] = departure_time.isoformat()
+            payload['arrival_time'] = arrival_time.isoformat()
+            deltas.append(('schedule', payload))
+        else:
+            deltas.append(('seats', payload))
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_deltas(db_session):
+    deltas = db_session.info.pop('live_deltas', None)
+    if deltas and _enabled():
+        get_live_feed().publish(deltas)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_deltas(db_session):
+    db_session.info.pop('live_schedules', None)
+    db_session.info.pop('live_deltas', None)
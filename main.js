@@ -19,20 +19,26 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
-    // Example: AJAX booking form submission
+    // AJAX booking form submission. The idempotency key is kept until the
+    // booking succeeds, so resubmitting after a timeout cannot book twice.
     window.submitBookingForm = function(formId) {
         var form = document.getElementById(formId);
         var formData = new FormData(form);
-        fetch(form.action, {
-            method: form.method,
+        if (!form.dataset.idempotencyKey) {
+            form.dataset.idempotencyKey = window.crypto && crypto.randomUUID ?
+                crypto.randomUUID() : Date.now().toString(36) + Math.random().toString(36).slice(2);
+        }
+        fetch(form.dataset.apiAction || form.action, {
+            method: 'POST',
+            headers: {'Idempotency-Key': form.dataset.idempotencyKey},
             body: formData,
         })
         .then(response => response.json())
         .then(data => {
-            // Handle booking response here
             if (data.success) {
-                alert('Booking successful!');
-                window.location.reload();
+                delete form.dataset.idempotencyKey;
+                alert('Booking successful! Reference: ' + data.booking_reference);
+                window.location.href = data.booking_url;
             } else {
                 alert('Booking failed: ' + data.error);
             }
@@ -42,6 +48,73 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     };
 
+    document.querySelectorAll('form[data-api-action]').forEach(function(form) {
+        form.addEventListener('submit', function(event) {
+            event.preventDefault();
+            window.submitBookingForm(form.id);
+        });
+    });
+
+    // Live seat counts: timetables and the booking page patch themselves from
+    // the server-sent delta feed instead of being reloaded or polled.
+    document.querySelectorAll('[data-live-feed]').forEach(function(container) {
+        if (!window.EventSource) {
+            return;
+        }
+        var source = new EventSource(container.dataset.liveFeed);
+
+        function notice(text) {
+            if (container.liveNotice) {
+                return;
+            }
+            container.liveNotice = document.createElement('div');
+            container.liveNotice.className = 'alert alert-info';
+            container.liveNotice.textContent = text;
+            (container.closest('.card-body') || container).prepend(container.liveNotice);
+        }
+
+        // Deltas can arrive out of commit order; keep the newest version seen per schedule
+        var versions = {};
+
+        function update(event) {
+            var delta = JSON.parse(event.data);
+            if (delta.version !== undefined) {
+                if (delta.version < (versions[delta.schedule_id] || 0)) {
+                    return;
+                }
+                versions[delta.schedule_id] = delta.version;
+            }
+            var row = container.dataset.scheduleId ?
+                (container.dataset.scheduleId == delta.schedule_id ? container : null) :
+                container.querySelector('[data-schedule-id="' + delta.schedule_id + '"]');
+            if (!row) {
+                if (event.type === 'schedule' && delta.status === 'Scheduled' && !container.dataset.scheduleId) {
+                    notice('New departures have been added. Reload the page to see them.');
+                }
+                return;
+            }
+            var scheduled = delta.status === 'Scheduled';
+            row.querySelectorAll('[data-live-seats]').forEach(function(el) {
+                el.textContent = scheduled ? delta.available_seats : delta.status;
+            });
+            row.querySelectorAll('[data-live-max]').forEach(function(el) {
+                el.max = Math.max(delta.available_seats || 0, 1);
+            });
+            row.querySelectorAll('[data-live-open]').forEach(function(el) {
+                el.hidden = !(scheduled && delta.available_seats > 0);
+            });
+            row.querySelectorAll('[data-live-full]').forEach(function(el) {
+                el.hidden = !(scheduled && delta.available_seats <= 0);
+            });
+        }
+
+        source.addEventListener('seats', update);
+        source.addEventListener('schedule', update);
+        source.addEventListener('reset', function() {
+            notice('Seat counts may be out of date. Reload the page to refresh them.');
+        });
+    });
+
     // Example usage for dashboard stats via AJAX
     if (document.getElementById('dashboardStats')) {
         fetch('/api/stats')
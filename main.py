@@ -1,9 +1,11 @@
 # app/routes/main.py
 
-from flask import Blueprint, render_template, jsonify
+from flask import Blueprint, render_template, jsonify, request, current_app
 from flask_login import login_required, current_user
 from app.models.models import Route, Schedule, Booking, VoiceCommand
-from datetime import datetime, timedelta
+from app.stats import activity_stats
+from app.queries import user_bookings
+from app.database import read_replica
 
 main_bp = Blueprint('main', __name__)
 
@@ -17,9 +19,10 @@ def index():
 def dashboard():
     """User dashboard"""
     total_bookings = Booking.query.filter_by(user_id=current_user.id).count()
-    active_bookings = Booking.query.filter_by(user_id=current_user.id, status='Confirmed').count()
+    active_bookings = Booking.query.filter(Booking.user_id == current_user.id,
+                                          Booking.status.in_(('Held', 'Confirmed'))).count()
     voice_commands_count = VoiceCommand.query.filter_by(user_id=current_user.id).count()
-    recent_bookings = Booking.query.filter_by(user_id=current_user.id).order_by(Booking.booking_time.desc()).limit(5).all()
+    recent_bookings = user_bookings(current_user.id).limit(5).all()
     recent_commands = VoiceCommand.query.filter_by(user_id=current_user.id).order_by(VoiceCommand.timestamp.desc()).limit(5).all()
     available_routes = Route.query.limit(6).all()
     stats = {
@@ -36,31 +39,18 @@ def dashboard():
 
 @main_bp.route('/api/stats')
 @login_required
+@read_replica
 def api_stats():
     """API endpoint for dashboard statistics"""
-    seven_days_ago = datetime.now() - timedelta(days=7)
-    daily_bookings = []
-    for i in range(7):
-        day = seven_days_ago + timedelta(days=i)
-        day_start = day.replace(hour=0, minute=0, second=0, microsecond=0)
-        day_end = day.replace(hour=23, minute=59, second=59, microsecond=999999)
-        bookings_count = Booking.query.filter(
-            Booking.user_id == current_user.id,
-            Booking.booking_time >= day_start,
-            Booking.booking_time <= day_end
-        ).count()
-        daily_bookings.append({
-            'date': day.strftime('%Y-%m-%d'),
-            'count': bookings_count
-        })
-    voice_stats = {
-        'total': VoiceCommand.query.filter_by(user_id=current_user.id).count(),
-        'today': VoiceCommand.query.filter(
-            VoiceCommand.user_id == current_user.id,
-            VoiceCommand.timestamp >= datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-        ).count()
-    }
+    days = min(max(request.args.get('days', 7, type=int), 1), 365)
+    return jsonify(activity_stats(current_user.id, days))
+
+@main_bp.route('/api/cache-stats')
+@login_required
+def api_cache_stats():
+    """Hit/miss counters for this worker's in-process caches"""
     return jsonify({
-        'daily_bookings': daily_bookings,
-        'voice_stats': voice_stats
+        name: extension.stats()
+        for name, extension in current_app.extensions.items()
+        if callable(getattr(extension, 'stats', None))
     })
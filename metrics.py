@@ -0,0 +1,280 @@
+# app/metrics.py
+#
+# Process-wide request, SQL and voice pipeline metrics in the Prometheus
+# text format, plus an opt-in sampling profiler for slow requests. Each
+# worker process keeps its own counters; scrape every worker (or put them
+# behind one port per worker) to see the whole deployment.
+
+import bisect
+import collections
+import random
+import sys
+import threading
+import time
+
+from flask import Response, abort, current_app, g, jsonify, request
+from app.instrumentation import query_stats
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = collections.defaultdict(int)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts plus the overflow bucket, then sum
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(bound))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return lines
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Request latency by endpoint.', ('endpoint', 'method'))
+REQUESTS_TOTAL = REGISTRY.counter(
+    'http_requests_total', 'Requests by endpoint and status code.', ('endpoint', 'method', 'status'))
+REQUEST_SQL_QUERIES = REGISTRY.histogram(
+    'http_request_sql_queries', 'SQL statements issued per request.', ('endpoint',), QUERY_COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = REGISTRY.histogram(
+    'http_request_sql_seconds', 'Time spent in SQL per request.', ('endpoint',))
+VOICE_STAGE_SECONDS = REGISTRY.histogram(
+    'voice_stage_seconds', 'Voice pipeline time by stage (queue_wait, recognition, answer, tts).', ('stage',))
+
+
+def observe_voice_stage(stage, seconds):
+    VOICE_STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+class SamplingProfiler:
+    """Samples the stacks of chosen request threads from one background thread.
+
+    Requests are picked at `sample_rate`; those that then take longer than
+    `threshold` seconds keep their folded stacks (flamegraph.pl format) in a
+    ring buffer of the last `keep` slow requests. Nothing runs while no
+    request is being profiled.
+    """
+
+    def __init__(self, sample_rate=0.01, threshold=0.5, interval=0.005, keep=20):
+        self.sample_rate = sample_rate
+        self.threshold = threshold
+        self.interval = interval
+        self.profiles = collections.deque(maxlen=keep)
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def start(self):
+        """Maybe profile the current thread; returns a token for stop() or None."""
+        if random.random() >= self.sample_rate:
+            return None
+        stacks = collections.Counter()
+        with self._lock:
+            self._active[threading.get_ident()] = stacks
+        self._wake.set()
+        return stacks
+
+    def stop(self, stacks, seconds, description):
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+        if seconds >= self.threshold and stacks:
+            self.profiles.append({
+                'request': description,
+                'seconds': round(seconds, 4),
+                'samples': sum(stacks.values()),
+                'stacks': [f'{stack} {count}' for stack, count in stacks.most_common()],
+            })
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            with self._lock:
+                active = dict(self._active)
+                if not active:
+                    self._wake.clear()
+                    continue
+            frames = sys._current_frames()
+            for thread_id, stacks in active.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    stacks[_fold(frame)] += 1
+            time.sleep(self.interval)
+
+
+def _fold(frame):
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
+
+
+def _component_stats():
+    """Numeric stats() of the per-app caches and workers, as gauge lines."""
+    name = 'app_component_stat'
+    lines = [f'# HELP {name} Counters reported by in-process caches and workers.', f'# TYPE {name} gauge']
+    for component, extension in sorted(current_app.extensions.items()):
+        stats = getattr(extension, 'stats', None)
+        if not callable(stats):
+            continue
+        for stat, value in sorted(stats().items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                labels = _format_labels(('component', 'stat'), (component, stat))
+                lines.append(f'{name}{labels} {_format_value(value)}')
+    return lines
+
+
+def _check_token():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+
+
+def metrics_view():
+    _check_token()
+    lines = REGISTRY.render() + _component_stats()
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def profiles_view():
+    _check_token()
+    profiler = current_app.extensions.get('profiler')
+    return jsonify(list(profiler.profiles) if profiler else [])
+
+
+def init_metrics(app):
+    """Time every request and serve /metrics (and /metrics/profiles).
+
+    METRICS_ENABLED turns the request hooks off; METRICS_TOKEN requires a
+    bearer token to scrape. PROFILE_SAMPLE_RATE > 0 turns on the sampling
+    profiler for that fraction of requests, keeping those slower than
+    PROFILE_THRESHOLD seconds.
+    """
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+    profiler = None
+    if sample_rate > 0:
+        profiler = app.extensions['profiler'] = SamplingProfiler(
+            sample_rate=sample_rate,
+            threshold=app.config.get('PROFILE_THRESHOLD', 0.5),
+            interval=app.config.get('PROFILE_INTERVAL', 0.005),
+        )
+
+    @app.before_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+        if profiler is not None:
+            g.profile_stacks = profiler.start()
+
+    @app.teardown_request
+    def record_request_metrics(exc):
+        start = g.pop('request_start', None)
+        if start is None:
+            return
+        seconds = time.perf_counter() - start
+        endpoint = request.endpoint or 'unmatched'
+        status = g.get('response_status', 500)
+        REQUEST_SECONDS.observe(seconds, endpoint=endpoint, method=request.method)
+        REQUESTS_TOTAL.inc(endpoint=endpoint, method=request.method, status=status)
+        count, sql_seconds = query_stats()
+        REQUEST_SQL_QUERIES.observe(count, endpoint=endpoint)
+        REQUEST_SQL_SECONDS.observe(sql_seconds, endpoint=endpoint)
+        stacks = g.pop('profile_stacks', None)
+        if stacks is not None:
+            profiler.stop(stacks, seconds, f'{request.method} {request.full_path.rstrip("?")}')
+
+    @app.after_request
+    def remember_status(response):
+        g.response_status = response.status_code
+        return response
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    app.add_url_rule('/metrics/profiles', 'metrics_profiles', profiles_view)
@@ -0,0 +1,39 @@
+# app/migrations.py
+#
+# db.create_all() only creates missing tables, so indexes added to
+# existing models never reach databases created before them. This adds
+# missing tables and any declared index the live schema lacks.
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import inspect
+from app.models.models import db
+
+
+def upgrade_schema():
+    """Create missing tables and indexes; return the names of what was created."""
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    created = [name for name in db.metadata.tables if name not in existing_tables]
+    db.create_all()
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_indexes = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(bind=engine)
+                created.append(index.name)
+    return created
+
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db_command():
+    """Add missing tables and indexes to an existing database."""
+    created = upgrade_schema()
+    if created:
+        click.echo('Created: ' + ', '.join(created))
+    else:
+        click.echo('Schema is up to date')
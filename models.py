@@ -2,8 +2,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
+from app.database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -38,8 +39,25 @@ class Route(db.Model):
     duration = db.Column(db.Integer, nullable=False)
     fare = db.Column(db.Float, nullable=False)
     schedules = db.relationship('Schedule', backref='route', lazy=True)
+    stops = db.relationship('RouteStop', order_by='RouteStop.position', lazy=True,
+                            cascade='all, delete-orphan')
+
+    @property
+    def stations(self):
+        """Source, intermediate stops and destination in travel order."""
+        return [self.source] + [stop.station for stop in self.stops] + [self.destination]
+
+class RouteStop(db.Model):
+    """Intermediate stop on a route; a route with none is a single segment."""
+    route_id = db.Column(db.Integer, db.ForeignKey('route.id'), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)
+    station = db.Column(db.String(100), nullable=False)
 
 class Schedule(db.Model):
+    __table_args__ = (
+        db.Index('ix_schedule_route_status_departure', 'route_id', 'status', 'departure_time'),
+        db.Index('ix_schedule_vehicle_departure', 'vehicle_id', 'departure_time'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     vehicle_id = db.Column(db.Integer, db.ForeignKey('vehicle.id'), nullable=False)
     route_id = db.Column(db.Integer, db.ForeignKey('route.id'), nullable=False)
@@ -50,6 +68,9 @@ class Schedule(db.Model):
     bookings = db.relationship('Booking', backref='schedule', lazy=True)
 
 class Booking(db.Model):
+    __table_args__ = (
+        db.Index('ix_booking_user_booking_time', 'user_id', 'booking_time'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     schedule_id = db.Column(db.Integer, db.ForeignKey('schedule.id'), nullable=False)
@@ -58,8 +79,49 @@ class Booking(db.Model):
     total_fare = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='Confirmed')
     booking_reference = db.Column(db.String(20), unique=True)
+    allocation = db.relationship('SeatAllocation', uselist=False, lazy=True)
+    hold = db.relationship('SeatHold', uselist=False, lazy=True)
+
+class SeatInventory(db.Model):
+    """Packed seat x segment bitsets for one schedule (see app.seatmap).
+
+    Created on the first booking or release. Seats sold before the inventory existed
+    have no seat numbers; they are held as a block of `legacy_seats` seats
+    starting at seat 1 on every segment.
+    """
+    schedule_id = db.Column(db.Integer, db.ForeignKey('schedule.id'), primary_key=True)
+    capacity = db.Column(db.Integer, nullable=False)
+    segments = db.Column(db.Integer, nullable=False)
+    occupancy = db.Column(db.LargeBinary, nullable=False)
+    legacy_seats = db.Column(db.Integer, default=0, nullable=False)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+class SeatAllocation(db.Model):
+    """Seat numbers and segment range held by a booking."""
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), primary_key=True)
+    first_segment = db.Column(db.Integer, nullable=False)
+    last_segment = db.Column(db.Integer, nullable=False)
+    seats = db.Column(db.String(400), nullable=False)
+
+    @property
+    def seat_numbers(self):
+        return [int(seat) for seat in self.seats.split(',')]
+
+class SeatHold(db.Model):
+    """Deadline for paying a Held booking; the row goes once it is paid, cancelled or expired."""
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), primary_key=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class BookingNode(db.Model):
+    """Node id (0-1023) leased by a worker process for booking references; stale after the lease runs out."""
+    node_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    owner = db.Column(db.String(64), nullable=False)
+    renewed_at = db.Column(db.DateTime, nullable=False)
 
 class VoiceCommand(db.Model):
+    __table_args__ = (
+        db.Index('ix_voice_command_user_timestamp', 'user_id', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     command_text = db.Column(db.Text, nullable=False)
@@ -67,3 +129,29 @@ class VoiceCommand(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='Processed')
     processing_time = db.Column(db.Float)
+
+class DailyActivity(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    bookings = db.Column(db.Integer, default=0, nullable=False)
+    voice_commands = db.Column(db.Integer, default=0, nullable=False)
+
+class IdempotencyKey(db.Model):
+    """Stored result of a JSON booking request, replayed when a client retries the same key."""
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_key_user_key'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    request_fingerprint = db.Column(db.String(64), nullable=False)
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'))
+    status_code = db.Column(db.Integer, nullable=False)
+    response = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class ContentVersion(db.Model):
+    """Change counter for a set of pages ("routes", "schedules", "route:<id>"), shared by all workers."""
+    key = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -0,0 +1,248 @@
+# app/pagecache.py
+#
+# HTTP validators and rendered-fragment caching for the route list,
+# timetables and route search. Pages are keyed on ContentVersion rows,
+# bumped in the same transaction as the change, so every worker agrees on
+# when a page changed:
+#
+#   routes        -- any Route or RouteStop change (route list, search)
+#   schedules     -- schedules added, edited or removed (journey search)
+#   route:<id>    -- that route, its stops and its schedules
+#   schedule:<id> -- that schedule and its seats
+#   seats:<id>    -- read-only: the schedule:<id> versions of route <id>'s
+#                    schedules, summed
+#
+# Seat changes bump only their schedule's row, so bookings on different
+# schedules of one route don't queue on a shared version row.
+
+import hashlib
+import threading
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, g, has_request_context, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import String, cast, event, func, insert, literal, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session, object_session
+from werkzeug.http import is_resource_modified
+from app.cache import LRUCache
+from app.models.models import db, ContentVersion, Route, RouteStop, Schedule
+
+
+def touch(db_session, *keys):
+    """Bump these content versions when `db_session` next commits."""
+    db_session.info.setdefault('touched_versions', set()).update(keys)
+
+
+def touch_schedule(db_session, schedule_id):
+    """Bump the version of schedule `schedule_id`; for bulk seat updates."""
+    db_session.info.setdefault('touched_schedules', set()).add(schedule_id)
+
+
+def touched_schedules(db_session):
+    """Schedules passed to touch_schedule() in the current transaction."""
+    return db_session.info.get('touched_schedules', set())
+
+
+@event.listens_for(Route, 'after_insert')
+@event.listens_for(Route, 'after_update')
+@event.listens_for(Route, 'after_delete')
+def _touch_route(mapper, connection, target):
+    touch(object_session(target), 'routes', f'route:{target.id}')
+
+
+@event.listens_for(RouteStop, 'after_insert')
+@event.listens_for(RouteStop, 'after_update')
+@event.listens_for(RouteStop, 'after_delete')
+def _touch_route_stop(mapper, connection, target):
+    touch(object_session(target), 'routes', f'route:{target.route_id}')
+
+
+@event.listens_for(Schedule, 'after_insert')
+@event.listens_for(Schedule, 'after_update')
+@event.listens_for(Schedule, 'after_delete')
+def _touch_schedule(mapper, connection, target):
+    touch(object_session(target), 'schedules', f'route:{target.route_id}', f'schedule:{target.id}')
+
+
+def _bump_versions_on(connection, keys, now):
+    table = ContentVersion.__table__
+    # Always in the same order, so concurrent commits can't deadlock on the rows
+    rows = [{'key': key, 'version': 1, 'updated_at': now} for key in sorted(keys)]
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite if dialect == 'sqlite' else postgresql).insert(table)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=['key'], set_={'version': table.c.version + 1, 'updated_at': stmt.excluded.updated_at}
+        ), rows)
+    elif dialect in ('mysql', 'mariadb'):
+        stmt = mysql.insert(table)
+        connection.execute(stmt.on_duplicate_key_update(
+            version=table.c.version + 1, updated_at=stmt.inserted.updated_at
+        ), rows)
+    else:
+        for row in rows:
+            result = connection.execute(
+                update(table).where(table.c.key == row['key'])
+                .values(version=table.c.version + 1, updated_at=now)
+            )
+            if result.rowcount == 0:
+                connection.execute(insert(table).values(row))
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_versions(db_session):
+    # Flush first so mapper events for pending objects have run
+    if db_session.new or db_session.dirty or db_session.deleted:
+        db_session.flush()
+    keys = db_session.info.pop('touched_versions', set())
+    # Kept until the transaction ends; the live feed reads it too
+    keys.update(f'schedule:{schedule_id}' for schedule_id in touched_schedules(db_session))
+    if keys:
+        _bump_versions_on(db_session.connection(), keys, datetime.utcnow())
+
+
+@event.listens_for(Session, 'after_commit')
+@event.listens_for(Session, 'after_rollback')
+def _discard_touches(db_session):
+    db_session.info.pop('touched_versions', None)
+    db_session.info.pop('touched_schedules', None)
+
+
+def content_versions(keys):
+    """{key: (version, updated_at)} for `keys`; keys never bumped read as (0, None).
+
+    Versions are read once per request, so a page's validators and its
+    fragments always agree.
+    """
+    known = g.setdefault('content_versions', {}) if has_request_context() else {}
+    missing = [key for key in keys if key not in known]
+    seats = [key for key in missing if key.startswith('seats:')]
+    missing = [key for key in missing if not key.startswith('seats:')]
+    if missing:
+        rows = db.session.execute(
+            select(ContentVersion.key, ContentVersion.version, ContentVersion.updated_at)
+            .where(ContentVersion.key.in_(missing))
+        )
+        known.update({key: (0, None) for key in missing})
+        known.update({key: (version, updated_at) for key, version, updated_at in rows})
+    if seats:
+        known.update(_seat_versions(seats))
+    return {key: known[key] for key in keys}
+
+
+def _seat_versions(keys):
+    # Versions only grow, so the sum changes with every seat change on the
+    # route; a schedule leaving the route bumps route:<id> instead
+    route_ids = {int(key.partition(':')[2]): key for key in keys}
+    rows = db.session.execute(
+        select(Schedule.route_id, func.sum(ContentVersion.version), func.max(ContentVersion.updated_at))
+        .join(ContentVersion, ContentVersion.key == literal('schedule:') + cast(Schedule.id, String))
+        .where(Schedule.route_id.in_(route_ids))
+        .group_by(Schedule.route_id)
+    )
+    versions = {key: (0, None) for key in keys}
+    versions.update({route_ids[route_id]: (version, updated_at) for route_id, version, updated_at in rows})
+    return versions
+
+
+class VersionCheck:
+    """Tells an in-process structure built from the database when to rebuild.
+
+    Create it just before reading the rows, so a change committed during
+    the build still counts. stale() reads the shared content versions at
+    most every `interval` seconds, so changes committed by other workers
+    or the CLI are noticed within that time.
+    """
+
+    def __init__(self, keys, interval):
+        self.keys = list(keys)
+        self.interval = interval
+        self.versions = self._read()
+        self.checked_at = time.monotonic()
+
+    def _read(self):
+        versions = content_versions(self.keys)
+        return tuple(versions[key][0] for key in self.keys)
+
+    def stale(self):
+        now = time.monotonic()
+        if now - self.checked_at < self.interval:
+            return False
+        self.checked_at = now
+        return self._read() != self.versions
+
+
+def conditional(*keys):
+    """Answer GETs with 304 Not Modified while these content versions are unchanged.
+
+    Keys are formatted with the view's arguments, e.g. 'route:{route_id}'.
+    The ETag also covers the user and full URL, since pages show who is
+    logged in and depend on query arguments; responses are only reused
+    after revalidation (Cache-Control: private, no-cache). Requests with
+    flashed messages waiting are always rendered. Put it below
+    @read_replica, so the versions are read from the same database as
+    the page: a lagging replica then serves an older page under its own
+    older validators, and the next request after it catches up misses.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if request.method != 'GET' or '_flashes' in session:
+                return view(*args, **kwargs)
+            versions = content_versions([key.format(**kwargs) for key in keys])
+            user_id = current_user.get_id() if current_user else None
+            etag = hashlib.sha1(repr((sorted(versions.items()), user_id, request.full_path))
+                                .encode()).hexdigest()[:20]
+            modified = [updated_at for _, updated_at in versions.values() if updated_at is not None]
+            last_modified = max(modified).replace(tzinfo=timezone.utc, microsecond=0) if modified else None
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        return wrapped
+    return decorator
+
+
+_cache_lock = threading.Lock()
+
+
+def get_fragment_cache():
+    cache = current_app.extensions.get('fragment_cache')
+    if cache is None:
+        with _cache_lock:
+            cache = current_app.extensions.get('fragment_cache')
+            if cache is None:
+                cache = current_app.extensions['fragment_cache'] = LRUCache(
+                    maxsize=current_app.config.get('FRAGMENT_CACHE_SIZE', 1024),
+                    ttl=current_app.config.get('FRAGMENT_CACHE_TTL', 60)
+                )
+    return cache
+
+
+def cached_fragment(name, keys, render, *args):
+    """Return render()'s output, reused until one of `keys` changes version.
+
+    `args` distinguish variants of the same fragment (page cursor, search
+    terms).
+    """
+    # Read the versions before rendering so a concurrent change can't be cached under them
+    versions = content_versions(keys)
+    key = (name, tuple(sorted((k, v[0]) for k, v in versions.items()))) + args
+    cache = get_fragment_cache()
+    value = cache.get(key)
+    if value is None:
+        value = render()
+        cache.set(key, value)
+    return value
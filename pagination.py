@@ -0,0 +1,52 @@
+# app/pagination.py
+
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value, row_id):
+    raw = f'{value.isoformat()}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        value, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(value), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor('Invalid page cursor')
+
+
+def keyset_page(query, column, id_column, cursor=None, limit=20, descending=True):
+    """Return (rows, next_cursor) for one page, seeking on (column, id).
+
+    Each page starts from the last row of the previous one instead of an
+    OFFSET, so deep pages cost the same as the first given an index on
+    the filter columns followed by `column`.
+    """
+    if limit < 1:
+        raise ValueError('Page size must be at least 1')
+    if cursor:
+        value, row_id = decode_cursor(cursor)
+        if descending:
+            query = query.filter(or_(column < value, and_(column == value, id_column < row_id)))
+        else:
+            query = query.filter(or_(column > value, and_(column == value, id_column > row_id)))
+    if descending:
+        query = query.order_by(None).order_by(column.desc(), id_column.desc())
+    else:
+        query = query.order_by(None).order_by(column.asc(), id_column.asc())
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, column.key), getattr(last, id_column.key))
+    return rows, next_cursor
@@ -0,0 +1,20 @@
+# app/queries.py
+#
+# Query helpers that eager-load the relationships templates and voice
+# answers walk, so listing N rows costs one SELECT instead of N + 1.
+
+from sqlalchemy.orm import joinedload
+from app.models.models import Booking, Schedule
+
+
+def user_bookings(user_id):
+    """Bookings for a user with schedule and route loaded, newest first."""
+    return Booking.query.filter_by(user_id=user_id).options(
+        joinedload(Booking.schedule).joinedload(Schedule.route)
+    ).order_by(Booking.booking_time.desc())
+
+
+def schedules_with_details(query=None):
+    """Schedules with vehicle and route loaded."""
+    query = query if query is not None else Schedule.query
+    return query.options(joinedload(Schedule.vehicle), joinedload(Schedule.route))
@@ -0,0 +1,190 @@
+# app/recognition.py
+
+import io
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app
+
+
+class RecognitionError(Exception):
+    pass
+
+
+class QueueFullError(Exception):
+    pass
+
+
+# speech_recognition is imported inside the workers only, so web workers
+# that never serve voice traffic don't pay for loading it
+
+def _load_audio(audio_data):
+    import speech_recognition as sr
+
+    recognizer = sr.Recognizer()
+    try:
+        with sr.AudioFile(io.BytesIO(audio_data)) as source:
+            audio = recognizer.record(source)
+    except (ValueError, EOFError):
+        raise RecognitionError('Unsupported audio format, please upload WAV, AIFF or FLAC')
+    return recognizer, audio
+
+
+def recognize_google(audio_data, language):
+    import speech_recognition as sr
+
+    recognizer, audio = _load_audio(audio_data)
+    try:
+        return recognizer.recognize_google(audio, language=language)
+    except sr.UnknownValueError:
+        raise RecognitionError('Could not understand audio')
+    except sr.RequestError as e:
+        raise RecognitionError(f'Speech recognition error: {e}')
+
+
+def recognize_sphinx(audio_data, language):
+    # Offline engine, needs the optional pocketsphinx package
+    import speech_recognition as sr
+
+    recognizer, audio = _load_audio(audio_data)
+    try:
+        return recognizer.recognize_sphinx(audio, language=language)
+    except sr.UnknownValueError:
+        raise RecognitionError('Could not understand audio')
+    except sr.RequestError as e:
+        raise RecognitionError(f'Speech recognition error: {e}')
+
+
+def recognize_stub(audio_data, language):
+    # Deterministic stand-in for tests and benchmarks: the "audio" is the transcript
+    text = audio_data.decode('utf-8', 'ignore').strip()
+    if not text:
+        raise RecognitionError('Could not understand audio')
+    return text
+
+
+RECOGNIZERS = {
+    'google': recognize_google,
+    'sphinx': recognize_sphinx,
+    'stub': recognize_stub,
+}
+
+
+def run_recognizer(backend, audio_data, language):
+    """Worker entry point: returns (command, seconds spent recognizing)."""
+    start = time.perf_counter()
+    text = RECOGNIZERS[backend](audio_data, language)
+    return text.lower(), time.perf_counter() - start
+
+
+class RecognitionJob:
+    def __init__(self, user_id):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.future = None
+        self.submitted_at = time.monotonic()
+        self.finished_at = None
+        self.result = None
+        self.lock = threading.Lock()
+
+
+class RecognitionQueue:
+    """Bounded queue of recognition jobs served by a process pool.
+
+    Web workers only submit audio and read back finished jobs, so no
+    request thread ever waits on a microphone or a recognition call.
+    """
+
+    def __init__(self, backend='google', workers=None, max_pending=64,
+                 language='en-US', job_ttl=300):
+        if backend not in RECOGNIZERS:
+            raise ValueError(f'Unknown recognition backend: {backend}')
+        self.backend = backend
+        self.language = language
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self.workers = workers or os.cpu_count()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._pending = 0
+
+    def submit(self, user_id, audio_data):
+        with self._lock:
+            self._expire()
+            if self._pending >= self.max_pending:
+                raise QueueFullError('Voice recognition is busy, please try again')
+            self._pending += 1
+        job = RecognitionJob(user_id)
+        executor = self.executor
+        try:
+            try:
+                job.future = executor.submit(run_recognizer, self.backend, audio_data, self.language)
+            except BrokenProcessPool:
+                executor = self._replace_executor(executor)
+                job.future = executor.submit(run_recognizer, self.backend, audio_data, self.language)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        with self._lock:
+            self._jobs[job.id] = job
+        job.future.add_done_callback(lambda f: self._finished(job, executor))
+        return job
+
+    def _finished(self, job, executor):
+        job.finished_at = time.monotonic()
+        with self._lock:
+            self._pending -= 1
+        if not job.future.cancelled() and isinstance(job.future.exception(), BrokenProcessPool):
+            self._replace_executor(executor)
+
+    def _replace_executor(self, broken):
+        """Swap in a fresh pool after a recognizer process died and broke `broken`."""
+        with self._lock:
+            if self.executor is broken:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            executor = self.executor
+        broken.shutdown(wait=False, cancel_futures=True)
+        return executor
+
+    def get(self, job_id, user_id):
+        job = self._jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def discard(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.job_ttl
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+_queue_lock = threading.Lock()
+
+
+def get_recognition_queue():
+    queue = current_app.extensions.get('recognition_queue')
+    if queue is None:
+        with _queue_lock:
+            queue = current_app.extensions.get('recognition_queue')
+            if queue is None:
+                config = current_app.config
+                queue = current_app.extensions['recognition_queue'] = RecognitionQueue(
+                    backend=config.get('RECOGNITION_BACKEND', 'google'),
+                    workers=config.get('RECOGNITION_WORKERS'),
+                    max_pending=config.get('RECOGNITION_MAX_PENDING', 64),
+                    language=config.get('RECOGNITION_LANGUAGE', 'en-US'),
+                )
+    return queue
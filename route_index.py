@@ -0,0 +1,162 @@
+# app/route_index.py
+
+import bisect
+import re
+import threading
+from collections import defaultdict, namedtuple
+
+from flask import current_app
+from app.models.models import db, Route
+from app.pagecache import VersionCheck
+
+RouteEntry = namedtuple('RouteEntry', 'id route_name source destination distance duration fare')
+
+# Common alternate spellings and old names, mapped to the normalized station name
+STATION_ALIASES = {
+    'vizag': 'visakhapatnam',
+    'vishakapatnam': 'visakhapatnam',
+    'visakapatnam': 'visakhapatnam',
+    'waltair': 'visakhapatnam',
+    'hyd': 'hyderabad',
+    'secunderabad': 'hyderabad',
+    'bezawada': 'vijayawada',
+    'vja': 'vijayawada',
+    'madras': 'chennai',
+    'bombay': 'mumbai',
+    'bangalore': 'bengaluru',
+    'calcutta': 'kolkata',
+}
+
+FUZZY_THRESHOLD = 0.4
+
+_non_alnum = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_station(name):
+    return _non_alnum.sub(' ', (name or '').lower()).strip()
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class RouteIndex:
+    """In-memory station index over the Route table.
+
+    Stations are matched by alias, substring (served from a trigram
+    posting index) and, failing that, trigram similarity for typos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = 0
+        self._reset()
+
+    def _reset(self):
+        self.routes = {}
+        self.by_source = defaultdict(set)
+        self.by_destination = defaultdict(set)
+        self._stations = []
+        self._station_trigrams = {}
+        self._trigram_postings = defaultdict(set)
+
+    def build(self, entries):
+        with self._lock:
+            self._reset()
+            for entry in entries:
+                self._add(entry)
+
+    def add(self, route):
+        entry = RouteEntry(route.id, route.route_name, route.source, route.destination,
+                           route.distance, route.duration, route.fare)
+        with self._lock:
+            self._add(entry)
+
+    def _add(self, entry):
+        self.version += 1
+        self.routes[entry.id] = entry
+        source = normalize_station(entry.source)
+        destination = normalize_station(entry.destination)
+        self.by_source[source].add(entry.id)
+        self.by_destination[destination].add(entry.id)
+        for station in (source, destination):
+            if station not in self._station_trigrams:
+                grams = _trigrams(station)
+                self._station_trigrams[station] = grams
+                for gram in grams:
+                    self._trigram_postings[gram].add(station)
+                bisect.insort(self._stations, station)
+
+    @property
+    def stations(self):
+        return list(self._stations)
+
+    def resolve(self, query):
+        """Return the set of normalized station names matching a query."""
+        text = normalize_station(query)
+        if not text:
+            return set()
+        text = STATION_ALIASES.get(text, text)
+        if len(text) < 3:
+            start = bisect.bisect_left(self._stations, text)
+            matches = set()
+            for station in self._stations[start:]:
+                if not station.startswith(text):
+                    break
+                matches.add(station)
+            return matches
+        grams = _trigrams(text)
+        candidates = None
+        for gram in grams:
+            postings = self._trigram_postings.get(gram)
+            if not postings:
+                candidates = set()
+                break
+            candidates = set(postings) if candidates is None else candidates & postings
+        matches = {station for station in candidates if text in station}
+        if matches:
+            return matches
+        return self._fuzzy(grams)
+
+    def _fuzzy(self, grams):
+        shared = defaultdict(int)
+        for gram in grams:
+            for station in self._trigram_postings.get(gram, ()):
+                shared[station] += 1
+        best, matches = FUZZY_THRESHOLD, set()
+        for station, count in shared.items():
+            score = count / (len(grams) + len(self._station_trigrams[station]) - count)
+            if score > best:
+                best, matches = score, {station}
+            elif score == best:
+                matches.add(station)
+        return matches
+
+    def search(self, source, destination):
+        with self._lock:
+            source_ids = set()
+            for station in self.resolve(source):
+                source_ids |= self.by_source.get(station, set())
+            if not source_ids:
+                return []
+            route_ids = set()
+            for station in self.resolve(destination):
+                route_ids |= source_ids & self.by_destination.get(station, set())
+            return [self.routes[route_id] for route_id in sorted(route_ids)]
+
+
+def get_route_index():
+    """Return this app's route index, rebuilt when the shared 'routes' version changes."""
+    index = current_app.extensions.get('route_index')
+    if index is None or index.versions.stale():
+        versions = VersionCheck(['routes'], current_app.config.get('SHARED_VERSION_CHECK_SECONDS', 2))
+        index = RouteIndex()
+        index.versions = versions
+        index.build(
+            RouteEntry(*row) for row in db.session.query(
+                Route.id, Route.route_name, Route.source, Route.destination,
+                Route.distance, Route.duration, Route.fare
+            )
+        )
+        current_app.extensions['route_index'] = index
+    return index
@@ -1,6 +1,9 @@
-from app import create_app
+from app import create_app, init_db
 
 app = create_app()
 
 if __name__ == '__main__':
+    # Development server: make sure the local database is ready
+    with app.app_context():
+        init_db(sample_data=True)
     app.run(debug=True)
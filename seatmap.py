@@ -0,0 +1,96 @@
+# app/seatmap.py
+
+class SeatMap:
+    """Seat x segment occupancy for one schedule, one int bitmask per segment.
+
+    Bit i of a segment's mask is set when seat i + 1 is taken on that leg.
+    A booking from stop a to stop b occupies segments a .. b-1, so seats
+    can be resold on the legs a passenger is not travelling.
+    """
+
+    def __init__(self, capacity, segments, masks=None):
+        self.capacity = capacity
+        self.segments = segments
+        self.full = (1 << capacity) - 1
+        self.masks = list(masks) if masks is not None else [0] * segments
+
+    @property
+    def row_bytes(self):
+        return (self.capacity + 7) // 8
+
+    @classmethod
+    def from_bytes(cls, capacity, segments, data):
+        size = (capacity + 7) // 8
+        masks = [int.from_bytes(data[i * size:(i + 1) * size], 'little') for i in range(segments)]
+        return cls(capacity, segments, masks)
+
+    def to_bytes(self):
+        return b''.join(mask.to_bytes(self.row_bytes, 'little') for mask in self.masks)
+
+    def _check_range(self, first, last):
+        if not 0 <= first <= last < self.segments:
+            raise ValueError(f'Invalid segment range {first}-{last}')
+
+    def occupied(self, first, last):
+        """Mask of seats taken on any segment in first..last (inclusive)."""
+        self._check_range(first, last)
+        mask = 0
+        for segment in range(first, last + 1):
+            mask |= self.masks[segment]
+        return mask
+
+    def free_count(self, first=0, last=None):
+        last = self.segments - 1 if last is None else last
+        return self.capacity - bin(self.occupied(first, last)).count('1')
+
+    def find_free(self, count, first, last, adjacent=True):
+        """Seat numbers for `count` seats free on every segment in range, or None.
+
+        With adjacent=True only a run of consecutive seat numbers is
+        returned; otherwise the lowest free seats are used.
+        """
+        if count <= 0 or count > self.capacity:
+            return None
+        free = ~self.occupied(first, last) & self.full
+        if adjacent:
+            runs = _run_starts(free, count)
+            if not runs:
+                return None
+            start = (runs & -runs).bit_length() - 1
+            return list(range(start + 1, start + count + 1))
+        seats = []
+        while free and len(seats) < count:
+            low = free & -free
+            seats.append(low.bit_length())
+            free ^= low
+        return seats if len(seats) == count else None
+
+    def allocate(self, seats, first, last):
+        mask = _seat_mask(seats)
+        if self.occupied(first, last) & mask:
+            raise ValueError('Seat already taken')
+        for segment in range(first, last + 1):
+            self.masks[segment] |= mask
+
+    def release(self, seats, first, last):
+        self._check_range(first, last)
+        mask = _seat_mask(seats)
+        for segment in range(first, last + 1):
+            self.masks[segment] &= ~mask
+
+
+def _seat_mask(seats):
+    mask = 0
+    for seat in seats:
+        mask |= 1 << (seat - 1)
+    return mask
+
+
+def _run_starts(mask, length):
+    """Bits i of the result are set where bits i .. i+length-1 of mask all are."""
+    span = 1
+    while span < length:
+        step = min(span, length - span)
+        mask &= mask >> step
+        span += step
+    return mask
@@ -0,0 +1,243 @@
+# app/stats.py
+
+import threading
+from datetime import date, datetime, timedelta
+
+import click
+from flask import current_app, has_app_context
+from flask.cli import with_appcontext
+from sqlalchemy import case, event, func, insert, select, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session, object_session
+from app.cache import LRUCache
+from app.models.models import db, Route, Vehicle, Booking, VoiceCommand, DailyActivity
+
+_MISSING = object()
+
+
+class StatsCache:
+    """Small TTL cache for dashboard counters, cleared on relevant commits.
+
+    Per-user counters are kept least-recently-used up to `maxsize`.
+    """
+
+    def __init__(self, ttl, maxsize=10000):
+        self._lock = threading.Lock()
+        self._entries = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._generation = 0
+
+    def get(self, key, compute):
+        value = self._entries.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        generation = self._generation
+        value = compute()
+        with self._lock:
+            # Don't store a value computed before a concurrent invalidation
+            if generation == self._generation:
+                self._entries.set(key, value)
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+def get_stats_cache():
+    cache = current_app.extensions.get('stats_cache')
+    if cache is None:
+        cache = current_app.extensions['stats_cache'] = StatsCache(
+            current_app.config.get('DASHBOARD_STATS_TTL', 30),
+            maxsize=current_app.config.get('DASHBOARD_STATS_SIZE', 10000)
+        )
+    return cache
+
+
+def _count(model, *criteria):
+    query = select(func.count()).select_from(model)
+    if criteria:
+        query = query.where(*criteria)
+    return query.scalar_subquery()
+
+
+def _global_stats():
+    row = db.session.execute(select(
+        _count(Route).label('total_routes'),
+        _count(Vehicle).label('total_vehicles'),
+        _count(Booking).label('total_bookings'),
+        _count(Vehicle, Vehicle.status == 'Available').label('available_vehicles'),
+    )).one()
+    return dict(row._mapping)
+
+
+def dashboard_stats(user_id):
+    cache = get_stats_cache()
+    stats = dict(cache.get('global', _global_stats))
+    stats['my_bookings'] = cache.get(
+        ('user', user_id),
+        lambda: db.session.scalar(select(func.count()).select_from(Booking).where(Booking.user_id == user_id))
+    )
+    return stats
+
+
+@event.listens_for(Route, 'after_insert')
+@event.listens_for(Route, 'after_delete')
+@event.listens_for(Vehicle, 'after_insert')
+@event.listens_for(Vehicle, 'after_update')
+@event.listens_for(Vehicle, 'after_delete')
+@event.listens_for(Booking, 'after_insert')
+@event.listens_for(Booking, 'after_delete')
+def _mark_stats_dirty(mapper, connection, target):
+    object_session(target).info['stats_dirty'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_stats(session):
+    if session.info.pop('stats_dirty', False) and has_app_context():
+        cache = current_app.extensions.get('stats_cache')
+        if cache is not None:
+            cache.invalidate()
+
+
+# Daily activity rollups for /api/stats
+
+def _rollup_enabled():
+    return has_app_context() and current_app.config.get('STATS_ROLLUP', False)
+
+
+def _bump_daily_activity(connection, user_id, day, column, amount=1):
+    table = DailyActivity.__table__
+    values = {'user_id': user_id, 'day': day, 'bookings': 0, 'voice_commands': 0}
+    values[column] = amount
+    increment = {column: table.c[column] + amount}
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        module = sqlite if dialect == 'sqlite' else postgresql
+        stmt = module.insert(table).values(values).on_conflict_do_update(
+            index_elements=['user_id', 'day'], set_=increment
+        )
+        connection.execute(stmt)
+    elif dialect in ('mysql', 'mariadb'):
+        connection.execute(mysql.insert(table).values(values).on_duplicate_key_update(increment))
+    else:
+        result = connection.execute(
+            update(table).where(table.c.user_id == user_id, table.c.day == day).values(increment)
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(values))
+
+
+@event.listens_for(Booking, 'after_insert')
+def _rollup_booking(mapper, connection, target):
+    if _rollup_enabled():
+        _bump_daily_activity(connection, target.user_id, target.booking_time.date(), 'bookings')
+
+
+@event.listens_for(VoiceCommand, 'after_insert')
+def _rollup_voice_command(mapper, connection, target):
+    if target.user_id is not None and _rollup_enabled():
+        _bump_daily_activity(connection, target.user_id, target.timestamp.date(), 'voice_commands')
+
+
+def rollup_voice_commands(records):
+    """Bump the rollups for voice commands written with a bulk insert.
+
+    Bulk inserts skip the after_insert hook above, so callers pass the
+    inserted rows here inside the same transaction.
+    """
+    if not _rollup_enabled():
+        return
+    counts = {}
+    for record in records:
+        if record['user_id'] is not None:
+            key = (record['user_id'], record['timestamp'].date())
+            counts[key] = counts.get(key, 0) + 1
+    connection = db.session.connection()
+    for (user_id, day), amount in counts.items():
+        _bump_daily_activity(connection, user_id, day, 'voice_commands', amount)
+
+
+def rebuild_daily_activity():
+    """Recompute the rollup table from the booking and voice command history."""
+    db.session.execute(DailyActivity.__table__.delete())
+    counts = {}
+    for model, column, timestamp in ((Booking, 'bookings', Booking.booking_time),
+                                     (VoiceCommand, 'voice_commands', VoiceCommand.timestamp)):
+        day = func.date(timestamp)
+        rows = db.session.execute(
+            select(model.user_id, day, func.count())
+            .where(model.user_id.isnot(None))
+            .group_by(model.user_id, day)
+        )
+        for user_id, day_value, count in rows:
+            key = (user_id, _as_date(day_value))
+            counts.setdefault(key, {'bookings': 0, 'voice_commands': 0})[column] = count
+    if counts:
+        db.session.execute(insert(DailyActivity), [
+            dict(user_id=user_id, day=day, **values) for (user_id, day), values in counts.items()
+        ])
+    db.session.commit()
+    return len(counts)
+
+
+@click.command('rebuild-rollups')
+@with_appcontext
+def rebuild_rollups_command():
+    """Rebuild the per-user daily activity rollups."""
+    click.echo(f'Rebuilt {rebuild_daily_activity()} daily activity rows')
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def activity_stats(user_id, days=7):
+    """Per-day booking counts and voice totals for the last `days` days.
+
+    Reads the rollup table when STATS_ROLLUP is on, otherwise issues one
+    grouped query per source table.
+    """
+    today = datetime.now().date()
+    first_day = today - timedelta(days=days - 1)
+    per_day = {}
+    if current_app.config.get('STATS_ROLLUP', False):
+        rows = db.session.execute(
+            select(DailyActivity.day, DailyActivity.bookings, DailyActivity.voice_commands)
+            .where(DailyActivity.user_id == user_id, DailyActivity.day >= first_day)
+        )
+        voice_today = 0
+        for day_value, bookings, voice_commands in rows:
+            per_day[day_value] = bookings
+            if day_value == today:
+                voice_today = voice_commands
+        voice_total = db.session.scalar(
+            select(func.coalesce(func.sum(DailyActivity.voice_commands), 0))
+            .where(DailyActivity.user_id == user_id)
+        )
+    else:
+        day = func.date(Booking.booking_time)
+        rows = db.session.execute(
+            select(day, func.count())
+            .where(Booking.user_id == user_id,
+                   Booking.booking_time >= datetime.combine(first_day, datetime.min.time()))
+            .group_by(day)
+        )
+        per_day = {_as_date(day_value): count for day_value, count in rows}
+        voice_total, voice_today = db.session.execute(
+            select(func.count(), func.coalesce(func.sum(case(
+                (VoiceCommand.timestamp >= datetime.combine(today, datetime.min.time()), 1), else_=0
+            )), 0)).where(VoiceCommand.user_id == user_id)
+        ).one()
+    return {
+        'daily_bookings': [
+            {'date': (first_day + timedelta(days=i)).strftime('%Y-%m-%d'),
+             'count': per_day.get(first_day + timedelta(days=i), 0)}
+            for i in range(days)
+        ],
+        'voice_stats': {'total': voice_total, 'today': voice_today}
+    }
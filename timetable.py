@@ -0,0 +1,174 @@
+# app/timetable.py
+
+import bisect
+from collections import defaultdict, namedtuple
+from datetime import datetime, time, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import insert
+from app.models.models import db, Route, Vehicle, Schedule
+from app.pagecache import touch
+
+Conflict = namedtuple('Conflict', 'route_id vehicle_id departure_time arrival_time')
+
+PATTERNS = {
+    'daily': frozenset(range(7)),
+    'weekdays': frozenset(range(5)),
+    'weekends': frozenset((5, 6)),
+}
+
+
+class RecurrenceRule:
+    """Departure times repeated on the days a pattern selects."""
+
+    def __init__(self, times, pattern='daily'):
+        if isinstance(pattern, str):
+            if pattern not in PATTERNS:
+                raise ValueError(f'Unknown recurrence pattern: {pattern}')
+            pattern = PATTERNS[pattern]
+        self.weekdays = frozenset(pattern)
+        self.times = sorted(times)
+
+    def expand(self, start_date, days):
+        for offset in range(days):
+            day = start_date + timedelta(days=offset)
+            if day.weekday() in self.weekdays:
+                for departure in self.times:
+                    yield datetime.combine(day, departure)
+
+
+class VehicleIntervals:
+    """Per-vehicle sorted trip intervals for overlap checks by bisection."""
+
+    def __init__(self):
+        self._starts = defaultdict(list)
+        self._ends = defaultdict(list)
+        self._longest = defaultdict(timedelta)
+
+    def add(self, vehicle_id, start, end):
+        i = bisect.bisect_right(self._starts[vehicle_id], start)
+        self._starts[vehicle_id].insert(i, start)
+        self._ends[vehicle_id].insert(i, end)
+        self._longest[vehicle_id] = max(self._longest[vehicle_id], end - start)
+
+    def remove(self, vehicle_id, start, end):
+        starts, ends = self._starts[vehicle_id], self._ends[vehicle_id]
+        i = bisect.bisect_left(starts, start)
+        while i < len(starts) and starts[i] == start:
+            if ends[i] == end:
+                del starts[i], ends[i]
+                return
+            i += 1
+
+    def overlaps(self, vehicle_id, start, end):
+        starts, ends = self._starts[vehicle_id], self._ends[vehicle_id]
+        # Only intervals starting before `end` and no earlier than start - longest can overlap
+        earliest = start - self._longest[vehicle_id]
+        i = bisect.bisect_left(starts, end) - 1
+        while i >= 0 and starts[i] >= earliest:
+            if ends[i] > start:
+                return True
+            i -= 1
+        return False
+
+
+def load_vehicle_intervals(vehicle_ids, window_start, window_end, turnaround):
+    intervals = VehicleIntervals()
+    rows = db.session.query(Schedule.vehicle_id, Schedule.departure_time, Schedule.arrival_time).filter(
+        Schedule.vehicle_id.in_(vehicle_ids),
+        Schedule.status == 'Scheduled',
+        Schedule.departure_time < window_end,
+        Schedule.arrival_time > window_start - turnaround
+    )
+    for vehicle_id, departure, arrival in rows:
+        intervals.add(vehicle_id, departure, arrival + turnaround)
+    return intervals
+
+
+def vehicle_conflict(vehicle_id, departure_time, arrival_time, turnaround=None):
+    """Return an existing trip that overlaps the given one on the same vehicle."""
+    if turnaround is None:
+        turnaround = timedelta(minutes=current_app.config.get('MIN_TURNAROUND_MINUTES', 30))
+    return Schedule.query.filter(
+        Schedule.vehicle_id == vehicle_id,
+        Schedule.status == 'Scheduled',
+        Schedule.departure_time < arrival_time + turnaround,
+        Schedule.arrival_time > departure_time - turnaround
+    ).first()
+
+
+def generate_timetable(assignments, start_date, days, turnaround=None, batch_size=1000):
+    """Expand (route, vehicle, rule) assignments into schedules and bulk insert them.
+
+    Trips that would overlap another trip of the same vehicle, existing or
+    generated earlier in this run, are skipped and returned as conflicts.
+    Returns (number of schedules created, list of Conflict).
+    """
+    if turnaround is None:
+        turnaround = timedelta(minutes=current_app.config.get('MIN_TURNAROUND_MINUTES', 30))
+    window_start = datetime.combine(start_date, time.min)
+    window_end = window_start + timedelta(days=days + 1)
+    intervals = load_vehicle_intervals({vehicle.id for _, vehicle, _ in assignments},
+                                       window_start, window_end, turnaround)
+    conflicts = []
+    batch = []
+    created = 0
+    for route, vehicle, rule in assignments:
+        duration = timedelta(minutes=route.duration)
+        for departure in rule.expand(start_date, days):
+            arrival = departure + duration
+            if intervals.overlaps(vehicle.id, departure, arrival + turnaround):
+                conflicts.append(Conflict(route.id, vehicle.id, departure, arrival))
+                continue
+            intervals.add(vehicle.id, departure, arrival + turnaround)
+            batch.append(dict(
+                vehicle_id=vehicle.id,
+                route_id=route.id,
+                departure_time=departure,
+                arrival_time=arrival,
+                available_seats=vehicle.capacity,
+                status='Scheduled'
+            ))
+            if len(batch) >= batch_size:
+                db.session.execute(insert(Schedule), batch)
+                created += len(batch)
+                batch = []
+    if batch:
+        db.session.execute(insert(Schedule), batch)
+        created += len(batch)
+    if created:
+        touch(db.session, 'schedules', *{f'route:{route.id}' for route, _, _ in assignments})
+    db.session.commit()
+    return created, conflicts
+
+
+def _parse_times(value):
+    return [datetime.strptime(t.strip(), '%H:%M').time() for t in value.split(',') if t.strip()]
+
+
+@click.command('generate-timetable')
+@click.option('--pair', 'pairs', multiple=True, required=True, help='ROUTE_ID:VEHICLE_ID, repeatable')
+@click.option('--times', required=True, help='Comma separated departure times, e.g. 06:00,14:30')
+@click.option('--pattern', type=click.Choice(sorted(PATTERNS)), default='daily')
+@click.option('--days', type=int, default=30)
+@click.option('--start', 'start_date', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='First service day (default: tomorrow)')
+@with_appcontext
+def generate_timetable_command(pairs, times, pattern, days, start_date):
+    """Generate recurring schedules for route/vehicle pairs."""
+    rule = RecurrenceRule(_parse_times(times), pattern)
+    assignments = []
+    for pair in pairs:
+        route_id, vehicle_id = (int(part) for part in pair.split(':'))
+        route, vehicle = db.session.get(Route, route_id), db.session.get(Vehicle, vehicle_id)
+        if route is None or vehicle is None:
+            raise click.BadParameter(f'Unknown route or vehicle in {pair}')
+        assignments.append((route, vehicle, rule))
+    start = start_date.date() if start_date else datetime.now().date() + timedelta(days=1)
+    created, conflicts = generate_timetable(assignments, start, days)
+    click.echo(f'Created {created} schedules, skipped {len(conflicts)} conflicting trips')
+    for conflict in conflicts[:20]:
+        click.echo(f'  vehicle {conflict.vehicle_id} busy at {conflict.departure_time:%Y-%m-%d %H:%M} '
+                   f'(route {conflict.route_id})')
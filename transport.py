@@ -1,29 +1,32 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app, abort
 from flask_login import login_required, current_user
-from app.models.models import db, Route, Vehicle, Schedule, Booking
+from app.models.models import db, Route, RouteStop, Vehicle, Schedule, Booking
+from app.booking import BookingError, IdempotencyKeyReused, SoldOutError, book_once, booking_result, \
+    confirm_booking, next_booking_reference, reserve_seats, release_booking
+from app.route_index import get_route_index
+from app.journey import get_journey_planner, invalidate_journey_planner
+from app.stats import dashboard_stats
+from app.queries import user_bookings, schedules_with_details
+from app.pagination import InvalidCursor, keyset_page
+from app.timetable import vehicle_conflict
+from app.database import read_replica
+from app.pagecache import cached_fragment, conditional
+from app.live import live_response
 from datetime import datetime, timedelta
-import random
-import string
+from markupsafe import Markup
+from sqlalchemy.orm import joinedload, selectinload
 
 transport_bp = Blueprint('transport', __name__, url_prefix='/transport')
 
-def generate_booking_reference():
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-
 # Dashboard with stats
 @transport_bp.route('/')
 @login_required
 def dashboard():
-    routes = Route.query.all()
-    vehicles = Vehicle.query.all()
-    recent_bookings = Booking.query.filter_by(user_id=current_user.id).order_by(Booking.booking_time.desc()).limit(5).all()
-    stats = {
-        'total_routes': Route.query.count(),
-        'total_vehicles': Vehicle.query.count(),
-        'total_bookings': Booking.query.count(),
-        'my_bookings': Booking.query.filter_by(user_id=current_user.id).count(),
-        'available_vehicles': Vehicle.query.filter_by(status="Available").count()
-    }
+    limit = current_app.config.get('DASHBOARD_LIST_SIZE', 5)
+    routes = Route.query.order_by(Route.id).limit(limit).all()
+    vehicles = Vehicle.query.order_by(Vehicle.id).limit(limit).all()
+    recent_bookings = user_bookings(current_user.id).limit(5).all()
+    stats = dashboard_stats(current_user.id)
     return render_template(
         'transport/dashboard.html',
         routes=routes,
@@ -35,36 +38,91 @@ def dashboard():
 # List all routes
 @transport_bp.route('/routes')
 @login_required
+@read_replica
+@conditional('routes')
 def routes():
-    routes = Route.query.all()
-    return render_template('transport/routes.html', routes=routes)
+    route_list = cached_fragment('route_list', ['routes'], lambda: Markup(render_template(
+        'transport/route_list.html', routes=Route.query.options(selectinload(Route.stops)).order_by(Route.id).all()
+    )))
+    return render_template('transport/routes.html', route_list=route_list)
 
 # Route search
 @transport_bp.route('/search', methods=['GET', 'POST'])
 @login_required
+@read_replica
+@conditional()
 def search_routes():
-    routes = []
+    results = None
     if request.method == 'POST':
         source = request.form.get('source', '').strip()
         destination = request.form.get('destination', '').strip()
         if source and destination:
-            routes = Route.query.filter(
-                Route.source.ilike(f'%{source}%'),
-                Route.destination.ilike(f'%{destination}%')
-            ).all()
-            if not routes:
+            found, results = _render_search(source, destination)
+            if not found:
                 flash(f'No routes found from {source} to {destination}')
         else:
             flash('Please enter both source and destination')
-    return render_template('transport/search.html', routes=routes)
+    return render_template('transport/search.html', results=results)
+
+def _render_search(source, destination):
+    index = get_route_index()
+    routes = index.search(source, destination)
+    journeys = get_journey_planner().plan(index.resolve(source), index.resolve(destination))
+    return bool(routes or journeys), Markup(render_template('transport/search_results.html',
+                                                            routes=routes, journeys=journeys))
 
 # Timetable for a route
 @transport_bp.route('/schedule/<int:route_id>')
 @login_required
+@read_replica
+@conditional('route:{route_id}', 'seats:{route_id}')
 def view_schedule(route_id):
+    route_name, timetable = cached_fragment('timetable', [f'route:{route_id}', f'seats:{route_id}'],
+                                            lambda: _render_timetable(route_id),
+                                            request.args.get('cursor'), _page_size())
+    return render_template('transport/schedule.html', route_name=route_name, timetable=timetable)
+
+def _render_timetable(route_id):
     route = Route.query.get_or_404(route_id)
-    schedules = Schedule.query.filter_by(route_id=route_id, status='Scheduled').order_by(Schedule.departure_time).all()
-    return render_template('transport/schedule.html', route=route, schedules=schedules)
+    schedules, next_cursor = _schedule_page(route_id)
+    return route.route_name, Markup(render_template('transport/timetable.html', route=route,
+                                                    schedules=schedules, next_cursor=next_cursor))
+
+@transport_bp.route('/api/schedule/<int:route_id>')
+@login_required
+@read_replica
+@conditional('route:{route_id}', 'seats:{route_id}')
+def api_schedule(route_id):
+    Route.query.get_or_404(route_id)
+    schedules, next_cursor = _schedule_page(route_id)
+    return jsonify({
+        'items': [{
+            'id': s.id,
+            'vehicle_number': s.vehicle.vehicle_number,
+            'departure_time': s.departure_time.isoformat(),
+            'arrival_time': s.arrival_time.isoformat(),
+            'available_seats': s.available_seats,
+            'status': s.status
+        } for s in schedules],
+        'next_cursor': next_cursor
+    })
+
+def _page_size():
+    return max(1, min(request.args.get('limit', current_app.config.get('PAGE_SIZE', 20), type=int), 100))
+
+def _schedule_page(route_id):
+    query = schedules_with_details().filter_by(route_id=route_id, status='Scheduled')
+    try:
+        return keyset_page(query, Schedule.departure_time, Schedule.id,
+                           request.args.get('cursor'), _page_size(), descending=False)
+    except InvalidCursor as e:
+        abort(400, str(e))
+
+# Live seat and schedule deltas (server-sent events), for ?route_id=... or all routes
+@transport_bp.route('/live')
+@login_required
+def live_feed():
+    return live_response(request.args.getlist('route_id', type=int), request.headers.get('Last-Event-ID'))
 
 # Book a ticket
 @transport_bp.route('/book/<int:schedule_id>', methods=['GET', 'POST'])
@@ -73,54 +131,101 @@ def book_ticket(schedule_id):
     schedule = Schedule.query.get_or_404(schedule_id)
     if request.method == 'POST':
         seats = int(request.form.get('seats', 1))
-        if seats <= 0:
-            flash('Invalid number of seats')
-            return redirect(url_for('transport.book_ticket', schedule_id=schedule_id))
-        if seats > schedule.available_seats:
-            flash(f'Only {schedule.available_seats} seats available')
+        try:
+            booking = reserve_seats(schedule, current_user.id, seats, next_booking_reference(),
+                                    from_stop=request.form.get('from_stop', type=int),
+                                    to_stop=request.form.get('to_stop', type=int))
+        except BookingError as e:
+            flash(str(e))
             return redirect(url_for('transport.book_ticket', schedule_id=schedule_id))
-        total_fare = schedule.route.fare * seats
-        booking = Booking(
-            user_id=current_user.id,
-            schedule_id=schedule_id,
-            seats_booked=seats,
-            total_fare=total_fare,
-            status='Confirmed',
-            booking_reference=generate_booking_reference()
-        )
-        schedule.available_seats -= seats
-        db.session.add(booking)
-        db.session.commit()
         flash(f'Ticket booked successfully! Reference: {booking.booking_reference}')
         return redirect(url_for('transport.booking_details', booking_id=booking.id))
     return render_template('transport/book.html', schedule=schedule)
 
+@transport_bp.route('/api/book/<int:schedule_id>', methods=['POST'])
+@login_required
+def api_book_ticket(schedule_id):
+    """JSON booking endpoint; retries carrying the same Idempotency-Key never book twice"""
+    schedule = Schedule.query.get_or_404(schedule_id)
+    data = request.get_json(silent=True) or request.form
+    key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+    try:
+        seats = int(data.get('seats', 1))
+        from_stop, to_stop = (None if data.get(name) in (None, '') else int(data[name])
+                              for name in ('from_stop', 'to_stop'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'Invalid number of seats or stops'}), 400
+    if key is not None and not 0 < len(key) <= 64:
+        return jsonify({'success': False, 'error': 'Idempotency key must be 1-64 characters'}), 400
+    try:
+        if key is None:
+            booking = reserve_seats(schedule, current_user.id, seats, next_booking_reference(),
+                                    from_stop=from_stop, to_stop=to_stop)
+            status, result, replayed = 201, booking_result(booking), False
+        else:
+            status, result, replayed = book_once(schedule, current_user.id, seats, key,
+                                                 from_stop=from_stop, to_stop=to_stop)
+    except SoldOutError as e:
+        return jsonify({'success': False, 'error': str(e), 'available': e.available}), 409
+    except IdempotencyKeyReused as e:
+        return jsonify({'success': False, 'error': str(e)}), 422
+    except BookingError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    response = jsonify(dict(result, booking_url=url_for('transport.booking_details',
+                                                        booking_id=result['booking_id'])))
+    response.status_code = status
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
 # Booking details
 @transport_bp.route('/booking/<int:booking_id>')
 @login_required
 def booking_details(booking_id):
-    booking = Booking.query.filter_by(id=booking_id, user_id=current_user.id).first_or_404()
+    booking = user_bookings(current_user.id).options(joinedload(Booking.allocation)) \
+        .filter(Booking.id == booking_id).first_or_404()
     return render_template('transport/booking_details.html', booking=booking)
 
 # My Bookings
 @transport_bp.route('/my-bookings')
 @login_required
 def my_bookings():
-    bookings = Booking.query.filter_by(user_id=current_user.id).order_by(Booking.booking_time.desc()).all()
-    return render_template('transport/my_bookings.html', bookings=bookings)
+    bookings, next_cursor = _booking_page()
+    return render_template('transport/my_bookings.html', bookings=bookings, next_cursor=next_cursor)
+
+@transport_bp.route('/api/bookings')
+@login_required
+def api_bookings():
+    bookings, next_cursor = _booking_page()
+    return jsonify({
+        'items': [{
+            'id': b.id,
+            'booking_reference': b.booking_reference,
+            'route_name': b.schedule.route.route_name,
+            'schedule_id': b.schedule_id,
+            'seats_booked': b.seats_booked,
+            'total_fare': b.total_fare,
+            'status': b.status,
+            'booking_time': b.booking_time.isoformat()
+        } for b in bookings],
+        'next_cursor': next_cursor
+    })
+
+def _booking_page():
+    try:
+        return keyset_page(user_bookings(current_user.id), Booking.booking_time, Booking.id,
+                           request.args.get('cursor'), _page_size())
+    except InvalidCursor as e:
+        abort(400, str(e))
 
 # Cancel Booking
 @transport_bp.route('/cancel-booking/<int:booking_id>', methods=['POST'])
 @login_required
 def cancel_booking(booking_id):
     booking = Booking.query.filter_by(id=booking_id, user_id=current_user.id).first_or_404()
-    if booking.status == 'Cancelled':
-        flash('Booking is already cancelled')
+    if booking.status in ('Cancelled', 'Expired') or not release_booking(booking):
+        flash(f'Booking is already {booking.status.lower()}')
         return redirect(url_for('transport.my_bookings'))
-    booking.status = 'Cancelled'
-    schedule = Schedule.query.get(booking.schedule_id)
-    schedule.available_seats += booking.seats_booked
-    db.session.commit()
     flash('Booking cancelled successfully')
     return redirect(url_for('transport.my_bookings'))
 
@@ -138,8 +243,12 @@ def add_route():
             duration=int(request.form['duration']),
             fare=float(request.form['fare'])
         )
+        # Optional comma-separated intermediate stops, in travel order
+        stations = [name.strip() for name in request.form.get('stops', '').split(',') if name.strip()]
+        route.stops = [RouteStop(position=n, station=name) for n, name in enumerate(stations)]
         db.session.add(route)
         db.session.commit()
+        get_route_index().add(route)
         flash('Route added successfully')
         return redirect(url_for('transport.routes'))
     return render_template('transport/add_route.html')
@@ -168,6 +277,11 @@ def add_schedule():
         route = Route.query.get(request.form['route_id'])
         vehicle = Vehicle.query.get(request.form['vehicle_id'])
         arrival_time = departure_time + timedelta(minutes=route.duration)
+        conflict = vehicle_conflict(vehicle.id, departure_time, arrival_time)
+        if conflict:
+            flash(f'Vehicle {vehicle.vehicle_number} is already on a trip departing '
+                  f'{conflict.departure_time.strftime("%Y-%m-%d %H:%M")}')
+            return redirect(url_for('transport.add_schedule'))
         schedule = Schedule(
             vehicle_id=vehicle.id,
             route_id=route.id,
@@ -178,6 +292,7 @@ def add_schedule():
         )
         db.session.add(schedule)
         db.session.commit()
+        invalidate_journey_planner()
         flash('Schedule added successfully')
         return redirect(url_for('transport.dashboard'))
     vehicles = Vehicle.query.filter_by(status='Available').all()
@@ -189,8 +304,11 @@ def pay_booking(booking_id):
     booking = Booking.query.filter_by(id=booking_id, user_id=current_user.id).first_or_404()
     if request.method == 'POST':
         # Simulate a payment success for demo
-        booking.status = "Paid"
-        db.session.commit()
-        flash("Payment successful! Booking confirmed.", "success")
+        try:
+            paid = confirm_booking(booking)
+        except BookingError as e:
+            flash(str(e))
+            return redirect(url_for('transport.booking_details', booking_id=booking_id))
+        flash("Payment successful! Booking confirmed." if paid else "Booking is already paid.", "success")
         return redirect(url_for('transport.booking_details', booking_id=booking_id))
     return render_template('transport/payment.html', booking=booking)
@@ -0,0 +1,187 @@
+# app/tts.py
+
+import hashlib
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from flask import current_app
+from app.metrics import observe_voice_stage
+
+if os.name == 'nt':
+    import msvcrt
+
+    def _lock(f):
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+    def _unlock(f):
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _lock(f):
+        fcntl.flock(f, fcntl.LOCK_EX)
+
+    def _unlock(f):
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextmanager
+def _locked(path):
+    """Hold an exclusive lock on the file at `path`, shared with other processes."""
+    with open(path, 'a+b') as f:
+        f.seek(0)
+        _lock(f)
+        try:
+            yield
+        finally:
+            f.seek(0)
+            _unlock(f)
+
+
+class TTSWorker:
+    """Single thread that owns the pyttsx3 engine and renders speech to files.
+
+    Rendered audio is cached in the audio folder under a hash of the text
+    and voice settings, with least-recently-used files evicted once the
+    folder grows past max_bytes. Every worker shares the folder, so it is
+    the only record of what is cached: a hit bumps the file's mtime, and
+    eviction scans the folder under a lock file.
+    """
+
+    def __init__(self, folder, rate=150, volume=0.9, voice=None, max_bytes=100 * 1024 * 1024):
+        self.folder = os.path.abspath(folder)
+        self.rate = rate
+        self.volume = volume
+        self.voice = voice
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._queue = queue.Queue()
+        os.makedirs(self.folder, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='tts-worker', daemon=True)
+        self._thread.start()
+
+    def filename_for(self, text):
+        key = f'{self.rate}|{self.volume}|{self.voice}|{text}'
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32] + '.wav'
+
+    def render(self, text):
+        """Return a Future resolving to the cached file name for `text`."""
+        name = self.filename_for(text)
+        with self._lock:
+            try:
+                # Also marks the file recently used for every worker's eviction
+                os.utime(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                pass
+            else:
+                self.hits += 1
+                future = Future()
+                future.set_result(name)
+                return future
+            future = self._pending.get(name)
+            if future is None:
+                self.misses += 1
+                future = self._pending[name] = Future()
+                self._queue.put((text, name, future))
+            return future
+
+    def _init_engine(self):
+        import pyttsx3
+
+        engine = pyttsx3.init()
+        engine.setProperty('rate', self.rate)
+        engine.setProperty('volume', self.volume)
+        if self.voice:
+            engine.setProperty('voice', self.voice)
+        return engine
+
+    def _run(self):
+        try:
+            engine, init_error = self._init_engine(), None
+        except Exception as e:
+            engine, init_error = None, e
+        while True:
+            text, name, future = self._queue.get()
+            path = os.path.join(self.folder, name)
+            try:
+                if engine is None:
+                    raise RuntimeError(f'TTS engine unavailable: {init_error}')
+                start = time.perf_counter()
+                engine.save_to_file(text, path + '.tmp')
+                engine.runAndWait()
+                observe_voice_stage('tts', time.perf_counter() - start)
+                os.replace(path + '.tmp', path)
+                self._evict()
+                future.set_result(name)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    self._pending.pop(name, None)
+
+    def _scan(self):
+        """(mtime, name, size) of the cached files, least recently used first."""
+        entries = []
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if not entry.name.endswith('.wav'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        return sorted(entries)
+
+    def _evict(self):
+        with _locked(os.path.join(self.folder, '.evict.lock')):
+            entries = self._scan()
+            total = sum(size for _, _, size in entries)
+            # Never the newest file, which was most likely just rendered
+            for _, name, size in entries[:-1]:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.folder, name))
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    # e.g. still open for a download on Windows; the next pass retries it
+                    continue
+                total -= size
+
+    def stats(self):
+        entries = self._scan()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'files': len(entries),
+            'bytes': sum(size for _, _, size in entries)
+        }
+
+
+_worker_lock = threading.Lock()
+
+
+def get_tts_worker():
+    worker = current_app.extensions.get('tts_worker')
+    if worker is None:
+        with _worker_lock:
+            worker = current_app.extensions.get('tts_worker')
+            if worker is None:
+                config = current_app.config
+                worker = current_app.extensions['tts_worker'] = TTSWorker(
+                    config.get('AUDIO_FOLDER', 'static/audio'),
+                    rate=config.get('TTS_RATE', 150),
+                    volume=config.get('TTS_VOLUME', 0.9),
+                    voice=config.get('TTS_VOICE'),
+                    max_bytes=config.get('TTS_CACHE_MAX_BYTES', 100 * 1024 * 1024),
+                )
+    return worker
@@ -1,77 +1,120 @@
 # app/routes/voice.py
 
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, current_app, send_from_directory, abort
 from flask_login import login_required, current_user
-import speech_recognition as sr
-import pyttsx3
-import threading
-from datetime import datetime
-from app.models.models import db, VoiceCommand, Route, Schedule
+import os
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime, time, timedelta
+from time import perf_counter
+from sqlalchemy import func
+from app.models.models import db, VoiceCommand, Schedule
+from app.route_index import get_route_index
+from app.journey import get_journey_planner
+from app.recognition import QueueFullError, RecognitionError, get_recognition_queue
+from app.tts import get_tts_worker
+from app.voicelog import get_voice_logger
+from app.intents import get_intent_parser
+from app.cache import LRUCache
+from app.queries import schedules_with_details
+from app.pagination import InvalidCursor, keyset_page
+from app.metrics import observe_voice_stage
+from app.database import read_replica
+from app.pagecache import content_versions
 
 voice_bp = Blueprint('voice', __name__, url_prefix='/voice')
 
 class VoiceAssistant:
-    def __init__(self):
-        self.recognizer = sr.Recognizer()
-        self.tts_engine = pyttsx3.init()
-        self.tts_engine.setProperty('rate', 150)
-        self.tts_engine.setProperty('volume', 0.9)
-
-    def listen_for_command(self, timeout=5):
-        try:
-            with sr.Microphone() as source:
-                self.recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                audio = self.recognizer.listen(source, timeout=timeout, phrase_time_limit=10)
-            command = self.recognizer.recognize_google(audio).lower()
-            return command
-        except sr.WaitTimeoutError:
-            return "Timeout: No speech detected"
-        except sr.UnknownValueError:
-            return "Could not understand audio"
-        except sr.RequestError as e:
-            return f"Speech recognition error: {e}"
-
     def speak_response(self, text):
-        try:
-            self.tts_engine.say(text)
-            self.tts_engine.runAndWait()
-        except Exception as e:
-            print(f"TTS Error: {e}")
+        """Render `text` to a cached audio file and return a Future for its name."""
+        return get_tts_worker().render(text)
+
+    def describe_connections(self, source, destination):
+        index = get_route_index()
+        journeys = get_journey_planner().plan(index.resolve(source), index.resolve(destination))
+        if not journeys:
+            return f"No routes found from {source} to {destination}"
+        response = f"No direct route from {source} to {destination}, but you can connect. "
+        for journey in journeys:
+            stops = ", then ".join(
+                f"{leg.route_name} at {leg.departure.strftime('%H:%M')}" for leg in journey.legs
+            )
+            response += (f"Take {stops}, arriving {journey.arrival.strftime('%d %b %H:%M')}, "
+                         f"total fare {journey.fare} ₹. ")
+        return response
 
     def process_transport_query(self, command):
+        parsed = get_intent_parser().parse(command)
+        # Read the versions before answering so a concurrent change can't be cached under them
+        versions = content_versions(self._version_keys(parsed))
+        key = tuple(sorted((k, v[0]) for k, v in versions.items())) + tuple(parsed[:-1])
+        cache = get_response_cache()
+        response = cache.get(key)
+        if response is None:
+            response = self.respond(parsed)
+            cache.set(key, response)
+        return response
+
+    def _version_keys(self, parsed):
+        """Shared content versions an answer to `parsed` depends on."""
+        keys = ['routes', 'schedules']
+        if parsed.intent == 'book' and parsed.source and parsed.destination:
+            # Seat changes only bump their schedule's version, summed per route here
+            keys += [f'seats:{route.id}' for route in get_route_index().search(parsed.source, parsed.destination)]
+        return keys
+
+    def _find_schedules(self, parsed, limit=3, min_seats=None):
+        query = schedules_with_details().filter(Schedule.status == 'Scheduled')
+        if parsed.source and parsed.destination:
+            route_ids = [route.id for route in get_route_index().search(parsed.source, parsed.destination)]
+            query = query.filter(Schedule.route_id.in_(route_ids))
+        if parsed.travel_date:
+            start = datetime.combine(parsed.travel_date, parsed.travel_time or time.min)
+            query = query.filter(Schedule.departure_time >= start,
+                                 Schedule.departure_time < datetime.combine(parsed.travel_date + timedelta(days=1), time.min))
+        elif parsed.travel_time or min_seats:
+            query = query.filter(Schedule.departure_time >= datetime.now())
+        if parsed.travel_time and not parsed.travel_date:
+            query = query.filter(func.time(Schedule.departure_time) >= parsed.travel_time.strftime('%H:%M:%S'))
+        if min_seats:
+            query = query.filter(Schedule.available_seats >= min_seats)
+        return query.order_by(Schedule.departure_time).limit(limit).all()
+
+    def respond(self, parsed):
         response = ""
-        # Basic NLP for demo
-        if "route" in command or "bus" in command or "train" in command:
-            if "from" in command and "to" in command:
-                try:
-                    parts = command.split("from")[1].split("to")
-                    source = parts[0].strip().title()
-                    destination = parts[1].strip().title()
-                except:
-                    source, destination = "", ""
-                routes = Route.query.filter(
-                    Route.source.contains(source),
-                    Route.destination.contains(destination)
-                ).all()
+        if parsed.intent == 'route':
+            if parsed.source and parsed.destination:
+                source, destination = parsed.source, parsed.destination
+                routes = get_route_index().search(source, destination)
                 if routes:
                     response = f"Found {len(routes)} routes from {source} to {destination}. "
                     for route in routes[:3]:
                         response += f"Route {route.route_name}, Distance: {route.distance} km, Duration: {route.duration} min, Fare: {route.fare} ₹. "
                 else:
-                    response = f"No routes found from {source} to {destination}"
+                    response = self.describe_connections(source, destination)
             else:
                 response = "Please specify source and destination using 'from' and 'to'"
-        elif "schedule" in command or "time" in command:
-            schedules = Schedule.query.filter_by(status='Scheduled').limit(3).all()
+        elif parsed.intent == 'schedule':
+            schedules = self._find_schedules(parsed)
             if schedules:
                 response = f"Found {len(schedules)} upcoming schedules. "
                 for schedule in schedules:
                     response += f"Vehicle {schedule.vehicle.vehicle_number} departing at {schedule.departure_time.strftime('%H:%M')} from {schedule.route.source} to {schedule.route.destination}. "
             else:
                 response = "No schedules available"
-        elif "book" in command or "ticket" in command:
-            response = "To book a ticket, please specify the route and preferred time. You can say 'book ticket from Mumbai to Delhi at 10 AM'"
-        elif "help" in command:
+        elif parsed.intent == 'book':
+            if parsed.source and parsed.destination:
+                seats = parsed.seats or 1
+                schedules = self._find_schedules(parsed, limit=1, min_seats=seats)
+                if schedules:
+                    schedule = schedules[0]
+                    response = (f"The next departure from {schedule.route.source} to {schedule.route.destination} "
+                                f"with {seats} seats free leaves at {schedule.departure_time.strftime('%d %b %H:%M')}, "
+                                f"fare {schedule.route.fare * seats} ₹. Open the booking page to confirm.")
+                else:
+                    response = f"No departures from {parsed.source} to {parsed.destination} have {seats} seats available"
+            else:
+                response = "To book a ticket, please specify the route and preferred time. You can say 'book ticket from Mumbai to Delhi at 10 AM'"
+        elif parsed.intent == 'help':
             response = ("I can help with routes, schedules, and booking tickets. "
                         "Try saying 'route from Mumbai to Delhi', 'show schedule', or 'book ticket'.")
         else:
@@ -80,6 +123,15 @@ class VoiceAssistant:
 
 voice_assistant = VoiceAssistant()
 
+def get_response_cache():
+    cache = current_app.extensions.get('voice_response_cache')
+    if cache is None:
+        cache = current_app.extensions['voice_response_cache'] = LRUCache(
+            maxsize=current_app.config.get('VOICE_CACHE_SIZE', 2048),
+            ttl=current_app.config.get('VOICE_CACHE_TTL', 60)
+        )
+    return cache
+
 @voice_bp.route('/')
 @login_required
 def voice_interface():
@@ -88,55 +140,125 @@ def voice_interface():
 @voice_bp.route('/listen', methods=['POST'])
 @login_required
 def listen_command():
+    audio = request.files.get('audio')
+    if audio is None:
+        return jsonify({'success': False, 'error': 'No audio uploaded'}), 400
+    try:
+        job = get_recognition_queue().submit(current_user.id, audio.read())
+    except QueueFullError as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    return jsonify({
+        'success': True,
+        'status': 'pending',
+        'job_id': job.id,
+        'poll_url': url_for('voice.listen_result', job_id=job.id)
+    }), 202
+
+@voice_bp.route('/listen/<job_id>')
+@login_required
+def listen_result(job_id):
+    queue = get_recognition_queue()
+    job = queue.get(job_id, current_user.id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown recognition job'}), 404
+    # finished_at is set by the future's done-callback, just after done() turns true
+    if job.finished_at is None:
+        return jsonify({'success': True, 'status': 'pending', 'job_id': job.id})
+    with job.lock:
+        if job.result is None:
+            job.result = _complete_job(job)
+    return jsonify(job.result)
+
+def _complete_job(job):
+    processing_time = job.finished_at - job.submitted_at
+    try:
+        command, recognition_time = job.future.result()
+    except RecognitionError as e:
+        return {'success': False, 'status': 'done', 'error': str(e), 'processing_time': processing_time}
+    except Exception as e:
+        return {'success': False, 'status': 'done', 'error': f'Speech recognition error: {e}',
+                'processing_time': processing_time}
+    observe_voice_stage('queue_wait', max(processing_time - recognition_time, 0.0))
+    observe_voice_stage('recognition', recognition_time)
+    start = perf_counter()
     try:
-        start_time = datetime.now()
-        command = voice_assistant.listen_for_command()
-        processing_time = (datetime.now() - start_time).total_seconds()
-        if command.startswith("Timeout") or command.startswith("Could not") or command.startswith("Speech recognition"):
-            return jsonify({
-                'success': False,
-                'error': command,
-                'processing_time': processing_time
-            })
         response = voice_assistant.process_transport_query(command)
-        voice_command = VoiceCommand(
-            user_id=current_user.id,
-            command_text=command,
-            response_text=response,
-            processing_time=processing_time
-        )
-        db.session.add(voice_command)
-        db.session.commit()
-        return jsonify({
-            'success': True,
-            'command': command,
-            'response': response,
-            'processing_time': processing_time
-        })
     except Exception as e:
-        return jsonify({
-            'success': False,
-            'error': str(e)
-        })
+        db.session.rollback()
+        return {'success': False, 'status': 'done', 'error': str(e)}
+    observe_voice_stage('answer', perf_counter() - start)
+    get_voice_logger().log(job.user_id, command, response, processing_time)
+    return {
+        'success': True,
+        'status': 'done',
+        'command': command,
+        'response': response,
+        'processing_time': processing_time
+    }
 
 @voice_bp.route('/speak', methods=['POST'])
 @login_required
 def speak_text():
-    try:
-        data = request.get_json()
-        text = data.get('text', '')
-        if text:
-            threading.Thread(target=voice_assistant.speak_response, args=(text,), daemon=True).start()
-            return jsonify({'success': True, 'message': 'Speaking...'})
+    data = request.get_json(silent=True) or {}
+    text = data.get('text', '')
+    if not text:
         return jsonify({'success': False, 'error': 'No text provided'})
+    future = voice_assistant.speak_response(text)
+    try:
+        name = future.result(timeout=current_app.config.get('TTS_WAIT_SECONDS', 5))
+    except FutureTimeout:
+        return jsonify({'success': True, 'status': 'pending',
+                        'audio_url': url_for('voice.audio_file', filename=get_tts_worker().filename_for(text))}), 202
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
+    return jsonify({'success': True, 'status': 'done', 'audio_url': url_for('voice.audio_file', filename=name)})
+
+@voice_bp.route('/audio/<path:filename>')
+@login_required
+def audio_file(filename):
+    folder = os.path.abspath(current_app.config.get('AUDIO_FOLDER', 'static/audio'))
+    return send_from_directory(folder, filename, mimetype='audio/wav', max_age=86400)
+
+@voice_bp.route('/cache-stats')
+@login_required
+def cache_stats():
+    stats = {'responses': get_response_cache().stats()}
+    if 'voice_logger' in current_app.extensions:
+        stats['log'] = current_app.extensions['voice_logger'].stats()
+    if 'tts_worker' in current_app.extensions:
+        stats['tts'] = current_app.extensions['tts_worker'].stats()
+    return jsonify(stats)
 
 @voice_bp.route('/history')
 @login_required
+@read_replica
 def command_history():
-    commands = VoiceCommand.query.filter_by(user_id=current_user.id).order_by(VoiceCommand.timestamp.desc()).limit(50).all()
-    return render_template('voice/history.html', commands=commands)
+    commands, next_cursor = _history_page()
+    return render_template('voice/history.html', commands=commands, next_cursor=next_cursor)
+
+@voice_bp.route('/api/history')
+@login_required
+@read_replica
+def api_history():
+    commands, next_cursor = _history_page()
+    return jsonify({
+        'items': [{
+            'id': c.id,
+            'command_text': c.command_text,
+            'response_text': c.response_text,
+            'timestamp': c.timestamp.isoformat(),
+            'processing_time': c.processing_time
+        } for c in commands],
+        'next_cursor': next_cursor
+    })
+
+def _history_page():
+    limit = max(1, min(request.args.get('limit', current_app.config.get('HISTORY_PAGE_SIZE', 50), type=int), 100))
+    try:
+        return keyset_page(VoiceCommand.query.filter_by(user_id=current_user.id),
+                           VoiceCommand.timestamp, VoiceCommand.id, request.args.get('cursor'), limit)
+    except InvalidCursor as e:
+        abort(400, str(e))
 
 @voice_bp.route('/test')
 @login_required
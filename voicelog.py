@@ -0,0 +1,153 @@
+# app/voicelog.py
+
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import insert
+from app.models.models import db, VoiceCommand
+from app.stats import rollup_voice_commands
+
+_STOP = object()
+
+
+class VoiceCommandLogger:
+    """Write-behind logger for VoiceCommand rows.
+
+    Records are queued in memory and written by one background thread in
+    bulk inserts of up to batch_size rows, or whatever has arrived once
+    flush_interval seconds pass. When the queue is full, log() waits up to
+    put_timeout seconds and then writes the record itself, so a slow
+    database slows callers down instead of losing rows. Pending rows are
+    flushed on close() and at interpreter exit.
+    """
+
+    def __init__(self, app, batch_size=100, flush_interval=1.0, max_pending=10000, put_timeout=0.5):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.logged = 0
+        self.flushes = 0
+        self.inline_writes = 0
+        self.errors = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='voice-command-logger', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, user_id, command_text, response_text, processing_time=None, status='Processed'):
+        record = {
+            'user_id': user_id,
+            'command_text': command_text,
+            'response_text': response_text,
+            'processing_time': processing_time,
+            'status': status,
+            'timestamp': datetime.utcnow(),
+        }
+        if self._closed:
+            self._write([record])
+            return
+        try:
+            self._queue.put(record, timeout=self.put_timeout)
+        except queue.Full:
+            self.inline_writes += 1
+            self._write([record])
+            return
+        # close() may have run since the check above, queueing this record
+        # behind _STOP where the thread never reaches it
+        if self._closed:
+            self._drain()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not _STOP and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            stop = batch[-1] is _STOP
+            records = [record for record in batch if record is not _STOP]
+            if records:
+                self._write(records)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, records):
+        with self.app.app_context():
+            try:
+                db.session.execute(insert(VoiceCommand), records)
+                rollup_voice_commands(records)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.errors += len(records)
+                self.app.logger.error('Dropped %d voice command log rows: %s', len(records), e)
+                return
+        self.logged += len(records)
+        self.flushes += 1
+
+    def flush(self):
+        """Block until everything queued so far has been written."""
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._drain()
+
+    def _drain(self):
+        """Write records left in the queue once the thread has stopped."""
+        self._thread.join()
+        records = []
+        while True:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._queue.task_done()
+            if record is not _STOP:
+                records.append(record)
+        if records:
+            self._write(records)
+
+    def stats(self):
+        return {
+            'logged': self.logged,
+            'pending': self._queue.qsize(),
+            'flushes': self.flushes,
+            'inline_writes': self.inline_writes,
+            'errors': self.errors,
+        }
+
+
+_logger_lock = threading.Lock()
+
+
+def get_voice_logger():
+    logger = current_app.extensions.get('voice_logger')
+    if logger is None:
+        with _logger_lock:
+            logger = current_app.extensions.get('voice_logger')
+            if logger is None:
+                config = current_app.config
+                logger = current_app.extensions['voice_logger'] = VoiceCommandLogger(
+                    current_app._get_current_object(),
+                    batch_size=config.get('VOICE_LOG_BATCH_SIZE', 100),
+                    flush_interval=config.get('VOICE_LOG_FLUSH_SECONDS', 1.0),
+                    max_pending=config.get('VOICE_LOG_MAX_PENDING', 10000),
+                )
+    return logger